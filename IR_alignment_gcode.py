@@ -5,9 +5,10 @@ quick manual:
 - press 'r' to reset position (and write position)
 - if offset is not calibrated, use 'WASD'+'q','e' keys to move the head untill the LED and photodiode look aligned (doesn't need to be 100% perfect)
 - press spacebar to start testing (can be paused with spacebar as well)
-- once it's done it will show a plot (matplotlib) and save to excel
+- once it's done it will show a plot (matplotlib, in a seperate window/process, so it never stalls the test) and save to excel
 - if it crashses, it will attempt to save the data it gathered so far to 'output.xlsx'
-- you can pause the testing and press 'v' to show a graph at any time
+- measurements start as soon as the printer confirms (M400) the head has arrived, the measured settle time is printed with each measurement
+- press 'v' to show a graph at any time (also during testing, it updates live)
 - press 'l' to disable steppers (if you're done, just to avoid overheating)
 - press 'k' to manually save to an excel file (can be done mid-test, but you should want to pause)
 - you can move the view with middle-mouse-button dragging, zoom by scrolling, turn off the grid with 'g' and change zoom mode (centered vs mouse-bound) with 'z'
@@ -25,22 +26,33 @@ required libraries:
 ## TODO:
 # - threading (only useful for the UI stuff)
 
-
-import numpy as np
+## NOTE: imports are lazy (on purpose): opening an .xlsx file for a quick look (or running headless) should not pay for libraries it doesn't use.
+##  every 'subsystem' imports what it needs itself:  serial -> initSerial() & __main__,  plotting -> plot5D(),  excel -> saveToExcel()/readFromExcel(),  rendering -> __main__
+##  (see startup_benchmark.py to check the startup time of the different paths)
+from __future__ import annotations # type-hints are not evaluated at runtime, so 'serial.Serial' type-hints don't require importing serial
 # from typing import Callable # just for type-hints to provide some nice syntax colering
 import time
 import datetime # just for generating output filenames automatically
+from typing import TYPE_CHECKING
+if(TYPE_CHECKING):
+    import serial # for printer commands AND for testing IR
 
-import serial # for printer commands AND for testing IR
-import serial.tools.list_ports # just for listing the available COM ports (debug)
-
-import gcode_struff as GC # (my own code) placed in a seperate file for legibility
+import gcode_struff as GC # (my own code) placed in a seperate file for legibility (doesn't import anything)
 
 SERIAL_TIMEOUT_DEFAULT = 0.010 # 10ms default serial timeout is a little low, but it makes no-response results faster to determine. (NOTE: baud rate assurance added later)
 ## NOTE: IMPORANT: changing any serial.Serial class parameters (such as baudrate or timeout) may result in some garbage data being transmitted (specifically on Arduinos using an Atmega16u2 as UART bridge!)
 
+badDataPattern:list[int] = [0 for i in range(256)] # mostly for debugging (how often each byte value went wrong in IRresponseTest())
+badDataPatternReverse:list[int] = [0 for i in range(256)] # same, for the RX->TX direction of IRresponseTestDuplex() (seperate, so the directions don't get mixed up)
+DUPLEX_REVERSE_PATTERN:int = 0xA5 # the RX->TX direction of IRresponseTestDuplex() sends every byte XOR this, so crosstalk/echo from the other direction doesn't count as good data
+
+MEASUREMENT_COLUMN_NAMES:list[str] = ['x [mm]', 'y [mm]', 'z [mm]', 'measurement (0~1)'] # (excel) column titles for regular [x,y,z,data] rows
+DUPLEX_COLUMN_NAMES:list[str] = ['x [mm]', 'y [mm]', 'z [mm]', 'TX->RX (0~1)', 'RX->TX (0~1)'] # column titles for IRresponseTestDuplex() rows
+THROUGHPUT_COLUMN_NAMES:list[str] = ['x [mm]', 'y [mm]', 'z [mm]', 'good bytes (0~1)', 'throughput [bytes/s]', 'bit error rate', 'error bursts', 'longest burst [bytes]', 'lost bytes', 'inserted bytes'] # column titles for IRthroughputTest() rows
+
 def initSerial(COMport:str, baud:int, timeout:float=SERIAL_TIMEOUT_DEFAULT) -> serial.Serial | None:
     """ attempt to connect to a serial port with a given name """
+    import serial # for printer commands AND for testing IR
     try:
         serialObj = serial.Serial()
         serialObj.baudrate = baud
@@ -98,15 +110,32 @@ def getCurrentPosition(serialObj:serial.Serial, timeout:float=0.5) -> tuple[bool
     return(GC.parseM114(readData.strip(GC.GCODE_MARLIN_OK).split(GC.GCODE_MARLIN_OK)[0])) # attempt to parse the data and return the results
 
 ## IR testing functions:
-def IRresponseTest(IR_TX_serial:serial.Serial, IR_RX_serial:serial.Serial|None=None) -> float:
-    """ test IR communication """
+def IRserialTimeout(baud:int) -> float:
+    """ the serial timeout to use for IR testing at a given baud rate """
+    return(SERIAL_TIMEOUT_DEFAULT + ((3*8)/baud) + (0.020 if (baud < 9600) else 0)) # if the baud rate is really low, increasing the timeout a litte might be wise
+def switchIRbaud(IR_RX_serial:serial.Serial, IR_TX_serial:serial.Serial, baud:int, firstBaud:int):
+    """ change the baud rate of the IR serial port(s) (in between tests) """
+    # time.sleep(0.1) # wait an extra 100ms before changing baud, to let the UART IC send any last data still in the buffer (commented out, as IRresponseTest() reads all data)
+    IR_RX_serial.baudrate = baud # will call _reconfigure_port() underwater (may result in unintended pulse, and therefore some garbage data)
+    # if(IR_TX_serial_port != IR_RX_serial_port): # extra check is nice, but not strictly needed
+    IR_TX_serial.baudrate = baud
+    if(IR_RX_serial.timeout > SERIAL_TIMEOUT_DEFAULT):
+        IR_RX_serial.timeout = SERIAL_TIMEOUT_DEFAULT + (0.015 if (firstBaud < 9600) else 0) #also update timeout (in case you can go faster as a result)
+    time.sleep(0.1) # wait 100ms, just for good measure
+    IR_RX_serial.flush()
+    # while(IR_RX_serial.in_waiting > 0):     IR_RX_serial.read() # manual flush
+def IRresponseTest(IR_TX_serial:serial.Serial, IR_RX_serial:serial.Serial|None=None, pattern:int=0x00, badDataCounters:list[int]|None=None) -> float:
+    """ test IR communication \n
+        every byte value (0~255) is sent XOR 'pattern' and checked against that. 'badDataCounters' (default: badDataPattern) counts the bad bytes per (sent) byte value """
+    if(badDataCounters is None):
+        badDataCounters = badDataPattern
     if(IR_RX_serial is None):
         IR_RX_serial = IR_TX_serial
     goodCounter:int = 0
     IR_RX_serial.flush() # library flush
     while(IR_RX_serial.in_waiting > 0): IR_RX_serial.read(IR_RX_serial.in_waiting); time.sleep(IR_RX_serial.timeout) # manual flush
     for i in range(256):
-        data:bytes = i.to_bytes(1,'big')
+        data:bytes = (i ^ pattern).to_bytes(1,'big')
         IR_TX_serial.write(data)
         readData:bytes = IR_RX_serial.read(1)
         if(readData == data):
@@ -115,55 +144,162 @@ def IRresponseTest(IR_TX_serial:serial.Serial, IR_RX_serial:serial.Serial|None=N
         # else:   print("IRresponseTest bad data:", readData, "!=", data)
         while(IR_RX_serial.in_waiting > 0): print("discarding excess data:", IR_RX_serial.read(IR_RX_serial.in_waiting), "(after looking for", data, ")");  time.sleep(IR_RX_serial.timeout)
         try: # don't want my excessive debugging effors to crash things
-            if(readData != data):   badDataPattern[i] += 1
+            if(readData != data):   badDataCounters[data[0]] += 1
         except Exception as excep: doNothing=0; print("badDataPattern writing went wrong:", excep)
     return(goodCounter / 256)
+def IRresponseTestDuplex(IR_TX_serial:serial.Serial, IR_RX_serial:serial.Serial) -> tuple[float,float]:
+    """ test IR communication in both directions at the same time (IR_TX_serial -> IR_RX_serial and IR_RX_serial -> IR_TX_serial) \n
+        (only works if the PCB firmware repeats in both directions, and the ports are not the same port) \n
+        returns (TX->RX, RX->TX) results, each just like IRresponseTest() \n
+        the directions send different bytes at the same time (RX->TX uses DUPLEX_REVERSE_PATTERN), so crosstalk or a local echo doesn't look like a working link """
+    if(IR_TX_serial is IR_RX_serial):
+        raise(ValueError("IRresponseTestDuplex() needs seperate IR TX and RX serial ports"))
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as executor: # (the reverse direction runs in a thread, the forward direction runs right here)
+        reverse = executor.submit(IRresponseTest, IR_RX_serial, IR_TX_serial, DUPLEX_REVERSE_PATTERN, badDataPatternReverse)
+        forward = IRresponseTest(IR_TX_serial, IR_RX_serial)
+        return(forward, reverse.result())
+def PRBSbytes(length:int, seed:int=0x7FFF) -> bytes:
+    """ pseudo-random binary sequence (PRBS15: x^15 + x^14 + 1, the usual one for link testing), packed into bytes \n
+        (the same length and seed always give the same bytes, so the receiving side can be checked against it) """
+    import numpy as np
+    bits = np.zeros(length*8 + 15, dtype=np.uint8)
+    bits[0:15] = [((seed >> i) & 1) for i in range(15)] # (the seed must not be 0, or the sequence is all zeros)
+    for i in range(15, len(bits), 14): # every new bit only depends on bits that are at least 14 bits older, so 14 can be calculated at once
+        end = min(i+14, len(bits))
+        bits[i:end] = bits[i-15:end-15] ^ bits[i-14:end-14]
+    return(np.packbits(bits[15:]).tobytes())
+def linkStatistics(sentData:bytes, receivedData:bytes, duration:float, syncWindow:int=4, maxSlip:int=1024) -> tuple[float,float,float,int,int,int,int]:
+    """ compare received data to sent data, re-aligning after lost or inserted bytes (so one slipped byte doesn't make everything after it look wrong) \n
+        returns (fraction of good bytes (0~1), throughput (good bytes per second), bit error rate (of the bytes that arrived), number of error bursts, longest burst (bytes),
+                 lost bytes, inserted bytes) \n
+        an error burst is a run of consecutive bad bytes. After a mismatch, the next 'syncWindow' bytes decide whether it was a bad byte or a slip of up to 'maxSlip' bytes
+        (that only works for data that doesn't repeat within maxSlip bytes, like PRBSbytes()) """
+    import numpy as np
+    sent = np.frombuffer(sentData, dtype=np.uint8);  received = np.frombuffer(receivedData, dtype=np.uint8)
+    def windowPositions(data) -> dict[int,list[int]]: # {every 'syncWindow' bytes (as a number) : [where they start, etc.]}, to find them again quickly
+        positions = {}
+        if(len(data) >= syncWindow):
+            windows = np.lib.stride_tricks.sliding_window_view(data, syncWindow).astype(np.uint64)
+            for i, key in enumerate(np.sum(windows << (np.arange(syncWindow, dtype=np.uint64) * np.uint64(8)), axis=1).tolist()):
+                positions.setdefault(key, []).append(i)
+        return(positions)
+    sentWindows = windowPositions(sent);  receivedWindows = windowPositions(received)
+    def findWindow(positions:dict[int,list[int]], data, index:int, searchStart:int) -> int: # offset (from searchStart) of data[index:index+syncWindow] within the next maxSlip positions (-1 if it's not there)
+        key = sum([int(value) << (8*i) for i, value in enumerate(data[index:index+syncWindow])])
+        offsets = [position - searchStart for position in positions.get(key, []) if (0 <= (position - searchStart) < maxSlip)]
+        return(min(offsets) if ((len(offsets) > 0) and ((len(data) - index) >= syncWindow)) else (-1))
+    alignedSent = [];  alignedReceived = [] # the stretches of bytes that are compared to each other
+    lostCount = 0;  insertedCount = 0
+    sentIndex = 0;  receivedIndex = 0
+    while((sentIndex < len(sent)) and (receivedIndex < len(received))):
+        overlap = min(len(sent) - sentIndex, len(received) - receivedIndex)
+        matchLength = 0;  chunkSize = 64 # (look for the next mismatch in growing chunks, so lots of bad bytes don't mean comparing everything over and over)
+        while(matchLength < overlap):
+            chunkEnd = min(matchLength + chunkSize, overlap);  chunkSize *= 2
+            mismatches = np.flatnonzero(sent[sentIndex+matchLength:sentIndex+chunkEnd] != received[receivedIndex+matchLength:receivedIndex+chunkEnd])
+            if(len(mismatches) > 0):
+                matchLength += int(mismatches[0]);  break
+            matchLength = chunkEnd
+        alignedSent.append(sent[sentIndex:sentIndex+matchLength]);  alignedReceived.append(received[receivedIndex:receivedIndex+matchLength])
+        sentIndex += matchLength;  receivedIndex += matchLength
+        if(matchLength == overlap):
+            break
+        ## mismatch: a bad byte (the bytes after it line up again), or lost/inserted bytes (the bytes after it line up at an offset)
+        nextSent = sent[sentIndex+1:sentIndex+1+syncWindow];  nextReceived = received[receivedIndex+1:receivedIndex+1+syncWindow]
+        if((len(nextSent) == 0) or (len(nextReceived) == 0) or ((len(nextSent) == len(nextReceived)) and np.array_equal(nextSent, nextReceived))):
+            lostOffset = insertedOffset = -1 # a bad byte
+        else:
+            lostOffset = findWindow(sentWindows, received, receivedIndex, sentIndex+1)
+            insertedOffset = findWindow(receivedWindows, sent, sentIndex, receivedIndex+1)
+        if((lostOffset >= 0) and ((insertedOffset < 0) or (lostOffset <= insertedOffset))):
+            lostCount += lostOffset + 1;  sentIndex += lostOffset + 1
+        elif(insertedOffset >= 0):
+            insertedCount += insertedOffset + 1;  receivedIndex += insertedOffset + 1
+        else: # a bad byte (or no way to tell), compare it and move on
+            alignedSent.append(sent[sentIndex:sentIndex+1]);  alignedReceived.append(received[receivedIndex:receivedIndex+1])
+            sentIndex += 1;  receivedIndex += 1
+    lostCount += len(sent) - sentIndex # (bytes that never arrived)
+    insertedCount += len(received) - receivedIndex # (extra bytes at the end)
+    alignedSent = np.concatenate(alignedSent + [np.zeros(0, dtype=np.uint8)]);  alignedReceived = np.concatenate(alignedReceived + [np.zeros(0, dtype=np.uint8)])
+    errorBits = np.unpackbits(alignedSent ^ alignedReceived) # (1 for every bit that's wrong)
+    badBytes = errorBits.reshape(-1, 8).any(axis=1)
+    goodCount = int(len(alignedSent) - np.count_nonzero(badBytes))
+    edges = np.diff(np.concatenate(([0], badBytes.astype(np.int8), [0]))) # +1 where a burst starts, -1 where it ends
+    burstLengths = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return(goodCount / max(len(sent), 1), goodCount / max(duration, 1e-6), float(np.count_nonzero(errorBits)) / max(len(errorBits), 1), len(burstLengths), int(burstLengths.max(initial=0)),
+           lostCount, insertedCount)
+def IRthroughputTest(IR_TX_serial:serial.Serial, IR_RX_serial:serial.Serial|None=None, frameSize:int=1024, frameCount:int=4) -> tuple[float,float,float,int,int,int,int]:
+    """ test IR communication under continuous load: stream 'frameCount' frames of 'frameSize' PRBS bytes (back-to-back) while a thread reads the response \n
+        returns the output of linkStatistics(): (good bytes (0~1), throughput (bytes/s), bit error rate, error bursts, longest burst, lost bytes, inserted bytes) \n
+        (the first value means the same as the IRresponseTest() result, so the scan logic works the same) """
+    import threading
+    if(IR_RX_serial is None):
+        IR_RX_serial = IR_TX_serial
+    payload = PRBSbytes(frameSize * frameCount)
+    IR_RX_serial.flush() # library flush
+    while(IR_RX_serial.in_waiting > 0): IR_RX_serial.read(IR_RX_serial.in_waiting); time.sleep(IR_RX_serial.timeout) # manual flush
+    startTime = time.time()
+    deadline = startTime + (len(payload) * 10 / getattr(IR_TX_serial, 'baudrate', 9600)) * 1.5 + 0.1 # (10 bits per byte (start+8+stop), with some margin for gaps between writes)
+    receivedData = bytearray();  lastReceiveTime = [startTime] # (list, so the reader thread can change it)
+    def reader():
+        while((len(receivedData) < len(payload)) and (time.time() < deadline)):
+            newData = IR_RX_serial.read(max(1, min(IR_RX_serial.in_waiting, len(payload) - len(receivedData))))
+            if(len(newData) > 0):
+                receivedData.extend(newData);  lastReceiveTime[0] = time.time()
+    readerThread = threading.Thread(target=reader, daemon=True)
+    readerThread.start()
+    for i in range(frameCount):
+        IR_TX_serial.write(payload[i*frameSize:(i+1)*frameSize])
+    readerThread.join()
+    return(linkStatistics(payload, bytes(receivedData), lastReceiveTime[0] - startTime))
 # def testIR(IR_TX_serial:serial.Serial, IR_RX_serial:serial.Serial|None=None) -> float: # deconstructed into drawing loop (for now)
 
 ## matplotlib visualization:
-import matplotlib.pyplot as plt # for displaying results
-def plot5D(list5D: dict[int,list[tuple[float,float,float,float]]]):
-    """ plot multiple subplots of 3D grid-scatter graphs \n
+def plot4D(subplotAx, list4D: list[tuple[float,float,float,float]], markerScale:float=0.5): # with inspiration from online examples
+    """ plot values in a 3D grid-scatter \n
+        list4D is a 2D list, formatted like [[x,y,z,data], etc.] \n
+        'markerScale' scales the dots, (IRtestHorizontalStepsize works well) """
+    import numpy as np
+    ## scatter plot:
+    list4Dnp = np.array([row[0:4] for row in list4D], dtype=float).reshape((-1,4))
+    x = list4Dnp[:, 0];  y = list4Dnp[:, 1];  z = list4Dnp[:, 2];  c = list4Dnp[:, 3];  s = (100 * c*markerScale) # this format is plottable with a 3D scatter plot
+    return(subplotAx.scatter(x, y, z, c=c, s=s, cmap='RdYlGn', vmin=0.0, vmax=1.0)) # plot! (also returns colorBar(?))
+    # ## flattened contour plots: (see plotWorker.py for a working version, using alignmentAnalysis.interpolateLayer())
+def drawPlot5D(fig, list5D: dict[int,list[tuple[float,float,float,float]]], markerScale:float=0.5):
+    """ draw multiple subplots of 3D grid-scatter graphs into a (matplotlib) figure \n
         list5D is a dict with keys=baud_rate and values= list like [[x,y,z,data], etc.] """
-    import matplotlib.pyplot as plt # for displaying results
-    if(len(list5D[tuple(list5D.keys())[0]]) < 1):
-        print("can't plot empty list");  return
-    def _plot4D(subplotAx:plt.Axes, list4D: list[tuple[float,float,float,float]]): # with inspiration from online examples
-        """ plot values in a 3D grid-scatter \n
-            list4D is a 2D list, formatted like [[x,y,z,data], etc.] """
-        ## scatter plot:
-        list4Dnp = np.array(list4D)
-        x = list4Dnp[:, 0];  y = list4Dnp[:, 1];  z = list4Dnp[:, 2];  c = list4Dnp[:, 3];  s = (100 * c*IRtestHorizontalStepsize) # this format is plottable with a 3D scatter plot
-        return(subplotAx.scatter(x, y, z, c=c, s=s, cmap='RdYlGn')) # plot! (also returns colorBar(?))
-        # ## flattened contour plots: TODO (fix, i was almost there)!!!
-        # dataZsplit:dict[float,list[tuple[float,float,float]]] = {} # split data based on Z height to discrete levels (NOTE: involves a bit of nasty float comparison)
-        # for x,y,z,mes in list4D:
-        #     if(z in dataZsplit): dataZsplit[z].append((x,y,mes))
-        #     else:   dataZsplit[z] = [(x,y,mes)]
-        # for z in dataZsplit:
-        #     npArr = np.array(dataZsplit[z])
-        #     npArr = npArr.round(2)
-        #     X, Y, C = np.meshgrid(npArr[:,0], npArr[:,1], npArr[:,2]) # seems excessive to me, but matplotlib likes meshgrid...
-        #     ax.contourf(X[:,:,0], Y[:,:,0], C[:,:,0], offset=z)
     figRows:int = max(int(len(list5D) ** 0.5), 1) # square root, rounded down
-    figCols:int = max(len(list5D) // figRows, 1)
+    figCols:int = max(-(-len(list5D) // figRows), 1) # (rounded up)
     # print("rows, cols:", figRows, figCols)
-    fig = plt.figure(figsize=(5, 5))
     fig.suptitle("IR UART transfer success versus x,y,z offset")
     for i in range(len(list5D)): # for every key
         ax = fig.add_subplot(figRows, figCols, i+1, projection="3d")
         ax.set_title(tuple(list5D.keys())[i]);  ax.set_xlabel("x misalignment [mm]");  ax.set_ylabel("y misalignment [mm]");  ax.set_zlabel("z distance [mm]")
-        img = _plot4D(ax, list5D[tuple(list5D.keys())[i]])
+        img = plot4D(ax, list5D[tuple(list5D.keys())[i]], markerScale)
         # fig.colorbar(img) # TODO: individual color bars? constant color map (0~1)?
+def plot5D(list5D: dict[int,list[tuple[float,float,float,float]]], markerScale:float=0.5):
+    """ plot multiple subplots of 3D grid-scatter graphs (NOTE: blocks untill the window is closed, see plotWorker.py for a non-blocking version) \n
+        list5D is a dict with keys=baud_rate and values= list like [[x,y,z,data], etc.] """
+    import matplotlib.pyplot as plt # for displaying results
+    if(len(list5D[tuple(list5D.keys())[0]]) < 1):
+        print("can't plot empty list");  return
+    fig = plt.figure(figsize=(5, 5))
+    drawPlot5D(fig, list5D, markerScale)
     plt.tight_layout()
     plt.show()
 
 ## excel stuff
-def saveToExcel(list5D: dict[int,list[tuple[float,float,float,float]]], filename="output.xlsx"):
-    """ save recorded data to a fancy excel file """
+def saveToExcel(list5D: dict[int,list[tuple[float,float,float,float]]], filename="output.xlsx", extraSheets:dict[str,tuple[list[str],list[tuple]]]|None=None, columnNames:list[str]|None=None,
+                metadata:dict|None=None, register:bool=True):
+    """ save recorded data to a fancy excel file \n
+        'columnNames' are the column titles for the measurement data (default: MEASUREMENT_COLUMN_NAMES, use DUPLEX_COLUMN_NAMES for duplex data) \n
+        'metadata' (optional) is stored in a 'metadata' sheet, e.g. {'board' : "X", 'horizontalStepsize' : 0.5, 'positionOffset' : [x,y,z], 'duration' : seconds} (values must be JSON-serializable) \n
+        'register' adds the file to the run index (see runIndex.py) \n
+        'extraSheets' (optional) holds other data to store alongside it, formatted like {sheetName : ([column titles], [row, etc.])}. NOTE: sheet names must not be numbers (those are baud rates) """
     import openpyxl as opxl
     def makeSheet(Wsheet, list4D: list[tuple[float,float,float,float]]):
-        Wsheet.append(['x [mm]', 'y [mm]', 'z [mm]', 'measurement (0~1)']) # write column titles
+        Wsheet.append(columnNames if (columnNames is not None) else MEASUREMENT_COLUMN_NAMES) # write column titles
         for i in range(len(list4D)):
             Wsheet.append(list4D[i])
     Wbook = opxl.Workbook() # create excel storage object
@@ -172,10 +308,25 @@ def saveToExcel(list5D: dict[int,list[tuple[float,float,float,float]]], filename
         Wsheet = Wbook.create_sheet(str(key))
         makeSheet(Wsheet, list5D[key])
     try:
-        Wsheet = Wbook.create_sheet("badDataPattern");  Wsheet.append(['data byte', 'bad data counter'])
-        for i in range(len(badDataPattern)):  Wsheet.append([i, badDataPattern[i]])
+        duplex = any(badDataPatternReverse) # (only add the RX->TX column if there was a duplex test)
+        Wsheet = Wbook.create_sheet("badDataPattern");  Wsheet.append(['data byte', 'bad data counter'] + (['bad data counter (RX->TX)'] if duplex else []))
+        for i in range(len(badDataPattern)):  Wsheet.append([i, badDataPattern[i]] + ([badDataPatternReverse[i]] if duplex else []))
     except Exception as excep: doNothing=0; print("couldn't save badDataPattern to excel", excep)
-    Wbook.save(filename if filename.endswith(".xlsx") else (filename+".xlsx"))
+    for sheetName in (extraSheets if (extraSheets is not None) else {}):
+        Wsheet = Wbook.create_sheet(sheetName);  Wsheet.append(extraSheets[sheetName][0])
+        for row in extraSheets[sheetName][1]:  Wsheet.append(list(row))
+    import json
+    metadata = dict(metadata if (metadata is not None) else {});  metadata['savedAt'] = datetime.datetime.now().isoformat(timespec='seconds')
+    Wsheet = Wbook.create_sheet("metadata");  Wsheet.append(['key', 'value (JSON)'])
+    for key in metadata:  Wsheet.append([key, json.dumps(metadata[key])])
+    filename = (filename if filename.endswith(".xlsx") else (filename+".xlsx"))
+    Wbook.save(filename)
+    if(register):
+        try:
+            import runIndex # (my own code)
+            runIndex.registerRun(filename, list5D, metadata)
+        except Exception as excep:
+            print("couldn't add the file to the run index:", excep)
 def generateFileName(list5D: dict[int,list[tuple[float,float,float,float]]]) -> str:
     """ optional function for auto-generating filenames (to keep track of data)"""
     filename = datetime.datetime.now().strftime("%Y-%m-%d_%H;%M;%S_")
@@ -191,6 +342,8 @@ def readFromExcel(filename:str):
     for Wsheet in Wbook:
         if(str(Wsheet.title).find("badDataPattern") >= 0):
             continue # skip importing this sheet (it doesn't go in list5D anyway)
+        if(not str(Wsheet.title).isdigit()):
+            continue # skip other extra sheets (see saveToExcel()'s 'extraSheets'), they don't go in list5D either
         # print("importing sheet:", Wsheet.title)
         try:
             baud = int(Wsheet.title)
@@ -199,6 +352,22 @@ def readFromExcel(filename:str):
             print("FAILED to import sheet:", Wsheet.title, "  exception:", excep)
     Wbook.close()
     return(list5D)
+def readMetadataFromExcel(filename:str) -> dict:
+    """ read the 'metadata' sheet (see saveToExcel()) from an excel file (empty dict for files without one) """
+    import openpyxl as opxl
+    import json
+    Wbook = opxl.open(filename,read_only=True)
+    metadata = {}
+    try:
+        if("metadata" in Wbook.sheetnames):
+            for key, value in list(Wbook["metadata"].values)[1:]:
+                try:
+                    metadata[key] = json.loads(value)
+                except Exception as excep:
+                    metadata[key] = value
+    finally:
+        Wbook.close()
+    return(metadata)
 
 
 
@@ -216,16 +385,36 @@ if __name__ == "__main__": # an example of how this file may be used
         IRtestContinuationThresh = 127/256 # it will keep spiraling until no meausrements in the past rotation are above this value
         IRtestVertStopThresh = IRtestVerticalStepsize * 10 # (mm) if absolutely 0 datapoints are above IRtestContinuationThresh for serveral Z steps (this), stop the test early
         IRtestPasses = 1 # how many times to repeat the test (results are simply averaged (for now)). 1 should be fine
+        IRtestDuplex = False # test both directions (TX->RX and RX->TX) at the same time (see IRresponseTestDuplex()), needs seperate IR RX and TX ports
+        IRtestThroughput = False # sustained-load test instead: stream PRBS frames and record throughput, bit error rate, error bursts and lost/inserted bytes per point (see IRthroughputTest())
+        IRthroughputFrameSize:int = 1024 # (bytes) per frame in throughput mode
+        IRthroughputFrameCount:int = 4 # frames per measurement in throughput mode (sent back-to-back)
+        excelColumnNames = (DUPLEX_COLUMN_NAMES if IRtestDuplex else (THROUGHPUT_COLUMN_NAMES if IRtestThroughput else MEASUREMENT_COLUMN_NAMES))
+        boardName:str = "" # (optional) name/serial number of the PCB being tested, stored in the results file and the run index (see runIndex.py)
 
         printerBaud:int = 250000 # semi-modern Marlin printers use 250000, older ones might use 115200, really modern ones might go above 250000
         printerSafeFeedrate:float = 1200 # (mm/min) feedrate at which things are unlikely to break
         printerJogFeedrate:float = printerSafeFeedrate # (mm/min) feedrate for movements requested through keyboard 'WASD'
         printerJogStepSize:tuple[float,float,float] = (0.5, 0.5, 0.25) # x,y,z respectively, in millimeters
         printerPosUpdateInterval = 1/15 # interval between 3d printer position readout (for visualization only)
+        printerAcceleration:float = 500.0 # (mm/s^2) roughly the printer's acceleration setting, used to predict how long moves take (fallback for when M400 doesn't respond)
+        printerSettleDelay:float = 0.0 # (s) extra time to wait after the head has stopped before measuring (to let vibrations die down)
+        autoDiscoverPorts:bool = True # find the printer and IR ports automatically (see portDiscovery.py), only asks for the ones it couldn't find
 
         positionOffset:tuple[float,float,float] = (116.5, 108.0, 11.25) # IMPORTANT: this is the (relative->absolute) 0-position for this excercise
 
+        global testStartTime # for keyHandler (interrupt)
+        testStartTime:float|None = None # when testing was first started (for the metadata)
+        def runMetadata() -> dict:
+            """ metadata to store with the results (see saveToExcel()) """
+            return({'board' : boardName, 'baudRates' : list(baudRatesToTest), 'horizontalStepsize' : IRtestHorizontalStepsize, 'verticalStepsize' : IRtestVerticalStepsize,
+                    'positionOffset' : list(positionOffset), 'passes' : IRtestPasses, 'duplex' : IRtestDuplex, 'throughput' : IRtestThroughput, 'duration' : ((time.time() - testStartTime) if (testStartTime is not None) else None)})
+
         DRAW_HIST_LEN = 200 # how many recent datapoints to draw (just for debug). Lower = higher FPS, higher = more points shown
+        DRAW_SEARCH_LEN = DRAW_HIST_LEN * 4 # how many recent datapoints to look through (backwards) to find the ones at/below the current Z pos (keeps the per-frame cost flat)
+        boundedMemory:bool = False # for very long runs: keep only the newest measurements in RAM, and spill older ones to a file on disk (see measurementStore.py)
+        boundedMemoryRingSize:int = 4096 # how many measurements (per baud rate) to keep in RAM in boundedMemory mode
+        telemetryPort:int = 0 # port for the live telemetry server (see telemetryServer.py), e.g. 8765 -> http://127.0.0.1:8765/ (0 = disabled)
 
         ############# variables:
         ## commanded positions:
@@ -240,14 +429,19 @@ if __name__ == "__main__": # an example of how this file may be used
         ## initialize the measurement data array:
         list5D: dict[int,list[tuple[float,float,float,float]]] = {} # {baud : [(x,y,z,data), etc.]}
         for key in baudRatesToTest:
-            list5D[key] = [] # init empty array
+            if(boundedMemory):
+                import measurementStore # (my own code)
+                list5D[key] = measurementStore.measurementStore(len(excelColumnNames), boundedMemoryRingSize) # (list-like)
+            else:
+                list5D[key] = [] # init empty array
 
         ## command-line file loading (mostly because c2Renderer doesn't do file drag-dropping (like pygame does))
+        loadedFromFile = False # (no need to save a backup of data that came from a file)
         try:
             import sys # used for cmdline arguments
             if(sys.argv[1].endswith(".xlsx") if ((type(sys.argv[1]) is str) if (len(sys.argv) > 1) else False) else False): #a long and convoluted way of checking if a file was (correctly) specified
                 print("found sys.argv[1], attempting to import:", sys.argv[1])
-                list5D = readFromExcel(sys.argv[1])
+                list5D = readFromExcel(sys.argv[1]);  loadedFromFile = True
                 ## there are some things you can do to make the user more confortable
                 print("loaded file debug:", len(list5D), list5D.keys())
                 # desiredRelPos[2] = max([entry[2] for entry in list5D[tuple(list5D.keys())[-1]]]) # get the highest Z pos used in the test. NOTE: not strictly needed, but it avoid confusion after loading
@@ -259,21 +453,38 @@ if __name__ == "__main__": # an example of how this file may be used
                 # trimmedFilename = os.path.split(sys.argv[1]) # save the name of the loaded mapfile
                 # print("loaded cmdline file:", trimmedFilename)
                 ## FINALLY, just open a matplotlib graph by defualt (becuase that's probably the main reason for opening a file)
-                plot5D(list5D)
+                plot5D(list5D, IRtestHorizontalStepsize) # (blocking is fine here, there's nothing else to do)
                 sys.exit(); # stop the whole code
             elif(len(sys.argv) > 1):
                 print("ignored commandline arguments:", sys.argv[1:])
         finally:
             _=0
         
-        doMoveMacro:list[bool,float] = [False,-1] # to bet set to True by interrupt functions (indicates that moveMacro() should be run ASAP). NOTE: list to force python to really find it
+        ## everything after this point is only needed for actual testing (not for looking at a file), so only import it now:
+        import numpy as np
+        import serial # for printer commands AND for testing IR
+        import serial.tools.list_ports # just for listing the available COM ports (debug)
+        import motionCompletion as MC # (my own code) detects when the printer head has arrived (M400 + move-time model + position reports)
+        import scanPlanner # (my own code) decides where to measure next (spiral pattern)
+        import plotWorker # (my own code) non-blocking matplotlib plots (in a seperate process)
+        import printerCommandQueue # (my own code) coalesces jog moves and runs auto-home/disable-steppers without blocking the UI
+        import reportPipeline # (my own code) saves the results, figures and summary in a process pool (so the rig is free right away)
+
         printerPosUpdateTimer = time.time()
         
         global IRtestingActive # for keyHandler (interrupt)
         IRtestingActive:bool = False # whether to continue testing
-        IRtestItts:list[float,int,int] = [0.0, 0, 0] # (hor_spiral_angle,vert,baud) iterator counters for the IR tests
-        
-        badDataPattern:list[int] = [0 for i in range(256)] # mostly for debugging
+        planner = scanPlanner.spiralScanPlanner(IRtestHorizontalStepsize, IRtestVerticalStepsize, IRtestVerticalDistMax, IRtestHorizontalDistMax, IRtestContinuationThresh, IRtestVertStopThresh,
+                                                measurementKey=(scanPlanner.duplexMeasurement if IRtestDuplex else scanPlanner.singleMeasurement))
+        IRtestItts:list[float,int,int] = planner.itts # (hor_spiral_angle,vert,baud) iterator counters for the IR tests (NOTE: same list object as the planner uses)
+        plotter = plotWorker.plotProcess(markerScale=IRtestHorizontalStepsize) # (the plot process only starts when a plot is first requested)
+        reports = reportPipeline.reportPipeline(markerScale=IRtestHorizontalStepsize) # (the process pool only starts when the first report is submitted)
+        telemetry = None
+        if(telemetryPort > 0):
+            import telemetryServer # (my own code) live status over HTTP (in a seperate thread)
+            telemetry = telemetryServer.telemetryServer(telemetryPort)
+            if(not telemetry.start()):
+                telemetry = None
 
         addPos = lambda posOne, posTwo : [(posOne[i] + posTwo[i]) for i in range(min(len(posOne), len(posTwo)))]
         subtractPos = lambda posOne, posTwo : [(posOne[i] - posTwo[i]) for i in range(min(len(posOne), len(posTwo)))]
@@ -282,10 +493,14 @@ if __name__ == "__main__": # an example of how this file may be used
 
         ## start by printing the COM ports:
         print("serial ports:", [(entry.name, entry.description) for entry in serial.tools.list_ports.comports()])
+        discoveredPorts:dict[str,str|None] = {'printer' : None, 'IR_RX' : None, 'IR_TX' : None}
+        if(autoDiscoverPorts):
+            import portDiscovery # (my own code)
+            discoveredPorts = portDiscovery.discoverPorts(printerBaud, baudRatesToTest[0])
 
         ## init printer serial:
         # printerSerial = initSerial("COM7")
-        printerSerial = initSerial("COM" + input("please enter the number (only the number) of the COM port of the  3D printer  : COM"), printerBaud)
+        printerSerial = initSerial((discoveredPorts['printer'] if (discoveredPorts['printer'] is not None) else ("COM" + input("please enter the number (only the number) of the COM port of the  3D printer  : COM"))), printerBaud)
         if(printerSerial is None):
             print("can't continue without open serial port")
             exit()
@@ -308,23 +523,33 @@ if __name__ == "__main__": # an example of how this file may be used
         ## now that the printer is ready to talk:
         # autoHome(printerSerial); time.sleep(10) # TODO: add home checking to autoHome() function
         # goToPos(printerSerial, G0args=(positionOffset, printerSafeFeedrate)) ## you COULD immedietly ask the printer to move to positionOffset... However, i think it's wiser to wait for a human to press ENTER
+        motionTracker = MC.motionCompletionTracker(printerSerial, lambda : getCurrentPosition(printerSerial), printerAcceleration, printerSafeFeedrate, printerSettleDelay, POS_MATCH_THRESH_DEFAULT, pollInterval=printerPosUpdateInterval)
         print("3d printer init done!")
 
         ## init IR serial(s):
-        IR_serial_timeout = SERIAL_TIMEOUT_DEFAULT + ((3*8)/baudRatesToTest[0]) + (0.020 if (baudRatesToTest[0] < 9600) else 0) # if the baud rate is really low, increasing the timeout a litte might be wise
+        IR_serial_timeout = IRserialTimeout(baudRatesToTest[0])
         # printerSerial = initSerial("COM7") # if you know the COMport beforehand, you could always just 
-        IR_RX_serial_port = "COM" + input("please enter the number (only the number) of the COM port of the  IR RX serial  : COM")
+        IR_RX_serial_port = (discoveredPorts['IR_RX'] if (discoveredPorts['IR_RX'] is not None) else ("COM" + input("please enter the number (only the number) of the COM port of the  IR RX serial  : COM")))
         IR_RX_serial = initSerial(IR_RX_serial_port, baudRatesToTest[0], IR_serial_timeout) # NOTE: baud will change in IR tests later (assuming len(baudRatesToTest) > 1)
-        IR_TX_serial_port = "COM" + input("please enter the number (only the number) of the COM port of the  IR TX serial  : COM")
+        IR_TX_serial_port = (discoveredPorts['IR_TX'] if (discoveredPorts['IR_TX'] is not None) else ("COM" + input("please enter the number (only the number) of the COM port of the  IR TX serial  : COM")))
         IR_TX_serial = (IR_RX_serial if (IR_TX_serial_port == IR_RX_serial_port) else initSerial(IR_TX_serial_port, baudRatesToTest[0], IR_serial_timeout))
         if(IR_TX_serial_port == IR_RX_serial_port): print("IR RX and TX serial ports are the same! (which is fine, this is just debug)")
+        if(IRtestDuplex and (IR_TX_serial is IR_RX_serial)):
+            raise(ValueError("IRtestDuplex needs seperate IR RX and TX serial ports"))
+        if(IRtestDuplex and IRtestThroughput):
+            raise(ValueError("IRtestDuplex and IRtestThroughput can't be used at the same time"))
 
 
         #### functions for handling the movement:
-        def moveMacro(feedrate:float=(-1)) -> bool:
+        def moveMacro(feedrate:float=(-1), requestCompletion:bool=True, relPos:list[float,float,float]|None=None) -> bool:
             """ just a macro! \n
-                writes G0(args) to serialObj and waits for 'ok' respose """
-            gcode:bytes = GC.G0(addPos(desiredRelPos, positionOffset), feedrate)
+                writes G0(args) to serialObj and waits for 'ok' respose \n
+                'requestCompletion' sends an M400 afterwards, so motionTracker knows (ASAP) when the head has arrived. Set to False if more moves follow \n
+                'relPos' is the position to move to (relative to positionOffset), None means desiredRelPos """
+            if(motionTracker.busy): # an outstanding M400 'ok' would be mistaken for the 'ok' of this move
+                motionTracker.waitUntilArrived()
+            absPos = addPos((desiredRelPos if (relPos is None) else relPos), positionOffset)
+            gcode:bytes = GC.G0(absPos, feedrate)
             # print("writing to printer:", gcode)
             printerSerial.write(gcode)
             success, readData = waitForOK(printerSerial)
@@ -332,47 +557,26 @@ if __name__ == "__main__": # an example of how this file may be used
                 print("moveMacro() unsuccessfull!")
             if(not readData.endswith(GC.GCODE_MARLIN_OK)):
                 print("waitForOK() returned:", readData)
+            motionTracker.moveIssued(absPos, feedrate)
+            if(requestCompletion):
+                motionTracker.requestCompletion()
             return(success)
 
+        commandQueue = printerCommandQueue.printerCommandQueue(printerSerial, motionTracker, lambda relPos, feedrate, requestCompletion : moveMacro(feedrate, requestCompletion, relPos))
+        def longOperationDone(name:str, success:bool):
+            """ called by the commandQueue when an auto-home/disable-steppers has finished """
+            global printerIsHomed, steppersDisabled
+            if(name == 'home'):
+                printerIsHomed = success
+            elif(name == 'disableSteppers'):
+                steppersDisabled = success
+
         #### functions for IR testing:
-        def IRtestUpdateDesiredRelPos(advance:bool=True, CCW:bool=False):
-            """ update desiredRelPos. \n
-                It moves in a (horizontal) spiral pattern, and will move to the next (vertical) step(/layer) when it looks like no more data can be collected on the current layer \n
-                'advance' should only be false if you want to re-affirm/reset desiredPos (without advancing a step in the loop)
-                'CCW' just determines the spiral rotation direction. Only needs to be constant/consistant, other than that it shouldn't matter """
-            if(advance):
-                lastRadius = np.hypot(*desiredRelPos[0:2])
-                keepSpiraling = True
-                for i in range(len(list5D[baudRatesToTest[IRtestItts[2]]])-1, -1, -1): # scroll through list backwards
-                    *xyzPos, measurement = list5D[baudRatesToTest[IRtestItts[2]]][i]
-                    if(abs(xyzPos[2] - desiredRelPos[2]) > 0.01): # if the Z position of the previous test is different
-                        break # keep spiraling for sure
-                    if(measurement > IRtestContinuationThresh): # if (any of) the previous meausrement(s) (within the same vertical step (layer)) contain(s) real data
-                        break # keep spiraling untill all measurements are below the threshold for sure
-                    if((lastRadius - np.hypot(*xyzPos[0:2])) > IRtestHorizontalStepsize): # if it has been more than 360 degrees (by checking whether the spiral radius has changed 1 full stepsize)
-                        ## if no real data has been recorded in 1 full rotation, stop spiraling and move on to the next vertical step (layer)
-                        keepSpiraling = False;  break
-                if(keepSpiraling):
-                    IRtestItts[0] += (IRtestHorizontalStepsize / lastRadius) if (lastRadius > IRtestHorizontalStepsize) else np.deg2rad(60) # constant-arc-length (except for first rotation)
-                    if(((IRtestItts[0]/(2*np.pi)) * IRtestHorizontalStepsize) > IRtestHorizontalDistMax): # if next radius would exceed manually set limit (unlikely)
-                        print("(debug): IRtestHorizontalDistMax reached")
-                        keepSpiraling = False
-                if(not keepSpiraling): # move to the next vertical step (layer)
-                    IRtestItts[0] = 0.0 # reset angle to 0 (radians)
-                    IRtestItts[1] += 1 # vertical step
-                    if((IRtestItts[1] * IRtestVerticalStepsize) > IRtestVerticalDistMax): # if the next vertical position is above the maximum
-                        return(True) # the whole range of motion has been completed
-                    for i in range(len(list5D[baudRatesToTest[IRtestItts[2]]])-1, -1, -1): # scroll through list backwards
-                        *xyzPos, measurement = list5D[baudRatesToTest[IRtestItts[2]]][i]
-                        if(measurement > IRtestContinuationThresh): # if (any of) the previous meausrement(s) contain(s) real data
-                            break
-                        if((desiredRelPos[2] - xyzPos[2]) >= IRtestVertStopThresh): # the datapoint in question is this much lower that the current one
-                            # if no measurements have been recorded in the last several vertical steps (layers), consider the test concluded (there's hardly any point in doing more measurements)
-                            return(True) # it is unlikely that any good data will be recorded at this point
-            desiredRelPos[0] = (-1 if CCW else 1) * np.sin(IRtestItts[0]) * ((IRtestItts[0]/(2*np.pi)) * IRtestHorizontalStepsize) # spiral (inspired by my PCBcoilV2.circularSpiral.calcPos())
-            desiredRelPos[1] =          1         * np.cos(IRtestItts[0]) * ((IRtestItts[0]/(2*np.pi)) * IRtestHorizontalStepsize) # spiral
-            desiredRelPos[2] = IRtestItts[1] * IRtestVerticalStepsize
-            return(False) # returns whether the whole range of motion has been completed (if it reached this point, then it hasn't)
+        def IRtestUpdateDesiredRelPos(advance:bool=True) -> bool:
+            """ update desiredRelPos (see scanPlanner.spiralScanPlanner.updateDesiredRelPos()) \n
+                'advance' should only be false if you want to re-affirm/reset desiredPos (without advancing a step in the loop) \n
+                returns whether the whole range of motion has been completed """
+            return(planner.updateDesiredRelPos(desiredRelPos, list5D[baudRatesToTest[IRtestItts[2]]], advance))
         
         ##### visualization stuff:
         import cv2Renderer as rend
@@ -387,38 +591,36 @@ if __name__ == "__main__": # an example of how this file may be used
             if(char == 'r'): # r -> reset to zero-relative-pos
                 if(not IRtestingActive): 
                     desiredRelPos[0]=0;desiredRelPos[1]=0;desiredRelPos[2]=0 # reset relative position
-                    doMoveMacro[0] = True; doMoveMacro[1] = printerSafeFeedrate
-            elif(char == 'h'): # h -> auto-home
+                    commandQueue.moveTo(desiredRelPos, printerSafeFeedrate)
+            elif(char == 'h'): # h -> auto-home (asynchronous, see the 'printer:' status text)
                 if(not IRtestingActive):
-                    global printerIsHomed
-                    printerIsHomed = autoHome(printerSerial)
-            elif(char == 'l'): # l(L) -> disable steppers
+                    commandQueue.home(longOperationDone)
+            elif(char == 'l'): # l(L) -> disable steppers (asynchronous)
                 if(not IRtestingActive):
-                    global steppersDisabled
-                    steppersDisabled = disableSteppers(printerSerial)
+                    commandQueue.disableSteppers(longOperationDone)
             elif(char == 'w'): # w -> forwards
-                if(not IRtestingActive):  desiredRelPos[1] += printerJogStepSize[1];  doMoveMacro[0] = True;  doMoveMacro[1] = printerJogFeedrate
+                if(not IRtestingActive):  desiredRelPos[1] += printerJogStepSize[1];  commandQueue.moveTo(desiredRelPos, printerJogFeedrate)
             elif(char == 'a'): # a -> left
-                if(not IRtestingActive):  desiredRelPos[0] -= printerJogStepSize[0];  doMoveMacro[0] = True;  doMoveMacro[1] = printerJogFeedrate
+                if(not IRtestingActive):  desiredRelPos[0] -= printerJogStepSize[0];  commandQueue.moveTo(desiredRelPos, printerJogFeedrate)
             elif(char == 's'): # s -> backwards
-                if(not IRtestingActive):  desiredRelPos[1] -= printerJogStepSize[1];  doMoveMacro[0] = True;  doMoveMacro[1] = printerJogFeedrate
+                if(not IRtestingActive):  desiredRelPos[1] -= printerJogStepSize[1];  commandQueue.moveTo(desiredRelPos, printerJogFeedrate)
             elif(char == 'd'): # d -> right
-                if(not IRtestingActive):  desiredRelPos[0] += printerJogStepSize[0];  doMoveMacro[0] = True;  doMoveMacro[1] = printerJogFeedrate
+                if(not IRtestingActive):  desiredRelPos[0] += printerJogStepSize[0];  commandQueue.moveTo(desiredRelPos, printerJogFeedrate)
             elif(char == 'q'): # q -> down
-                if(not IRtestingActive):  desiredRelPos[2] -= printerJogStepSize[2];  doMoveMacro[0] = True;  doMoveMacro[1] = printerJogFeedrate
+                if(not IRtestingActive):  desiredRelPos[2] -= printerJogStepSize[2];  commandQueue.moveTo(desiredRelPos, printerJogFeedrate)
             elif(char == 'e'): # e -> up
-                if(not IRtestingActive):  desiredRelPos[2] += printerJogStepSize[2];  doMoveMacro[0] = True;  doMoveMacro[1] = printerJogFeedrate
+                if(not IRtestingActive):  desiredRelPos[2] += printerJogStepSize[2];  commandQueue.moveTo(desiredRelPos, printerJogFeedrate)
             elif(char == ' '): # SPACE
                 IRtestingActive = not IRtestingActive # pause/unpause testing
                 if(IRtestingActive):
+                    global testStartTime
+                    if(testStartTime is None):  testStartTime = time.time()
                     IRtestUpdateDesiredRelPos( advance=False ) # should reset the desiredPos to the last point (without actually advancing)
-                    doMoveMacro[0] = True; doMoveMacro[1] = printerSafeFeedrate
-            elif(char == 'v'): # v -> (view) graph
-                if(not IRtestingActive): # just to avoid stalling the test
-                    plot5D(list5D)
+                    commandQueue.moveTo(desiredRelPos, printerSafeFeedrate, requestCompletion=True)
+            elif(char == 'v'): # v -> (view) graph (in a seperate process, so it doesn't stall the test, and it updates live)
+                plotter.show(list5D)
             elif(char == 'k'): # k -> save to excel (only meant for interrupted tests) 
-                # if(not IRtestingActive): # still not recommended to do while test is active, due to the interrupting nature (you gotta get into semaphores for that)
-                saveToExcel(list5D, generateFileName(list5D))
+                reports.submit(list5D, generateFileName(list5D), columnNames=excelColumnNames, metadata=runMetadata()) # (copies the data and saves it in the background, so this is fine mid-test)
             elif((char != 'z') and (char != 'g')): # 'z' and 'g' are (currently) used by the cv2Drawer (which preceeds this function)
                 print("unused keycode:", keycode, char)
         drawer.keyboardCallbackFunc = keyHandler # whenever a key is pressed, cv2 will catch it and call the keyHander() function (after calling 2 other functions from the classes, btw)
@@ -428,25 +630,34 @@ if __name__ == "__main__": # an example of how this file may be used
         while(windowHandler.keepRunning):
             loopStart = time.time()
             
-            if(doMoveMacro[0]): # for calling printer commands from interrupt functions (without interference)
-                doMoveMacro[0] = False; doMoveMacro[1] = -1
-                moveMacro(doMoveMacro[1])
+            commandQueue.update() # send queued printer commands from the keyHandler (coalesced jogs, auto-home, etc.) when the printer is ready for them
 
+            # check whether the printer head has arrived (non-blocking)
+            motionArrived = motionTracker.update()
+            if(motionTracker.positionFeedbackTime > printerPosUpdateTimer): # the motionTracker just did a position readout, no need to do another one
+                printerPosUpdateTimer = motionTracker.positionFeedbackTime
+                success, printerTargetPosFeedback, printerCurrentPosFeedback = motionTracker.positionFeedback
             # update printer position feedback data (but not every frame, that would be excessive)
-            if((loopStart - printerPosUpdateTimer) > printerPosUpdateInterval):
+            if(((loopStart - printerPosUpdateTimer) > printerPosUpdateInterval) and (not motionTracker.busy) and (not commandQueue.busy)): # (the printer won't respond to M114 untill the M400 (or G28, etc.) is done)
                 printerPosUpdateTimer = loopStart
                 success, printerTargetPosFeedback, printerCurrentPosFeedback = getCurrentPosition(printerSerial)
 
             if(IRtestingActive): ## the actual testing loop
-                ## start by doing a measurement at the current position
-                if(matchPos(desiredRelPos, subtractPos(printerCurrentPosFeedback, positionOffset))):
-                    measurement = np.average([IRresponseTest(IR_TX_serial, IR_RX_serial) for _ in range(IRtestPasses)]) # perform the actual test
-                    list5D[baudRatesToTest[IRtestItts[2]]].append((*desiredRelPos,measurement))
-                    print("measurement:", stringifyPos(list5D[baudRatesToTest[IRtestItts[2]]][-1][0:3]), round(measurement,3), int(measurement*256))
+                ## start by doing a measurement at the current position (as soon as the head has arrived and settled)
+                if(motionArrived and commandQueue.idle):
+                    if(IRtestDuplex):
+                        measurements = tuple(np.average([IRresponseTestDuplex(IR_TX_serial, IR_RX_serial) for _ in range(IRtestPasses)], axis=0)) # perform the actual test (both directions)
+                    elif(IRtestThroughput):
+                        measurements = tuple(np.average([IRthroughputTest(IR_TX_serial, IR_RX_serial, IRthroughputFrameSize, IRthroughputFrameCount) for _ in range(IRtestPasses)], axis=0)) # perform the actual test (sustained load)
+                    else:
+                        measurements = (np.average([IRresponseTest(IR_TX_serial, IR_RX_serial) for _ in range(IRtestPasses)]),) # perform the actual test
+                    list5D[baudRatesToTest[IRtestItts[2]]].append((*desiredRelPos,*measurements))
+                    print("measurement:", stringifyPos(list5D[baudRatesToTest[IRtestItts[2]]][-1][0:3]), [round(measurement,3) for measurement in measurements], [int(measurement*256) for measurement in measurements[0:(2 if IRtestDuplex else 1)]], " settle:", round(motionTracker.lastSettleTime,3), "(predicted:", str(round(motionTracker.lastPredictedTime,3))+")") # (x256 only for the 0~1 columns)
+                    plotter.sendSnapshot(list5D) # update the live plot (if it's open). NOTE: rate-limited, so this is cheap
                     switchToNextBaud = IRtestUpdateDesiredRelPos() # updated desiredRelPos
                     if(abs(desiredRelPos[2] - printerCurrentPosFeedback[2]) > 0.01): # if it's about to move vertically
                         temp = desiredRelPos[0:2]; desiredRelPos[0]=(printerTargetPosFeedback[0]-positionOffset[0]); desiredRelPos[1]=(printerTargetPosFeedback[1]-positionOffset[1]) # use current x,y position
-                        moveMacro() # insert an extra move, which should move exclusively upwards # which the printer likes a little better
+                        moveMacro(requestCompletion=False) # insert an extra move, which should move exclusively upwards # which the printer likes a little better
                         desiredRelPos[0]=temp[0]; desiredRelPos[1]=temp[1] # now restore the calculated position (which should just be (0,0), but still)
                     moveMacro()
                     if(switchToNextBaud):
@@ -456,32 +667,31 @@ if __name__ == "__main__": # an example of how this file may be used
                             print("testing done!")
                             IRtestingActive = False
                             try:
-                                saveToExcel(list5D, generateFileName(list5D))
+                                reports.submit(list5D, generateFileName(list5D), columnNames=excelColumnNames, metadata=runMetadata()) # results file, figures, summary and run index (in the background)
                             except Exception as excep:
-                                print("failed to save to excel!", excep)
+                                print("failed to start the report (saving to excel)!", excep)
                             try:
-                                plot5D(list5D)
+                                plotter.show(list5D)
                             except Exception as excep:
                                 print("failed to plot in matplotlib!:", excep)
                             # continue
                         else: # if there are more baud rates to test
-                            # time.sleep(0.1) # wait an extra 100ms before changing baud, to let the UART IC send any last data still in the buffer (commented out, as IRresponseTest() reads all data)
-                            IR_RX_serial.baudrate = baudRatesToTest[IRtestItts[2]] # will call _reconfigure_port() underwater (may result in unintended pulse, and therefore some garbage data)
-                            # if(IR_TX_serial_port != IR_RX_serial_port): # extra check is nice, but not strictly needed
-                            IR_TX_serial.baudrate = baudRatesToTest[IRtestItts[2]]
-                            if(IR_RX_serial.timeout > SERIAL_TIMEOUT_DEFAULT):
-                                IR_serial_timeout = SERIAL_TIMEOUT_DEFAULT + (0.015 if (baudRatesToTest[0] < 9600) else 0) #also update timeout (in case you can go faster as a result)
-                                IR_RX_serial.timeout = IR_serial_timeout
-                            time.sleep(0.1) # wait 100ms, just for good measure
-                            IR_RX_serial.flush()
-                            # while(IR_RX_serial.in_waiting > 0):     IR_RX_serial.read() # manual flush
+                            switchIRbaud(IR_RX_serial, IR_TX_serial, baudRatesToTest[IRtestItts[2]], baudRatesToTest[0])
+
+            if(telemetry is not None): # NOTE: rate-limited, so this is cheap
+                telemetry.publish({'desiredRelPos' : desiredRelPos, 'targetPos' : printerTargetPosFeedback, 'currentPos' : printerCurrentPosFeedback, 'IRtestItts' : IRtestItts,
+                                   'baud' : baudRatesToTest[IRtestItts[2]], 'testing' : IRtestingActive, 'homed' : printerIsHomed, 'steppersDisabled' : steppersDisabled, 'printerStatus' : commandQueue.status,
+                                   'settleTime' : motionTracker.lastSettleTime, 'progress' : (planner.progress() if IRtestingActive else None)}, list5D[baudRatesToTest[IRtestItts[2]]])
 
             drawer.background() # draw background
             
             ## draw the observed data as small dots, just to get a preview of what it might look like when its done
-            stopIndex = len([None for entry in list5D[baudRatesToTest[IRtestItts[2]]] if (desiredRelPos[2] >= entry[2])]) # find the highest index where the Z position is below/at the current desired Z pos
-            for i in range(max(stopIndex-DRAW_HIST_LEN, 0), stopIndex, 1): # scroll through list from older to newest
-                *xyzPos, measurement = list5D[baudRatesToTest[IRtestItts[2]]][i]
+            recentRows = list5D[baudRatesToTest[IRtestItts[2]]][-DRAW_SEARCH_LEN:] # (only the recent data, so this doesn't get slower as the run goes on)
+            stopIndex = len(recentRows)
+            while((stopIndex > 0) and (recentRows[stopIndex-1][2] > desiredRelPos[2])): # find the highest index where the Z position is below/at the current desired Z pos
+                stopIndex -= 1 # (walking backwards, as the newest data is (almost always) on the current layer)
+            for row in recentRows[max(stopIndex-DRAW_HIST_LEN, 0):stopIndex]: # scroll through list from older to newest
+                xyzPos = row[0:3];  measurement = planner.measurementKey(row) # (for duplex data, this shows the best of both directions)
                 color = [  0,int(min(255,measurement*512)),int(min(255,512-(measurement*512)))] # [B,R,G] transitions red->yellow->green based on measurement 0.0->1.0
                 radius = 0.1 + (0.05 * (desiredRelPos[2] - xyzPos[2]) / IRtestVerticalStepsize) # the more Z distance to the measurement, the bigger the circle
                 if((radius <= 0.05) or (radius >= 0.3)): continue #radius = 0.1   # very niche fix, only applies if you manually jog the head AFTER recording data above that coordinate
@@ -500,10 +710,12 @@ if __name__ == "__main__": # an example of how this file may be used
             drawer.statStrings.append(stringifyPos(printerCurrentPosFeedback) + "=" + stringifyPos(subtractPos(printerCurrentPosFeedback, positionOffset))) # show current pos (feedback)
             drawer.statStrings.append("homed: "+str(printerIsHomed)) # show current pos (feedback)
             drawer.statStrings.append("steppersDisabled: "+str(steppersDisabled)) # show current pos (feedback)
+            drawer.statStrings.append("printer: "+commandQueue.status) # queued commands / auto-home progress
             drawer.statStrings.append("IRtestingActive: "+str(IRtestingActive)) # just debug
+            drawer.statStrings.append("settle time: "+str(round(motionTracker.lastSettleTime,3))+"s (predicted "+str(round(motionTracker.lastPredictedTime,3))+"s)")
             if(IRtestingActive):
                 drawer.statStrings.append("[" + str(round(np.rad2deg(IRtestItts[0]),1)) + "," + str(IRtestItts[1]) + "," + str(IRtestItts[2]) + "]") # debug IRtestItts (to show progress)
-                progressPercentage = (IRtestVerticalStepsize / IRtestVerticalDistMax) * ((((IRtestItts[0]/(2*np.pi)) * IRtestHorizontalStepsize) / IRtestHorizontalDistMax) + IRtestItts[1]) # approximate completion
+                progressPercentage = planner.progress() # approximate completion
                 drawer.statStrings.append("progess:~" + str(round(progressPercentage*100)) + "%")
 
             drawer.renderFG() # draw foreground (text and stuff)
@@ -516,6 +728,19 @@ if __name__ == "__main__": # an example of how this file may be used
             # # elif((loopEnd-loopStart) > (1/5)):
             # #     print("main process running slow", 1/(loopEnd-loopStart))
     finally:
+        try:
+            plotter.close()
+        except Exception as excep:
+            print("couldn't close plotter:", excep)
+        try:
+            if(telemetry is not None):
+                telemetry.stop()
+        except Exception as excep:
+            print("couldn't stop telemetry server:", excep)
+        try:
+            reports.close() # (waits for the unfinished reports)
+        except Exception as excep:
+            print("couldn't close reportPipeline:", excep)
         try:
             windowHandler.end() # correctly shut down cv2 window
             print("drawer stopping done")
@@ -537,7 +762,14 @@ if __name__ == "__main__": # an example of how this file may be used
         except Exception as excep:
             print("couldn't close IR_RX_serial", excep)
         try:
-            saveToExcel(list5D)
-            print("saved to excel file:", saveToExcel.__defaults__[0])
+            if(not loadedFromFile):
+                saveToExcel(list5D, columnNames=excelColumnNames, metadata=runMetadata(), register=False) # (just a backup, which gets overwritten every session, so keep it out of the run index)
+                print("saved to excel file:", saveToExcel.__defaults__[0])
+        except Exception as excep:
+            print("couldn't save data to excel", excep)
+        try:
+            if(boundedMemory and (not loadedFromFile)):
+                for key in list5D:
+                    list5D[key].close() # (deletes the spill files)
         except Exception as excep:
-            print("couldn't save data to excel", excep)
\ No newline at end of file
+            print("couldn't close measurementStore(s)", excep)
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+headless (batch) version of IR_alignment_gcode.py: no cv2 window, no matplotlib, no input() prompts.
+It homes the printer, runs the whole scan and saves the results, which makes it suitable for overnight/scripted runs.
+
+All settings come from a JSON config file (any setting not in the file uses the value from DEFAULT_CONFIG),
+ the most commonly changed ones can also be overridden with commandline arguments.
+
+usage:
+- write a config template:   python IR_alignment_headless.py --dump-config my_config.json
+- run a test:                python IR_alignment_headless.py --config my_config.json --printer-port COM7 --ir-rx-port COM5 --ir-tx-port COM6
+- (ctrl+C stops the test early, the data gathered so far is still saved)
+"""
+
+import json
+import time
+import os
+
+DEFAULT_CONFIG = { # same meaning (and values) as the settings in IR_alignment_gcode.py's __main__
+    "boardName" : "", # (optional) name/serial number of the PCB being tested, stored in the results file and the run index (see runIndex.py)
+    "baudRatesToTest" : [9600],
+    "IRtestHorizontalStepsize" : 0.5, # (mm) horizontal (x,y) movement step between measurements
+    "IRtestVerticalStepsize" : 0.5, # (mm) vertical (z) movement step (upwards) between measurements
+    "IRtestVerticalDistMax" : 10.0, # (mm) maximum vertical (z) distance to reach during test
+    "IRtestHorizontalDistMax" : 10.0, # (mm) maximum horizontal (x,y) offset in in both directions to move during test
+    "IRtestContinuationThresh" : 127/256, # it will keep spiraling until no meausrements in the past rotation are above this value
+    "IRtestVertStopThresh" : 5.0, # (mm) if absolutely 0 datapoints are above IRtestContinuationThresh for serveral Z steps (this), stop the test early
+    "IRtestPasses" : 1, # how many times to repeat the test (results are simply averaged)
+    "IRtestDuplex" : False, # test both directions (TX->RX and RX->TX) at the same time (see IR_alignment_gcode.IRresponseTestDuplex()), needs seperate IR RX and TX ports
+    "IRtestThroughput" : False, # sustained-load test instead: stream PRBS frames and record throughput, bit error rate, error bursts and lost/inserted bytes per point (see IR_alignment_gcode.IRthroughputTest())
+    "IRthroughputFrameSize" : 1024, # (bytes) per frame in throughput mode
+    "IRthroughputFrameCount" : 4, # frames per measurement in throughput mode (sent back-to-back)
+    "scanMode" : "stopAndGo", # "stopAndGo" (move, stop, test, repeat) or "onTheFly" (continuous motion while streaming IR bytes, see onTheFlyScan.py)
+    "onTheFlyFeedrate" : 60, # (mm/min) scanning speed in onTheFly mode
+    "onTheFlySegmentLength" : 0.25, # (mm) length of the linear moves that make up the spiral in onTheFly mode
+    "onTheFlyBinSize" : 0, # (mm) size of the (square) bins the bytes are grouped in, 0 means IRtestHorizontalStepsize
+    "zSearch" : False, # first find the maximum working distance by bisection (probing only a small footprint per height), then only scan full layers around it
+    "zSearchResolution" : 0, # (mm) how precisely to find the cutoff height, 0 means IRtestVerticalStepsize
+    "zSearchFootprintRadius" : 0.5, # (mm) radius of the circle of points (around the center) measured at every probed height
+    "zSearchFootprintPoints" : 4, # number of points on that circle
+    "zSearchLayerOffsets" : [-2.0, -1.0, 0.0], # (mm) full layers are scanned at these heights relative to the found cutoff (empty list means only the search)
+
+    "autoDiscoverPorts" : True, # find the ports that are left empty automatically (see portDiscovery.py)
+    "printerPort" : "", # e.g. "COM7" or "/dev/ttyUSB0"
+    "IR_RX_port" : "",
+    "IR_TX_port" : "", # may be the same as IR_RX_port
+    "printerBaud" : 250000,
+    "printerSafeFeedrate" : 1200, # (mm/min) feedrate at which things are unlikely to break
+    "printerAcceleration" : 500.0, # (mm/s^2) roughly the printer's acceleration setting (for the move-time model)
+    "printerSettleDelay" : 0.0, # (s) extra time to wait after the head has stopped before measuring
+    "positionOffset" : [116.5, 108.0, 11.25], # IMPORTANT: this is the (relative->absolute) 0-position for this excercise
+
+    "boundedMemory" : False, # for very long runs: keep only the newest measurements in RAM, and spill older ones to a file on disk (see measurementStore.py)
+    "boundedMemoryRingSize" : 4096, # how many measurements (per baud rate) to keep in RAM in boundedMemory mode
+    "boundedMemorySpillDirectory" : "", # where to put the spill files (empty means the system's temp folder)
+
+    "telemetryPort" : 0, # port for the live telemetry server (see telemetryServer.py), e.g. 8765 -> http://127.0.0.1:8765/ (0 = disabled)
+    "telemetryHost" : "127.0.0.1", # "127.0.0.1" only allows local connections, "0.0.0.0" allows other PCs on the network
+
+    "autoHome" : True, # home the printer before starting
+    "disableSteppersWhenDone" : True,
+    "outputDirectory" : ".",
+    "outputFilename" : "", # leave empty to use IR_alignment_gcode.generateFileName()
+    "reportFigures" : True, # also save PNG figures (3D scatter per baud rate, contour plot per layer) and a summary.json in a folder next to the results file (see reportPipeline.py)
+}
+
+def loadConfig(filename:str|None) -> dict:
+    """ load a JSON config file on top of DEFAULT_CONFIG """
+    config = dict(DEFAULT_CONFIG)
+    if(filename is not None):
+        with open(filename, 'r') as configFile:
+            loaded = json.load(configFile)
+        for key in loaded:
+            if(key not in DEFAULT_CONFIG):
+                print("loadConfig() warning: unknown setting:", key)
+        config.update(loaded)
+    return(config)
+
+def runHeadless(config:dict, reports=None) -> dict[int,list[tuple[float,float,float,float]]]:
+    """ run a complete test (blocking), returns the measurement data (same format as list5D in IR_alignment_gcode.py) \n
+        'reports' (optional) is a reportPipeline.reportPipeline to hand the results to. If it's given, this function returns as soon as the measuring is done
+         (the report is finished in the background, which is useful when testing multiple boards in a row), otherwise it waits for the report """
+    import IR_alignment_gcode as IRA # (my own code) NOTE: importing it does not import cv2 or matplotlib
+    import motionCompletion as MC
+    import scanPlanner
+    import gcode_struff as GC
+
+    if(config["scanMode"] not in ("stopAndGo", "onTheFly")):
+        raise(ValueError("unknown scanMode: "+str(config["scanMode"])))
+    if(config["IRtestDuplex"] and (config["scanMode"] == "onTheFly")):
+        raise(ValueError("IRtestDuplex is not supported in onTheFly scanMode"))
+    if(config["IRtestThroughput"] and (config["IRtestDuplex"] or (config["scanMode"] == "onTheFly"))):
+        raise(ValueError("IRtestThroughput can't be combined with IRtestDuplex or onTheFly scanMode"))
+    measurementKey = (scanPlanner.duplexMeasurement if config["IRtestDuplex"] else scanPlanner.singleMeasurement)
+    columnNames = (IRA.DUPLEX_COLUMN_NAMES if config["IRtestDuplex"] else (IRA.THROUGHPUT_COLUMN_NAMES if config["IRtestThroughput"] else IRA.MEASUREMENT_COLUMN_NAMES))
+    def measure() -> tuple[float,...]:
+        """ perform the actual test (IRtestPasses times, averaged), returns a tuple of measurements (2 for duplex, 5 for throughput, 1 otherwise) """
+        if(config["IRtestDuplex"] or config["IRtestThroughput"]):
+            if(config["IRtestDuplex"]):
+                results = [IRA.IRresponseTestDuplex(IR_TX_serial, IR_RX_serial) for _ in range(config["IRtestPasses"])]
+            else:
+                results = [IRA.IRthroughputTest(IR_TX_serial, IR_RX_serial, config["IRthroughputFrameSize"], config["IRthroughputFrameCount"]) for _ in range(config["IRtestPasses"])]
+            return(tuple([sum([result[i] for result in results]) / len(results) for i in range(len(results[0]))]))
+        return((sum([IRA.IRresponseTest(IR_TX_serial, IR_RX_serial) for _ in range(config["IRtestPasses"])]) / config["IRtestPasses"],))
+    baudRatesToTest:tuple[int] = tuple(config["baudRatesToTest"])
+    positionOffset:tuple[float,float,float] = tuple(config["positionOffset"])
+    list5D: dict[int,list[tuple[float,float,float,float]]] = {key : [] for key in baudRatesToTest} # {baud : [(x,y,z,data), etc.]}
+    zSearchProbes: dict[int,list[tuple[float,float,float,float]]] = {} # {baud : [(x,y,z,data), etc.]} (only when config["zSearch"])
+    addPos = lambda posOne, posTwo : [(posOne[i] + posTwo[i]) for i in range(min(len(posOne), len(posTwo)))]
+    printerSerial = IR_RX_serial = IR_TX_serial = None
+    telemetry = None
+    if(config["telemetryPort"] > 0):
+        import telemetryServer # (my own code) live status over HTTP (in a seperate thread)
+        telemetry = telemetryServer.telemetryServer(config["telemetryPort"], config["telemetryHost"])
+        if(not telemetry.start()):
+            telemetry = None
+    if(config["boundedMemory"]): # (created right before the try, so the finally below can clean up their spill files)
+        import measurementStore # (my own code)
+        list5D = {key : measurementStore.measurementStore(len(columnNames), config["boundedMemoryRingSize"], (config["boundedMemorySpillDirectory"] or None)) for key in baudRatesToTest}
+    finished = False # whether this function is going to return normally (otherwise nobody else can close the measurementStores)
+    startTime = time.time()
+    try:
+        ## init serial ports:
+        portKeys = {'printer' : "printerPort", 'IR_RX' : "IR_RX_port", 'IR_TX' : "IR_TX_port"} # {portDiscovery role : config key}
+        if(config["autoDiscoverPorts"] and any([(len(config[key]) == 0) for key in portKeys.values()])):
+            import portDiscovery # (my own code)
+            discoveredPorts = portDiscovery.discoverPorts(config["printerBaud"], baudRatesToTest[0])
+            for role in portKeys:
+                if((len(config[portKeys[role]]) == 0) and (discoveredPorts[role] is not None)):
+                    config[portKeys[role]] = discoveredPorts[role]
+        for key in portKeys.values():
+            if(len(config[key]) == 0):
+                raise(ValueError("no '"+key+"' specified (in config file or commandline) and it couldn't be discovered automatically"))
+        printerSerial = IRA.initSerial(config["printerPort"], config["printerBaud"])
+        if(printerSerial is None):
+            raise(ConnectionError("can't continue without open printer serial port"))
+        IRA.disableAutoReports(printerSerial)
+        IR_serial_timeout = IRA.IRserialTimeout(baudRatesToTest[0])
+        IR_RX_serial = IRA.initSerial(config["IR_RX_port"], baudRatesToTest[0], IR_serial_timeout)
+        IR_TX_serial = (IR_RX_serial if (config["IR_TX_port"] == config["IR_RX_port"]) else IRA.initSerial(config["IR_TX_port"], baudRatesToTest[0], IR_serial_timeout))
+        if((IR_RX_serial is None) or (IR_TX_serial is None)):
+            raise(ConnectionError("can't continue without open IR serial port(s)"))
+        if(config["IRtestDuplex"] and (IR_TX_serial is IR_RX_serial)):
+            raise(ValueError("IRtestDuplex needs seperate IR RX and TX ports"))
+
+        motionTracker = MC.motionCompletionTracker(printerSerial, lambda : IRA.getCurrentPosition(printerSerial), config["printerAcceleration"], config["printerSafeFeedrate"], config["printerSettleDelay"])
+        def moveTo(relPos:list[float,float,float], feedrate:float=(-1), requestCompletion:bool=True) -> bool:
+            """ move to a position (relative to positionOffset) """
+            absPos = addPos(relPos, positionOffset)
+            printerSerial.write(GC.G0(absPos, feedrate))
+            success, readData = IRA.waitForOK(printerSerial)
+            if(not success):
+                print("moveTo() unsuccessfull! waitForOK() returned:", readData)
+            motionTracker.moveIssued(absPos, feedrate)
+            if(requestCompletion):
+                motionTracker.requestCompletion()
+            return(success)
+
+        if(config["autoHome"]):
+            if(not IRA.autoHome(printerSerial)):
+                raise(RuntimeError("auto-homing failed"))
+
+        planner = scanPlanner.spiralScanPlanner(config["IRtestHorizontalStepsize"], config["IRtestVerticalStepsize"], config["IRtestVerticalDistMax"],
+                                                config["IRtestHorizontalDistMax"], config["IRtestContinuationThresh"], config["IRtestVertStopThresh"], measurementKey=measurementKey)
+        desiredRelPos:list[float,float,float] = [0.0, 0.0, 0.0]
+        def publishTelemetry(relPos:list[float,float,float], force:bool=False):
+            """ update the telemetry server (if enabled). NOTE: rate-limited, so this is cheap """
+            if(telemetry is not None):
+                telemetry.publish({'desiredRelPos' : relPos, 'IRtestItts' : planner.itts, 'baud' : baudRatesToTest[planner.itts[2]], 'testing' : True,
+                                   'settleTime' : motionTracker.lastSettleTime, 'progress' : planner.progress()}, list5D[baudRatesToTest[planner.itts[2]]], force)
+        for baudIndex in range(len(baudRatesToTest)):
+            planner.reset();  planner.itts[2] = baudIndex
+            if(baudIndex > 0):
+                IRA.switchIRbaud(IR_RX_serial, IR_TX_serial, baudRatesToTest[baudIndex], baudRatesToTest[0])
+            list4D = list5D[baudRatesToTest[baudIndex]]
+            if(config["zSearch"]):
+                zSearch = scanPlanner.verticalBisectionSearch(config["IRtestVerticalDistMax"], (config["zSearchResolution"] if (config["zSearchResolution"] > 0) else config["IRtestVerticalStepsize"]),
+                                                              config["IRtestContinuationThresh"], config["zSearchFootprintRadius"], config["zSearchFootprintPoints"], measurementKey)
+                zSearchProbes[baudRatesToTest[baudIndex]] = zSearch.probes
+                def probe(relPos:tuple[float,float,float]) -> tuple[float,...]:
+                    if((motionTracker.lastTarget is not None) and (abs(relPos[2] - (motionTracker.lastTarget[2] - positionOffset[2])) > 0.01)):
+                        moveTo([motionTracker.lastTarget[0] - positionOffset[0], motionTracker.lastTarget[1] - positionOffset[1], relPos[2]], config["printerSafeFeedrate"], False) # (vertical move first)
+                    moveTo(relPos, config["printerSafeFeedrate"])
+                    motionTracker.waitUntilArrived()
+                    publishTelemetry(relPos)
+                    return(measure())
+                cutoff = zSearch.run(probe)
+                print("z-search done: max working distance:", ("none (no link at z=0)" if (cutoff is None) else (str(round(cutoff,3))+"mm (+"+str(round(zSearch.resolution,3))+"mm)")), " ("+str(len(zSearch.probes))+" probes)")
+                planner.layerHeights = zSearch.layerHeightsAround(config["zSearchLayerOffsets"])
+                if(len(planner.layerHeights) == 0):
+                    continue
+                print("scanning layers at:", planner.layerHeights)
+            if(config["scanMode"] == "onTheFly"):
+                import onTheFlyScan # (my own code) only needed in this mode
+                scanner = onTheFlyScan.onTheFlyScanner(printerSerial, IR_TX_serial, IR_RX_serial, positionOffset, planner, config["onTheFlyFeedrate"], config["printerSafeFeedrate"],
+                                                       config["printerAcceleration"], config["onTheFlySegmentLength"], binSize=config["onTheFlyBinSize"], motionTracker=motionTracker)
+                scanner.run(list4D)
+                publishTelemetry(desiredRelPos, force=True)
+                continue
+            planner.updateDesiredRelPos(desiredRelPos, list4D, advance=False)
+            moveTo(desiredRelPos, config["printerSafeFeedrate"])
+            done = False
+            while(not done):
+                motionTracker.waitUntilArrived()
+                measurements = measure()
+                list4D.append((*desiredRelPos, *measurements))
+                print("measurement:", [round(entry,2) for entry in desiredRelPos], [round(measurement,3) for measurement in measurements], [int(measurement*256) for measurement in measurements[0:(2 if config["IRtestDuplex"] else 1)]], " settle:", round(motionTracker.lastSettleTime,3), " progress:~"+str(round(planner.progress()*100))+"%") # (x256 only for the 0~1 columns)
+                publishTelemetry(desiredRelPos)
+                previousZ = desiredRelPos[2]
+                done = planner.updateDesiredRelPos(desiredRelPos, list4D)
+                if(not done):
+                    if(abs(desiredRelPos[2] - previousZ) > 0.01): # if it's about to move vertically
+                        moveTo([*list4D[-1][0:2], desiredRelPos[2]], requestCompletion=False) # insert an extra move, which moves exclusively upwards (which the printer likes a little better)
+                    moveTo(desiredRelPos)
+        if(telemetry is not None):
+            telemetry.publish({'testing' : False, 'progress' : 1.0}, force=True)
+        print("testing done! (took", round(time.time()-startTime), "seconds)")
+        if(config["disableSteppersWhenDone"]):
+            motionTracker.waitUntilArrived()
+            IRA.disableSteppers(printerSerial)
+        finished = True
+    except KeyboardInterrupt:
+        print("test interrupted by user (ctrl+C), saving the data gathered so far")
+        finished = True
+    finally:
+        if(telemetry is not None):
+            telemetry.stop()
+        for serialObj in (printerSerial, IR_RX_serial, IR_TX_serial):
+            try:
+                if(serialObj is not None): serialObj.close()
+            except Exception as excep:
+                print("couldn't close serial port", excep)
+        try:
+            if(max([len(list5D[key]) for key in list5D] + [len(zSearchProbes[key]) for key in zSearchProbes]) > 0):
+                filename = os.path.join(config["outputDirectory"], (config["outputFilename"] if (len(config["outputFilename"]) > 0) else IRA.generateFileName(list5D)))
+                import reportPipeline # (my own code)
+                pipeline = reports if (reports is not None) else reportPipeline.reportPipeline(markerScale=config["IRtestHorizontalStepsize"], figures=config["reportFigures"])
+                pipeline.submit(list5D, filename, {("zSearch_"+str(baud)) : (columnNames, zSearchProbes[baud]) for baud in zSearchProbes}, columnNames,
+                                {'board' : config["boardName"], 'baudRates' : list(baudRatesToTest), 'horizontalStepsize' : config["IRtestHorizontalStepsize"], 'verticalStepsize' : config["IRtestVerticalStepsize"],
+                                 'positionOffset' : list(positionOffset), 'passes' : config["IRtestPasses"], 'duplex' : config["IRtestDuplex"], 'throughput' : config["IRtestThroughput"], 'duration' : time.time() - startTime,
+                                 'scanMode' : config["scanMode"], 'zSearch' : config["zSearch"]})
+                if(reports is None):
+                    pipeline.close() # (waits for it to finish)
+        finally:
+            if(config["boundedMemory"] and (not finished)): # an exception is on its way out, so delete the spill files here (the report already has a copy of the rows)
+                for key in list5D:
+                    list5D[key].close()
+    return(list5D)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="headless IR alignment test (no GUI, no prompts)")
+    parser.add_argument("--config", help="JSON config file (settings that are not in the file use the defaults)")
+    parser.add_argument("--dump-config", metavar="FILENAME", help="write the default config to a file (as a template) and exit")
+    parser.add_argument("--printer-port", help="serial port of the 3D printer (overrides config)")
+    parser.add_argument("--ir-rx-port", help="serial port of the IR RX board (overrides config)")
+    parser.add_argument("--ir-tx-port", help="serial port of the IR TX board (overrides config, defaults to the RX port)")
+    parser.add_argument("--baud", type=int, nargs='+', help="IR baud rate(s) to test (overrides config)")
+    parser.add_argument("--output", help="output filename (overrides config)")
+    parser.add_argument("--no-home", action="store_true", help="don't auto-home the printer before starting")
+    args = parser.parse_args()
+
+    if(args.dump_config is not None):
+        with open(args.dump_config, 'w') as configFile:
+            json.dump(DEFAULT_CONFIG, configFile, indent=4)
+        print("wrote default config to:", args.dump_config)
+        exit()
+    config = loadConfig(args.config)
+    if(args.printer_port is not None):  config["printerPort"] = args.printer_port
+    if(args.ir_rx_port is not None):    config["IR_RX_port"] = args.ir_rx_port
+    if(args.ir_tx_port is not None):    config["IR_TX_port"] = args.ir_tx_port
+    elif((args.ir_rx_port is not None) and (len(config["IR_TX_port"]) == 0)):  config["IR_TX_port"] = args.ir_rx_port
+    if(args.baud is not None):          config["baudRatesToTest"] = args.baud
+    if(args.output is not None):        config["outputFilename"] = args.output
+    if(args.no_home):                   config["autoHome"] = False
+    list5D = runHeadless(config) # (if this raises, runHeadless() cleans up the spill files itself)
+    if(config["boundedMemory"]):
+        for key in list5D:
+            list5D[key].close() # (deletes the spill files)
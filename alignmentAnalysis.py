@@ -0,0 +1,151 @@
+"""
+analysis of (recorded) alignment scan data.
+
+The spiral scan produces irregularly spaced samples, which are hard to compare between runs directly.
+This module interpolates them (per layer) onto a regular x,y grid, resulting in a dense 3D array (z,y,x) per baud rate,
+ which gets cached next to the results file (filename + VOLUME_CACHE_SUFFIX), so it only has to be calculated once.
+From that volume it derives some tolerance metrics:
+- usable radius: for every layer (z), the radius of the largest circle around (0,0) in which every point is above the success threshold
+- max working distance: the highest z at which any point is above the success threshold
+- centroid offset: the (measurement-weighted) center of the area above the success threshold (a.k.a. how far positionOffset is from the actual optical axis)
+
+usage (commandline):  python alignmentAnalysis.py results.xlsx [--threshold 0.9] [--resolution 0.1]
+"""
+
+import os
+import numpy as np
+
+VOLUME_CACHE_SUFFIX = ".volume.npz"
+LAYER_Z_DECIMALS = 3 # Z positions are rounded to this many decimals to split data into layers (avoids float comparison trouble)
+
+def splitLayers(list4D:list[tuple[float,float,float,float]]) -> dict[float,np.ndarray]:
+    """ split data (formatted like [[x,y,z,data], etc.]) into layers. Returns {z : np.array([[x,y,data], etc.])} (sorted by z) """
+    list4Dnp = (np.asarray(list4D, dtype=float)[:,0:4] if isinstance(list4D, np.ndarray) else np.asarray([row[0:4] for row in list4D], dtype=float).reshape((-1,4)))
+    zRounded = list4Dnp[:,2].round(LAYER_Z_DECIMALS)
+    return({float(z) : list4Dnp[zRounded == z][:,[0,1,3]] for z in np.unique(zRounded)})
+
+def _nearestNeighbourSpacing(sampleXY:np.ndarray) -> float:
+    """ median distance between a sample and its nearest neighbour (a.k.a. the typical sample spacing) """
+    if(len(sampleXY) < 2):
+        return(0.0)
+    dist = np.hypot(sampleXY[:,None,0] - sampleXY[None,:,0], sampleXY[:,None,1] - sampleXY[None,:,1])
+    np.fill_diagonal(dist, np.inf)
+    return(float(np.median(dist.min(axis=1))))
+
+def interpolateLayer(samples:np.ndarray, gridX:np.ndarray, gridY:np.ndarray, maxDist:float|None=None, neighbours:int=8, power:float=2.0, chunkSize:int=4096) -> np.ndarray:
+    """ interpolate scattered samples (np.array([[x,y,data], etc.])) onto a regular grid, using (k-nearest) inverse distance weighting. \n
+        'maxDist' is how far from the nearest sample a grid point may be before it's considered not covered by the data (NaN). None = 1.5 * sample spacing \n
+        returns a 2D array with shape (len(gridY), len(gridX)) """
+    output = np.full((len(gridY), len(gridX)), np.nan)
+    if(len(samples) < 1):
+        return(output)
+    if(maxDist is None):
+        maxDist = 1.5 * _nearestNeighbourSpacing(samples[:,0:2]) if (len(samples) > 1) else np.inf
+    meshX, meshY = np.meshgrid(gridX, gridY)
+    gridXY = np.stack((meshX.ravel(), meshY.ravel()), axis=1)
+    flatOutput = output.reshape(-1) # (view)
+    k = min(neighbours, len(samples))
+    for start in range(0, len(gridXY), chunkSize): # chunked, to keep the (gridpoints x samples) distance matrix reasonably sized
+        chunk = gridXY[start:start+chunkSize]
+        dist = np.hypot(chunk[:,None,0] - samples[None,:,0], chunk[:,None,1] - samples[None,:,1])
+        if(k < len(samples)):
+            nearIndices = np.argpartition(dist, k-1, axis=1)[:,0:k]
+            nearDist = np.take_along_axis(dist, nearIndices, axis=1)
+        else:
+            nearIndices = np.broadcast_to(np.arange(len(samples)), dist.shape);  nearDist = dist
+        weights = 1.0 / (np.maximum(nearDist, 1e-9) ** power) # (a sample right on top of the gridpoint gets such a large weight that it basically becomes the value)
+        values = (weights * samples[:,2][nearIndices]).sum(axis=1) / weights.sum(axis=1)
+        flatOutput[start:start+len(chunk)] = np.where(nearDist.min(axis=1) <= maxDist, values, np.nan)
+    return(output)
+
+def buildVolume(list4D:list[tuple[float,float,float,float]], resolution:float=0.1, extent:float|None=None, neighbours:int=8, power:float=2.0) -> dict[str,np.ndarray]:
+    """ interpolate all layers of one baud rate's data onto a regular grid. \n
+        'resolution' is the grid spacing (mm), 'extent' is the max |x| and |y| of the grid (None = just beyond the furthest sample) \n
+        returns {'x' : 1D array, 'y' : 1D array, 'z' : 1D array (layer heights), 'grid' : 3D array with shape (z,y,x), NaN where there is no data} """
+    layers = splitLayers(list4D)
+    if(extent is None):
+        extent = max([float(np.abs(layers[z][:,0:2]).max()) for z in layers] + [0.0]) + resolution
+    axis = np.arange(-round(extent/resolution), round(extent/resolution)+1) * resolution # symmetric around 0 (and includes 0 exactly)
+    grid = np.stack([interpolateLayer(layers[z], axis, axis, neighbours=neighbours, power=power) for z in layers]) if (len(layers) > 0) else np.zeros((0, len(axis), len(axis)))
+    return({'x' : axis, 'y' : axis.copy(), 'z' : np.array(list(layers.keys()), dtype=float), 'grid' : grid})
+
+def loadVolumes(filename:str, list5D:dict[int,list[tuple[float,float,float,float]]]|None=None, resolution:float=0.1, neighbours:int=8, power:float=2.0) -> dict[int,dict[str,np.ndarray]]:
+    """ get the interpolated volume (see buildVolume()) for every baud rate in a results file. \n
+        The volumes are cached in (filename + VOLUME_CACHE_SUFFIX), and only re-calculated if the results file (or the settings) changed. \n
+        'list5D' can be passed if the data is already loaded (to avoid reading the excel file again) """
+    cacheFilename = filename + VOLUME_CACHE_SUFFIX
+    sourceStat = os.stat(filename)
+    cacheKey = np.array([sourceStat.st_mtime, sourceStat.st_size, resolution, neighbours, power], dtype=float)
+    if(os.path.isfile(cacheFilename)):
+        try:
+            with np.load(cacheFilename) as cache:
+                if(np.array_equal(cache['cacheKey'], cacheKey)):
+                    return({int(baud) : {name : cache[str(baud)+'_'+name] for name in ('x','y','z','grid')} for baud in cache['bauds']})
+        except Exception as excep:
+            print("loadVolumes() couldn't read cache file (recalculating):", cacheFilename, excep)
+    if(list5D is None):
+        import IR_alignment_gcode as IRA # (only needed for readFromExcel())
+        list5D = IRA.readFromExcel(filename)
+    volumes = {baud : buildVolume(list5D[baud], resolution, neighbours=neighbours, power=power) for baud in list5D}
+    toSave = {'cacheKey' : cacheKey, 'bauds' : np.array(list(volumes.keys()), dtype=int)}
+    for baud in volumes:
+        for name in volumes[baud]:
+            toSave[str(baud)+'_'+name] = volumes[baud][name]
+    try:
+        np.savez_compressed(cacheFilename, **toSave)
+    except Exception as excep:
+        print("loadVolumes() couldn't write cache file:", cacheFilename, excep)
+    return(volumes)
+
+## metrics:
+def usableRadius(volume:dict[str,np.ndarray], threshold:float) -> np.ndarray:
+    """ for every layer, the radius (mm) of the largest circle around (0,0) in which all (covered) gridpoints are above 'threshold' \n
+        (0.0 if (0,0) itself fails. If nothing in the grid fails, the result is limited by the grid extent) """
+    meshX, meshY = np.meshgrid(volume['x'], volume['y'])
+    radii = np.hypot(meshX, meshY)
+    failing = ~(volume['grid'] >= threshold) # (NaN counts as failing, as there's no proof it works there)
+    return(np.where(failing, radii[None,:,:], radii.max()).min(axis=(1,2)))
+
+def maxWorkingDistance(volume:dict[str,np.ndarray], threshold:float) -> float:
+    """ the highest z (mm) at which any gridpoint is above 'threshold' (NaN if none are) """
+    passingLayers = (volume['grid'] >= threshold).any(axis=(1,2))
+    return(float(volume['z'][passingLayers].max()) if passingLayers.any() else np.nan)
+
+def centroidOffset(volume:dict[str,np.ndarray], threshold:float) -> tuple[np.ndarray, np.ndarray]:
+    """ the (measurement-weighted) x,y centroid of the area above 'threshold' \n
+        returns (per-layer centroids with shape (z,2) (NaN for layers with nothing above threshold),  average centroid over all layers with shape (2,)) """
+    meshX, meshY = np.meshgrid(volume['x'], volume['y'])
+    weights = np.where(volume['grid'] >= threshold, volume['grid'], 0.0)
+    totals = weights.sum(axis=(1,2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        perLayer = np.stack(((weights * meshX).sum(axis=(1,2)) / totals,  (weights * meshY).sum(axis=(1,2)) / totals), axis=1)
+    valid = totals > 0
+    return(perLayer, (perLayer[valid].mean(axis=0) if valid.any() else np.full(2, np.nan)))
+
+def alignmentMetrics(volume:dict[str,np.ndarray], threshold:float=0.9) -> dict:
+    """ all of the above metrics in one dict (for reports/comparisons) """
+    perLayerCentroid, meanCentroid = centroidOffset(volume, threshold)
+    return({'threshold' : threshold,
+            'z' : volume['z'],
+            'usableRadius' : usableRadius(volume, threshold),
+            'maxWorkingDistance' : maxWorkingDistance(volume, threshold),
+            'layerCentroids' : perLayerCentroid,
+            'centroidOffset' : meanCentroid})
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="interpolate alignment scan results and print tolerance metrics")
+    parser.add_argument("filenames", nargs='+', help="results file(s) (.xlsx)")
+    parser.add_argument("--threshold", type=float, default=0.9, help="success threshold (0~1) for the metrics")
+    parser.add_argument("--resolution", type=float, default=0.1, help="interpolation grid spacing (mm)")
+    args = parser.parse_args()
+    for filename in args.filenames:
+        volumes = loadVolumes(filename, resolution=args.resolution)
+        for baud in volumes:
+            metrics = alignmentMetrics(volumes[baud], args.threshold)
+            print(filename, " baud:", baud, " threshold:", metrics['threshold'])
+            print("  max working distance:", metrics['maxWorkingDistance'], "mm")
+            print("  centroid offset (x,y):", metrics['centroidOffset'].round(3), "mm")
+            for i in range(len(metrics['z'])):
+                print("  z:", str(round(metrics['z'][i],3)).rjust(7), "  usable radius:", str(round(metrics['usableRadius'][i],3)).rjust(6), "  centroid:", metrics['layerCentroids'][i].round(3))
@@ -0,0 +1,163 @@
+"""
+interactive comparison viewer for multiple results files (e.g. different boards or firmware, or a week of production runs).
+
+All files are loaded concurrently in a process pool. Parsed data is cached by file hash (see resultsCache.py),
+ and the interpolated volumes next to the results files (see alignmentAnalysis.py), so opening the same files again is fast.
+Every run is shown as a heatmap of one layer (z), with a difference map (compared to a reference run) underneath.
+The view is a regular cv2Drawer, so you can pan (middle-mouse drag) and zoom (scroll) through all of them.
+
+usage:  python compareViewer.py results_folder/ other_results.xlsx [--baud 9600] [--resolution 0.1] [--workers 8]
+
+controls:
+- ',' and '.' (or '[' and ']') : previous/next layer (z)
+- 'r' : make the run under the mouse the reference for the difference maps
+- 'd' : show/hide the difference maps
+- middle-mouse-button drag to move, scroll to zoom, 'g' for grid, 'z' for zoom mode, 'esc' to quit
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+NAN_COLOR = (80, 80, 80) # (BGR) color for places without data
+
+def _loadRunWorker(filename:str, baud:int|None, resolution:float, cacheDir:str|None) -> tuple[str,int|None,dict[str,np.ndarray]|None,str|None]:
+    """ (runs in a worker process) load one results file and interpolate it. returns (filename, baud, volume, error) """
+    try:
+        import resultsCache, alignmentAnalysis # (my own code)
+        arrays = resultsCache.loadResults(filename, (cacheDir if (cacheDir is not None) else resultsCache.DEFAULT_CACHE_DIR))
+        if(baud is None):
+            baud = tuple(arrays.keys())[0] # just use the first baud rate in the file
+        if(baud not in arrays):
+            return(filename, baud, None, "baud rate not in file (file has: "+str(tuple(arrays.keys()))+")")
+        return(filename, baud, alignmentAnalysis.loadVolumes(filename, arrays, resolution)[baud], None)
+    except Exception as excep:
+        return(filename, baud, None, repr(excep))
+
+def loadRuns(filenames:list[str], baud:int|None=None, resolution:float=0.1, cacheDir:str|None=None, workers:int|None=None) -> list[tuple[str,int,dict[str,np.ndarray]]]:
+    """ load (and interpolate) many results files in parallel. Returns [(filename, baud, volume), etc.] in the same order as 'filenames' (failed files are skipped) \n
+        'baud' None means the first baud rate in each file (which is the one that's returned) """
+    results:dict[str,tuple[int,dict[str,np.ndarray]]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_loadRunWorker, filename, baud, resolution, cacheDir) for filename in filenames]
+        for i, future in enumerate(as_completed(futures)):
+            filename, usedBaud, volume, error = future.result()
+            if(error is not None):
+                print("couldn't load", filename, ":", error)
+            else:
+                results[filename] = (usedBaud, volume)
+            print("loaded", i+1, "/", len(filenames), ":", os.path.basename(filename), ("" if (error is None) else "(FAILED)"))
+    return([(filename, *results[filename]) for filename in filenames if (filename in results)])
+
+def alignVolumes(volumes:list[dict[str,np.ndarray]], zDecimals:int=3) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ put volumes (with the same resolution, but different extents and layers) onto one common grid. \n
+        returns (axis (x and y), z (all layers of all volumes), 4D array with shape (run,z,y,x), NaN where a run has no data) """
+    biggest = max(volumes, key=lambda volume : len(volume['x']))
+    axis = biggest['x']
+    allZ = np.unique(np.concatenate([volume['z'] for volume in volumes]).round(zDecimals))
+    stacked = np.full((len(volumes), len(allZ), len(axis), len(axis)), np.nan)
+    for i, volume in enumerate(volumes):
+        pad = (len(axis) - len(volume['x'])) // 2 # the axes are symmetric around 0 with the same spacing, so a smaller grid is just the center of a bigger one
+        layerIndices = np.searchsorted(allZ, volume['z'].round(zDecimals))
+        stacked[i, layerIndices, pad:pad+len(volume['y']), pad:pad+len(volume['x'])] = volume['grid']
+    return(axis, allZ, stacked)
+
+def measurementColors(values:np.ndarray) -> np.ndarray:
+    """ measurement (0~1) to BGR image, red->yellow->green (same as the live view in IR_alignment_gcode.py) """
+    clipped = np.clip(np.nan_to_num(values, nan=0.0), 0.0, 1.0)
+    image = np.zeros(values.shape + (3,), dtype=np.uint8)
+    image[...,1] = np.minimum(255, clipped*512);  image[...,2] = np.minimum(255, 512-(clipped*512))
+    image[np.isnan(values)] = NAN_COLOR
+    return(image)
+
+def differenceColors(difference:np.ndarray) -> np.ndarray:
+    """ difference (-1~1) to BGR image, green = better than the reference, red = worse, black = the same """
+    clipped = np.clip(np.nan_to_num(difference, nan=0.0), -1.0, 1.0)
+    image = np.zeros(difference.shape + (3,), dtype=np.uint8)
+    image[...,1] = np.maximum(clipped, 0.0) * 255;  image[...,2] = np.maximum(-clipped, 0.0) * 255
+    image[np.isnan(difference)] = NAN_COLOR
+    return(image)
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    parser = argparse.ArgumentParser(description="compare multiple IR alignment results files side by side")
+    parser.add_argument("paths", nargs='+', help="results files (.xlsx) and/or folders containing them")
+    parser.add_argument("--baud", type=int, default=None, help="baud rate to show (default: the first one in each file)")
+    parser.add_argument("--resolution", type=float, default=0.1, help="interpolation grid spacing (mm)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--cache-dir", default=None, help="where to cache parsed files (default: resultsCache.DEFAULT_CACHE_DIR)")
+    args = parser.parse_args()
+
+    filenames:list[str] = []
+    for path in args.paths:
+        filenames += sorted(glob.glob(os.path.join(path, "*.xlsx"))) if os.path.isdir(path) else [path]
+    runs = loadRuns(filenames, args.baud, args.resolution, args.cache_dir, args.workers)
+    if(len(runs) < 1):
+        print("nothing to show");  exit()
+    runNames = [os.path.basename(filename) for filename, _, _ in runs]
+    axis, allZ, stacked = alignVolumes([volume for _, _, volume in runs])
+
+    import cv2Renderer as rend # (only import the GUI stuff once there's something to show)
+    try:
+        windowHandler = rend.cv2WindowHandler([1280, 720], "IR alignment comparison")
+        extent = float(axis[-1]) + (axis[1]-axis[0])/2 if (len(axis) > 1) else 1.0 # (half) the size of one heatmap (mm)
+        drawer = rend.cv2Drawer(windowHandler, sizeScale=(720 / (4.5*extent)))
+        viewState = {'layer' : 0, 'reference' : 0, 'showDiff' : True}
+        columns = max(int(np.ceil(len(runs) ** 0.5)), 1)
+        tileGap = extent * 0.4
+        def tileCenter(runIndex:int, isDiff:bool=False) -> np.ndarray:
+            """ the (real) center of a run's heatmap (the first run is centered at (0,0), so its coordinates are the actual offsets) """
+            rowHeight = (2*extent + tileGap) * (2 if viewState['showDiff'] else 1) + tileGap
+            return(np.array([(runIndex % columns) * (2*extent + tileGap),  -(runIndex // columns) * rowHeight - ((2*extent + tileGap) if isDiff else 0.0)]))
+        imageCache:dict[tuple,list[np.ndarray]] = {} # {(layer, reference) : [images]} (colors only need to be calculated when the layer/reference changes)
+        def layerImages() -> list[tuple[np.ndarray,np.ndarray]]:
+            key = (viewState['layer'], viewState['reference'])
+            if(key not in imageCache):
+                layerData = stacked[:, viewState['layer']]
+                imageCache[key] = [(measurementColors(layerData[i]), differenceColors(layerData[i] - layerData[viewState['reference']])) for i in range(len(runs))]
+            return(imageCache[key])
+        def runUnderMouse() -> tuple[int,np.ndarray]|None:
+            """ (index of the run under the mouse, mouse position relative to that run's center) """
+            mouseRealPos = drawer.pixelsToRealPos(windowHandler.mousePos)
+            for i in range(len(runs)):
+                for isDiff in ((False, True) if viewState['showDiff'] else (False,)):
+                    relPos = mouseRealPos - tileCenter(i, isDiff)
+                    if((abs(relPos[0]) <= extent) and (abs(relPos[1]) <= extent)):
+                        return(i, relPos)
+            return(None)
+        def keyHandler(keycode:int, drawer:rend.cv2Drawer):
+            char = chr(keycode)
+            if(char in ('.', ']')):     viewState['layer'] = min(viewState['layer'] + 1, len(allZ)-1)
+            elif(char in (',', '[')):   viewState['layer'] = max(viewState['layer'] - 1, 0)
+            elif(char == 'd'):          viewState['showDiff'] = not viewState['showDiff']
+            elif(char == 'r'):
+                hovered = runUnderMouse()
+                if(hovered is not None):  viewState['reference'] = hovered[0]
+        drawer.keyboardCallbackFunc = keyHandler
+
+        while(windowHandler.keepRunning):
+            drawer.background()
+            images = layerImages()
+            for i in range(len(runs)):
+                center = tileCenter(i)
+                drawer.drawImage(center - extent, center + extent, images[i][0])
+                drawer.drawText(center + np.array([-extent, extent + tileGap*0.2]), runNames[i], ([0,255,255] if (i == viewState['reference']) else None))
+                if(viewState['showDiff']):
+                    drawer.drawImage(tileCenter(i, True) - extent, tileCenter(i, True) + extent, images[i][1])
+            drawer.statStrings = ["layer: z=" + str(round(allZ[viewState['layer']],3)) + "mm  (" + str(viewState['layer']+1) + "/" + str(len(allZ)) + ")",
+                                  "reference: " + runNames[viewState['reference']]]
+            hovered = runUnderMouse()
+            if(hovered is not None):
+                runIndex, relPos = hovered
+                xIndex = int(np.argmin(np.abs(axis - relPos[0])));  yIndex = int(np.argmin(np.abs(axis - relPos[1])))
+                value = stacked[runIndex, viewState['layer'], yIndex, xIndex];  refValue = stacked[viewState['reference'], viewState['layer'], yIndex, xIndex]
+                drawer.statStrings.append(runNames[runIndex] + " @ " + str([round(float(axis[xIndex]),2), round(float(axis[yIndex]),2)]) + ": " + str(round(float(value),3)) + "  (reference: " + str(round(float(refValue),3)) + ")")
+            drawer.renderFG()
+            windowHandler.frameRefresh()
+    finally:
+        try:
+            windowHandler.end() # correctly shut down cv2 window
+        except Exception as excep:
+            print("couldn't run cv2 window end():", excep)
@@ -9,6 +9,7 @@ import cv2          # opencv-python
 import numpy as np  # general math library
 import time         # used for FPS counter
 from typing import Callable # justt used for a callback typehint
+from collections import OrderedDict # for the (LRU) text sprite cache
 
 
 ## some basic math functions for 2D cartesian systems:
@@ -37,6 +38,60 @@ def distAnglePosToPos(funcRadius, funcAngle, funcPos): #returns a new pos given
 ASA = lambda scalar, inputArray : [scalar + entry for entry in inputArray]
 
 
+class textSpriteCache():
+    """ cache of rendered text (small pre-colored images + masks), so text that doesn't change between frames only has to be rendered once. \n
+        Sprites are keyed by (string, font, scale, color, thickness, background color) and blitted with cv2.copyTo() (a masked copy), least-recently-used ones are evicted.
+        NOTE: the anti-aliased edges are blended with the background color when the sprite is rendered, so text on top of other things (grid lines) gets a (1 pixel) background-colored fringe """
+    def __init__(self, maxEntries:int=512, background=(0,0,0)):
+        self.maxEntries = maxEntries
+        self.background = background # the color the text is (usually) drawn on top of
+        self._sprites:OrderedDict[tuple,tuple[np.ndarray,np.ndarray,int,int,tuple[int,int]]] = OrderedDict() # {key : (image, mask, originX, originY, textSize)}
+        self._sizes:OrderedDict[tuple,tuple[int,int]] = OrderedDict() # {(string, font, scale, thickness) : textSize} (the size doesn't depend on the color)
+        self.hits = 0;  self.misses = 0 # (just for debugging)
+
+    def textSize(self, string:str, font:int, scale:float, thickness:int) -> tuple[int,int]:
+        """ same as cv2.getTextSize()[0] (but cached) """
+        key = (string, font, scale, thickness)
+        textSize = self._sizes.get(key)
+        if(textSize is None):
+            textSize = self._sizes[key] = cv2.getTextSize(string, font, scale, thickness)[0]
+            if(len(self._sizes) > self.maxEntries):
+                self._sizes.popitem(last=False)
+        else:
+            self._sizes.move_to_end(key)
+        return(textSize)
+
+    def _getSprite(self, string:str, font:int, scale:float, color, thickness:int) -> tuple[np.ndarray,np.ndarray,int,int,tuple[int,int]]:
+        key = (string, font, scale, tuple(color), thickness, tuple(self.background))
+        sprite = self._sprites.get(key)
+        if(sprite is not None):
+            self._sprites.move_to_end(key);  self.hits += 1
+            return(sprite)
+        self.misses += 1
+        textSize, baseline = cv2.getTextSize(string, font, scale, thickness)
+        padding = thickness + 1 # (the strokes can extend a little outside of the size getTextSize() reports)
+        origin = (padding, padding + textSize[1]) # (the bottom left of the text, like cv2.putText(), within the sprite)
+        mask = np.zeros((textSize[1] + baseline + 2*padding, textSize[0] + 2*padding), dtype=np.uint8)
+        cv2.putText(mask, string, origin, font, scale, 255, thickness)
+        image = np.empty(mask.shape + (3,), dtype=np.uint8);  image[:] = self.background
+        cv2.putText(image, string, origin, font, scale, color, thickness)
+        sprite = (image, mask, origin[0], origin[1], textSize)
+        self._sprites[key] = sprite
+        if(len(self._sprites) > self.maxEntries):
+            self._sprites.popitem(last=False) # evict the least recently used sprite
+        return(sprite)
+
+    def putText(self, image:np.ndarray, string:str, origin:tuple[int,int], font:int, scale:float, color, thickness:int):
+        """ same as cv2.putText() (origin is the bottom left corner of the text), but copies a cached sprite """
+        sprite, mask, originX, originY, _ = self._getSprite(string, font, scale, color, thickness)
+        left = int(origin[0]) - originX;  top = int(origin[1]) - originY
+        clipLeft = max(0, -left);  clipTop = max(0, -top) # (clip to the image)
+        clipRight = min(mask.shape[1], image.shape[1] - left);  clipBottom = min(mask.shape[0], image.shape[0] - top)
+        if((clipRight <= clipLeft) or (clipBottom <= clipTop)):
+            return # not on the image
+        cv2.copyTo(sprite[clipTop:clipBottom, clipLeft:clipRight], mask[clipTop:clipBottom, clipLeft:clipRight], image[top+clipTop:top+clipBottom, left+clipLeft:left+clipRight]) # (writes into the image slice)
+
+
 
 class cv2WindowHandler():
     """ a handler for a cv2 window. This class does not render things,
@@ -123,18 +178,19 @@ class cv2Drawer():
         # [255,220,  0] #light blue
 
         self.bgColor = [50,50,50] # dark gray
+        self.textCache = textSpriteCache(background=self.bgColor) # rendered text is cached, most strings don't change between frames
         
         self.normalFontColor = [200, 200, 200]
         self.normalFont = cv2.FONT_HERSHEY_SIMPLEX
         self.normalFontScale = 0.75
         self.normalFontThickness = 2
-        self.normalFontSize = lambda string : cv2.getTextSize(string, self.normalFont, self.normalFontScale, self.normalFontThickness)[0] # might break, if fontsizes change
+        self.normalFontSize = lambda string : self.textCache.textSize(string, self.normalFont, self.normalFontScale, self.normalFontThickness) # might break, if fontsizes change
         
         self.gridColor = [100,100,100] # light gray
         self.gridFont = self.normalFont
         self.gridFontScale = self.normalFontScale * (2/3) #
         self.gridFontThickness = 1
-        self.gridFontSize = lambda string : cv2.getTextSize(string, self.gridFont, self.gridFontScale, self.gridFontThickness)[0] # might break, if fontsizes change
+        self.gridFontSize = lambda string : self.textCache.textSize(string, self.gridFont, self.gridFontScale, self.gridFontThickness) # might break, if fontsizes change
         
         self.movingViewOffset = False
         self.prevViewOffset = (self.viewOffset[0], self.viewOffset[1])
@@ -251,7 +307,7 @@ class cv2Drawer():
             self.FPSdata = []
         for i in range(len(self.FPSstrings)):
             fontSize = self.normalFontSize(self.FPSstrings[i])
-            cv2.putText(self.windowHandler.window, self.FPSstrings[i], (int(self.drawOffset[0]+self.drawSize[0]-5-fontSize[0]),int(self.drawOffset[1]+((i+1)*(fontSize[1]+5)))), # cv2 uses bottom left corner for test pos
+            self.textCache.putText(self.windowHandler.window, self.FPSstrings[i], (int(self.drawOffset[0]+self.drawSize[0]-5-fontSize[0]),int(self.drawOffset[1]+((i+1)*(fontSize[1]+5)))), # cv2 uses bottom left corner for test pos
                         self.normalFont, self.normalFontScale, self.normalFontColor, self.normalFontThickness)
     
     def drawStatText(self):
@@ -266,14 +322,14 @@ class cv2Drawer():
         #             self.statStrings.append(entry)
         for i in range(len(self.statStrings)):
             fontSize = self.normalFontSize(self.statStrings[i])
-            cv2.putText(self.windowHandler.window, self.statStrings[i], (int(self.drawOffset[0]+5),int(self.drawOffset[1]+((i+1)*(fontSize[1]+5)))), 
+            self.textCache.putText(self.windowHandler.window, self.statStrings[i], (int(self.drawOffset[0]+5),int(self.drawOffset[1]+((i+1)*(fontSize[1]+5)))), 
                         self.normalFont, self.normalFontScale, self.normalFontColor, self.normalFontThickness)
     
     # def drawLoadedFilename(self):
     #     """shows the name of a loaded file in the corner of the screen"""
     #     if(len(self.lastFilename) > 0):
     #         fontSize = self.normalFontSize(self.lastFilename)
-    #         cv2.putText(self.windowHandler.window, self.lastFilename, (int(self.drawOffset[0]+self.drawSize[0]-5-fontSize[0]),int(self.drawOffset[1]+self.drawSize[1]-5)), 
+    #         self.textCache.putText(self.windowHandler.window, self.lastFilename, (int(self.drawOffset[0]+self.drawSize[0]-5-fontSize[0]),int(self.drawOffset[1]+self.drawSize[1]-5)), 
     #                     self.normalFont, self.normalFontScale, self.normalFontColor, self.normalFontThickness)
     
     #pixel conversion functions (the most important functions in here)
@@ -325,7 +381,7 @@ class cv2Drawer():
                     cv2.line(self.windowHandler.window, self.realToPixelPos(gridIttToPos(x,y)).astype(int), self.realToPixelPos(gridIttToPos(x,yMax)).astype(int), self.gridColor, lineWidth) # draw the vertical line
                     textToRender = str(round(gridIttToVal(0,x),   len(str(gridSpacing)[max(str(gridSpacing).rfind('.')+1, 0):]))) # a needlessly difficult way of rounding to the same number of decimals as the number in the gridSpacings array
                     fontSize = self.gridFontSize(textToRender)
-                    cv2.putText(self.windowHandler.window, textToRender, (int(self.realToPixelPos(gridIttToPos(x,y))[0]+5),int(self.drawOffset[1]+self.drawSize[1]-fontSize[1])), # display the text at the bottom of the screen and to the right of the line
+                    self.textCache.putText(self.windowHandler.window, textToRender, (int(self.realToPixelPos(gridIttToPos(x,y))[0]+5),int(self.drawOffset[1]+self.drawSize[1]-fontSize[1])), # display the text at the bottom of the screen and to the right of the line
                                 self.gridFont, self.gridFontScale, self.gridColor, self.gridFontThickness)
                     break # line is drawn, stop this loop
             return(True)
@@ -347,7 +403,7 @@ class cv2Drawer():
                     cv2.line(self.windowHandler.window, self.realToPixelPos(gridIttToPos(x,y)).astype(int), self.realToPixelPos(gridIttToPos(xMax,y)).astype(int), self.gridColor, lineWidth) # draw the horizontal line
                     textToRender = str(round(gridIttToVal(1,y),   len(str(gridSpacing)[max(str(gridSpacing).rfind('.')+1, 0):]))) # a needlessly difficult way of rounding to the same number of decimals as the number in the gridSpacings array
                     fontSize = self.gridFontSize(textToRender)
-                    cv2.putText(self.windowHandler.window, textToRender, (int(self.drawOffset[0]+self.drawSize[0]-5-fontSize[0]),int(self.realToPixelPos(gridIttToPos(x,y))[1]+fontSize[1]+5)), # display the text at the right side of the screen and to the right of the line
+                    self.textCache.putText(self.windowHandler.window, textToRender, (int(self.drawOffset[0]+self.drawSize[0]-5-fontSize[0]),int(self.realToPixelPos(gridIttToPos(x,y))[1]+fontSize[1]+5)), # display the text at the right side of the screen and to the right of the line
                                 self.gridFont, self.gridFontScale, self.gridColor, self.gridFontThickness)
                     break # line is drawn, stop this loop
             return(True)
@@ -383,6 +439,29 @@ class cv2Drawer():
     def drawCircle(self, realPos: np.ndarray, radius: float, color=[255, 255, 255], fill=True):
         cv2.circle(self.windowHandler.window, self.realToPixelPos(realPos).astype(int), int(radius * self.sizeScale), color, (-1 if fill else 3))
 
+    def drawImage(self, realMin: np.ndarray, realMax: np.ndarray, image: np.ndarray):
+        """draw an image (BGR, uint8) stretched over a (real) rectangle, with nearest-neighbour scaling.
+            image[0,0] is the pixel at realMin (the lowest x and y), so for a regular (y,x) indexed data grid you don't need to flip anything.
+            Only the visible part is scaled, so this stays fast at any zoom level"""
+        cornerOne = self.realToPixelPos(realMin);  cornerTwo = self.realToPixelPos(realMax)
+        pixelMin = np.minimum(cornerOne, cornerTwo);  pixelMax = np.maximum(cornerOne, cornerTwo)
+        visibleMin = np.maximum(pixelMin, self.drawOffset).astype(int) # clip to the draw area
+        visibleMax = np.minimum(pixelMax, (self.drawOffset[0]+self.drawSize[0], self.drawOffset[1]+self.drawSize[1])).astype(int)
+        if((visibleMax[0] <= visibleMin[0]) or (visibleMax[1] <= visibleMin[1])):
+            return # not on screen
+        ## map every visible (window) pixel back to a source pixel
+        columns = (((np.arange(visibleMin[0], visibleMax[0]) + 0.5 - pixelMin[0]) / max(pixelMax[0]-pixelMin[0], 1e-9)) * image.shape[1]).astype(int).clip(0, image.shape[1]-1)
+        rows    = (((np.arange(visibleMin[1], visibleMax[1]) + 0.5 - pixelMin[1]) / max(pixelMax[1]-pixelMin[1], 1e-9)) * image.shape[0]).astype(int).clip(0, image.shape[0]-1)
+        if(self.invertYaxis):
+            rows = (image.shape[0]-1) - rows # the top of the screen is the highest y
+        self.windowHandler.window[visibleMin[1]:visibleMax[1], visibleMin[0]:visibleMax[0]] = image[rows[:,None], columns[None,:]]
+
+    def drawText(self, realPos: np.ndarray, text: str, color=None):
+        """draw text (with the normal font) with its bottom left corner at a (real) position"""
+        pixelPos = self.realToPixelPos(realPos).astype(int)
+        if(self.isInsideWindowPixels(pixelPos)):
+            self.textCache.putText(self.windowHandler.window, text, (int(pixelPos[0]), int(pixelPos[1])), self.normalFont, self.normalFontScale, (self.normalFontColor if (color is None) else color), self.normalFontThickness)
+
     def redraw(self):
         """draw all elements"""
         drawSpeedTimers = [('start', time.time()),]
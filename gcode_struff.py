@@ -15,6 +15,8 @@ GCODE_GET_CURRENT_POSITION = b'M114\n'
 GCODE_DISABLE_STEPPERS = b'M18\n' # (M84 does the same thing) disables steppers
 GCODE_DISABLE_AUTO_REPORT_POSITION = b'M154 S0\n'
 GCODE_DISABLE_AUTO_REPORT_TEMPERATURE = b'M155 S0\n'
+GCODE_WAIT_FOR_MOVES = b'M400\n' # Marlin only responds 'ok' to this once all (buffered) moves are finished
+GCODE_FIRMWARE_INFO = b'M115\n' # Marlin responds with 'FIRMWARE_NAME:Marlin ...' (and more), used to recognise the printer
 GCODE_MARLIN_OK = b'ok\n' # (not Gcode) Marlin FW should respond with 'ok'(+LF) to any acceptable command
 def G0(xyzPos: tuple[float,float,float], feedrate:float=(-1), decimals:int=3):
     """ construct G0 (linear move) command. \n
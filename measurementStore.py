@@ -0,0 +1,114 @@
+"""
+bounded-memory storage for measurement data (for very long runs).
+
+A measurementStore can be used instead of a list in list5D: it supports append(), len(), indexing/slicing and iterating, just like a list of rows.
+The newest 'ringSize' rows live in a (fixed-size) numpy ring buffer, which is what the live rendering and the spiral continuation checks use.
+Older rows are spilled (in blocks) to a memory-mapped file on disk, so RAM usage stays the same no matter how long a run lasts
+ (the OS pages the spilled data in if something, like saving to excel, reads it again).
+
+usage:
+    list5D = {baud : measurementStore(columns=4) for baud in baudRatesToTest}
+    list5D[baud].append((x, y, z, measurement))
+    recentRows = list5D[baud].recent(200) # np.ndarray with shape (<=200, columns), oldest first
+"""
+
+import os
+import tempfile
+import numpy as np
+
+class measurementStore():
+    """ list-like storage of (fixed length) measurement rows, with a RAM ring buffer for the newest rows and a memory-mapped file for the rest """
+    def __init__(self, columns:int=4, ringSize:int=4096, spillDirectory:str|None=None):
+        self.columns = columns # number of values per row (4 for [x,y,z,data], 5 for duplex data)
+        self.ringSize = ringSize # number of rows kept in RAM
+        self.spillDirectory = spillDirectory # where to put the spill file (None means the system's temp folder)
+        self._ring = np.full((ringSize, columns), np.nan) # row i (of the whole store) is at self._ring[i % ringSize]
+        self._count = 0 # total number of rows
+        self._ringStart = 0 # index of the oldest row still in the ring buffer (every row before it has been spilled)
+        self._spillBlock = max(ringSize // 4, 1) # number of rows to spill at once
+        self._spillFilename: str|None = None # (the file is only created once something is spilled)
+        self._spill: np.memmap|None = None
+        self._spillCapacity = 0 # (rows)
+
+    def __len__(self) -> int:
+        return(self._count)
+
+    def _growSpill(self, requiredRows:int):
+        """ make sure the spill file can hold at least 'requiredRows' rows (doubles its size when needed) """
+        if(requiredRows <= self._spillCapacity):
+            return
+        newCapacity = max(requiredRows, self._spillCapacity * 2, self._spillBlock * 4)
+        if(self._spillFilename is None):
+            fileHandle, self._spillFilename = tempfile.mkstemp(suffix=".spill", dir=self.spillDirectory)
+            os.close(fileHandle)
+        if(self._spill is not None):
+            self._spill.flush();  self._spill = None # (release the old mapping before resizing the file)
+        with open(self._spillFilename, 'r+b') as spillFile:
+            spillFile.truncate(newCapacity * self.columns * np.dtype(float).itemsize)
+        self._spill = np.memmap(self._spillFilename, dtype=float, mode='r+', shape=(newCapacity, self.columns))
+        self._spillCapacity = newCapacity
+
+    def append(self, row):
+        """ add a row (shorter rows are padded with NaN) """
+        if(len(row) > self.columns):
+            raise(ValueError("measurementStore row has more than "+str(self.columns)+" values: "+str(row)))
+        if((self._count - self._ringStart) >= self.ringSize): # ring buffer is full, spill the oldest block
+            spillCount = min(self._spillBlock, self._count - self._ringStart)
+            self._growSpill(self._ringStart + spillCount)
+            ringIndices = np.arange(self._ringStart, self._ringStart + spillCount) % self.ringSize
+            self._spill[self._ringStart:self._ringStart+spillCount] = self._ring[ringIndices]
+            self._ringStart += spillCount
+        ringRow = self._ring[self._count % self.ringSize]
+        ringRow[:] = np.nan;  ringRow[0:len(row)] = row
+        self._count += 1
+
+    def _rows(self, start:int, stop:int) -> np.ndarray:
+        """ rows [start:stop] (positive indices, start <= stop) as an array """
+        output = np.empty((stop - start, self.columns))
+        spilledStop = min(stop, self._ringStart)
+        if(start < spilledStop):
+            output[0:spilledStop-start] = self._spill[start:spilledStop]
+        ringStart = max(start, self._ringStart)
+        if(ringStart < stop):
+            output[ringStart-start:] = self._ring[np.arange(ringStart, stop) % self.ringSize]
+        return(output)
+
+    def __getitem__(self, index:int|slice):
+        """ a row (as a tuple), or a list of rows for slices (just like a list) """
+        if(isinstance(index, slice)):
+            start, stop, step = index.indices(self._count)
+            if(step != 1):
+                return([self[i] for i in range(start, stop, step)])
+            return([tuple(row) for row in self._rows(start, max(start, stop)).tolist()])
+        if(index < 0):
+            index += self._count
+        if((index < 0) or (index >= self._count)):
+            raise(IndexError("measurementStore index out of range"))
+        if(index >= self._ringStart):
+            return(tuple(self._ring[index % self.ringSize].tolist()))
+        return(tuple(self._spill[index].tolist()))
+
+    def __iter__(self):
+        for start in range(0, self._count, self.ringSize): # (in blocks, so spilled data is read efficiently)
+            for row in self._rows(start, min(start + self.ringSize, self._count)).tolist():
+                yield(tuple(row))
+
+    def recent(self, count:int) -> np.ndarray:
+        """ the newest 'count' rows (at most ringSize) as an array with shape (<=count, columns), oldest first """
+        count = min(count, self._count - self._ringStart)
+        return(self._ring[np.arange(self._count - count, self._count) % self.ringSize])
+
+    def toArray(self) -> np.ndarray:
+        """ all rows as one array with shape (len, columns) """
+        return(self._rows(0, self._count))
+
+    def close(self):
+        """ delete the spill file (the store is empty afterwards) """
+        self._spill = None
+        if(self._spillFilename is not None):
+            try:
+                os.remove(self._spillFilename)
+            except Exception as excep:
+                print("measurementStore couldn't remove spill file:", self._spillFilename, excep)
+        self._spillFilename = None;  self._spillCapacity = 0
+        self._count = 0;  self._ringStart = 0
@@ -0,0 +1,146 @@
+"""
+motion-completion detection for the 3D printer.
+
+Waiting for the (1/15s) M114 position poll to match the desired position wastes up to a full poll interval per measurement point.
+This module figures out when the head has actually arrived (and settled) with minimal latency, by combining:
+- M400 acknowledgements: Marlin only responds 'ok' to M400 once all buffered moves are finished
+- a trapezoidal move-time model (from feedrate and acceleration): predicts when the move should be done (used as a fallback if M400 never answers)
+- position reports (M114): one final position readout confirms the head is where it should be
+
+NOTE: while an M400 is outstanding, the printer will not respond to anything else (M114 included),
+      so other printer commands should be held back untill 'busy' is False
+"""
+
+from __future__ import annotations # (so the serial import below is only needed for type-checkers, not at runtime)
+import time
+from typing import Callable, TYPE_CHECKING # just for type-hints
+if(TYPE_CHECKING):
+    import serial
+
+import gcode_struff as GC # (my own code) placed in a seperate file for legibility
+
+def trapezoidMoveTime(distance:float, feedrate:float, acceleration:float) -> float:
+    """ estimate how long a single linear move takes, assuming a trapezoidal velocity profile (accelerate, cruise, decelerate) \n
+        'distance' in millimeters, 'feedrate' in millimeters/minute, 'acceleration' in millimeters/second^2 \n
+        (junction deviation/jerk makes real moves a little faster, so this is slightly pessimistic, which is fine) """
+    distance = abs(distance);  speed = feedrate / 60.0 # mm/min -> mm/s
+    if((distance <= 0.0) or (speed <= 0.0) or (acceleration <= 0.0)):
+        return(0.0) # nothing to estimate
+    if(distance >= ((speed**2) / acceleration)): # trapezoid (reaches cruising speed). Accelerating and decelerating take v^2/(2a) mm each
+        return((distance / speed) + (speed / acceleration))
+    else: # triangle (never reaches cruising speed)
+        return(2.0 * ((distance / acceleration) ** 0.5))
+
+class motionCompletionTracker():
+    """ keeps track of issued moves and signals when the head has arrived and settled \n
+        usage: call moveIssued() after every G0 that got an 'ok', then requestCompletion() after the last one, then update() (non-blocking) every loop """
+    def __init__(self, printerSerial:serial.Serial, positionFunc:Callable[[], tuple[bool,tuple[float,float,float],tuple[float,float,float]]],
+                 acceleration:float=500.0, defaultFeedrate:float=1200.0, settleDelay:float=0.0, posMatchThresh:float=0.04, fallbackMargin:float=1.0, pollInterval:float=1/15):
+        self.printerSerial = printerSerial
+        self.positionFunc = positionFunc # function that returns the output of getCurrentPosition() (in absolute coordinates)
+        self.acceleration = acceleration # (mm/s^2) should match the printer's (M201/M204) settings, roughly
+        self.defaultFeedrate = defaultFeedrate # (mm/min) used when a move doesn't specify a feedrate (G0 without F keeps the last feedrate, so this is just an estimate)
+        self.settleDelay = settleDelay # (s) extra time to wait after the head stopped, to let mechanical vibrations die down
+        self.posMatchThresh = posMatchThresh # (mm) sum of error should not exceed this value for the position report to be considered a match
+        self.fallbackMargin = fallbackMargin # (s) how long after the predicted move end to keep waiting for the M400 'ok' before falling back to position polling
+        self.pollInterval = pollInterval # (s) interval between position polls (only used in fallback mode)
+
+        self.lastTarget: list[float,float,float]|None = None # the (absolute) target of the last issued move
+        self.lastFeedrate: float = defaultFeedrate
+        self.positionFeedback: tuple[bool,tuple[float,float,float],tuple[float,float,float]] = (False, (0,0,0), (0,0,0)) # the last position report this class requested
+        self.positionFeedbackTime: float = 0.0 # when positionFeedback was last updated (so the user can tell whether it's new)
+
+        self.moveStartTime: float = time.time() # when the first move (of the current set of moves) was issued
+        self.predictedDoneTime: float = time.time() # when the move-time model thinks the head should be done moving
+        self.waitingForM400 = False # whether an M400 'ok' is outstanding
+        self._M400readData = b''
+        self.motionDoneTime: float|None = None # when motion completion was detected (M400 'ok' or fallback position match)
+        self.arrived = True # whether the head has arrived and settled (nothing is moving at init)
+        self._fallbackPollTimer = 0.0
+
+        self.lastSettleTime: float = -1.0 # (s) measured time from issuing the (first) move untill arrived-and-settled, for the last point
+        self.lastPredictedTime: float = -1.0 # (s) what the move-time model predicted for the last point (for comparison/debugging)
+        self.settleTimes: list[float] = [] # lastSettleTime for every point so far
+
+    @property
+    def busy(self) -> bool:
+        """ whether the printer serial port is occupied by an outstanding M400 (don't send other commands while this is True) """
+        return(self.waitingForM400)
+
+    def moveIssued(self, targetPos:tuple[float,float,float], feedrate:float=(-1), fromPos:tuple[float,float,float]|None=None):
+        """ register a G0 move (absolute position) that the printer has accepted. Consecutive moves are chained (in the move-time model) """
+        if((fromPos is None) and (self.lastTarget is None) and (not self.waitingForM400)): # (e.g. after homing) the start position is unknown, so just ask
+            self.positionFeedback = self.positionFunc();  self.positionFeedbackTime = time.time()
+        if(fromPos is None):
+            fromPos = self.lastTarget if (self.lastTarget is not None) else (self.positionFeedback[2] if self.positionFeedback[0] else targetPos)
+        if(feedrate > 0):
+            self.lastFeedrate = feedrate # G0 without F uses the previous feedrate
+        now = time.time()
+        if(self.arrived): # first move of a new set
+            self.moveStartTime = now;  self.predictedDoneTime = now
+            self.arrived = False;  self.motionDoneTime = None
+        distance = sum([(targetPos[i] - fromPos[i])**2 for i in range(3)]) ** 0.5
+        self.predictedDoneTime = max(now, self.predictedDoneTime) + trapezoidMoveTime(distance, self.lastFeedrate, self.acceleration) # moves are executed one after the other
+        self.lastTarget = [float(targetPos[i]) for i in range(3)]
+
+    def requestCompletion(self):
+        """ send M400, after which the printer will respond 'ok' as soon as all moves are finished """
+        if(self.waitingForM400):
+            return # one is enough
+        self.printerSerial.write(GC.GCODE_WAIT_FOR_MOVES)
+        self.waitingForM400 = True;  self._M400readData = b''
+
+    def reset(self):
+        """ forget about the issued moves (e.g. after homing, when the position is unknown). NOTE: an outstanding M400 'ok' is not read anymore """
+        self.lastTarget = None
+        self.waitingForM400 = False;  self._M400readData = b''
+        self.motionDoneTime = None;  self.arrived = True
+
+    def markArrived(self):
+        """ declare the head arrived, for when the caller confirmed the position some other way (e.g. its own position reports, without an M400) """
+        self.motionDoneTime = time.time();  self.arrived = True
+
+    def _positionMatches(self) -> bool:
+        self.positionFeedback = self.positionFunc();  self.positionFeedbackTime = time.time()
+        if((not self.positionFeedback[0]) or (self.lastTarget is None)):
+            return(self.lastTarget is None) # no target means nothing to match against
+        return(sum([abs(self.positionFeedback[2][i] - self.lastTarget[i]) for i in range(3)]) <= self.posMatchThresh)
+
+    def update(self) -> bool:
+        """ non-blocking check for motion completion (call this often). Returns whether the head has arrived and settled """
+        if(self.arrived):
+            return(True)
+        now = time.time()
+        if(self.motionDoneTime is None):
+            if(self.waitingForM400):
+                if(self.printerSerial.in_waiting > 0):
+                    self._M400readData += self.printerSerial.read(self.printerSerial.in_waiting)
+                if(GC.GCODE_MARLIN_OK in self._M400readData):
+                    self.waitingForM400 = False
+                    if(self._positionMatches()): # confirm with a single position report
+                        self.motionDoneTime = now
+                    else:
+                        print("motionCompletionTracker: M400 done, but position doesn't match (yet?):", self.positionFeedback[2], "!=", self.lastTarget)
+                elif(now > (self.predictedDoneTime + self.fallbackMargin)): # M400 'ok' is taking way longer than the model predicted
+                    print("motionCompletionTracker: no M400 response, falling back to position polling. received:", self._M400readData)
+                    self.waitingForM400 = False # NOTE: if the 'ok' still arrives later, the next printer response will be a little garbled
+            elif(((now - self._fallbackPollTimer) > self.pollInterval) and (now >= self.predictedDoneTime)): # fallback: position polling (only after the model says it's probably done)
+                self._fallbackPollTimer = now
+                if(self._positionMatches()):
+                    self.motionDoneTime = now
+        if((self.motionDoneTime is not None) and ((now - self.motionDoneTime) >= self.settleDelay)):
+            self.arrived = True
+            self.lastSettleTime = now - self.moveStartTime
+            self.lastPredictedTime = self.predictedDoneTime - self.moveStartTime
+            self.settleTimes.append(self.lastSettleTime)
+        return(self.arrived)
+
+    def waitUntilArrived(self, timeout:float=30.0) -> bool:
+        """ blocking version of update() (for code that has nothing better to do in the meantime). Returns False on timeout """
+        startTime = time.time()
+        while(not self.update()):
+            if((time.time() - startTime) > timeout):
+                print("motionCompletionTracker: waitUntilArrived() timed out")
+                return(False)
+            time.sleep(0.001)
+        return(True)
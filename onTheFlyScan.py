@@ -0,0 +1,187 @@
+"""
+continuous-motion ("on the fly") scanning.
+
+Instead of stop-and-go (move, wait, test 256 bytes, move again), the head follows the spiral continuously at a low feedrate,
+ while a seperate thread streams IR bytes nonstop. Every byte result is timestamped, and so is every position report (M114),
+ so afterwards each byte can be tagged with an (interpolated) position. The bytes are then binned into a grid, and the success rate
+ per bin becomes one measurement point (same [x,y,z,data] format as the stop-and-go data).
+This is meant for coarse mapping: it samples way more points per minute, at the cost of some positional accuracy.
+
+How moves are sent: only enough path segments are sent to keep about 'lookahead' seconds of motion queued (using the move-time model),
+ so the printer's planner buffer never fills up, and M114 requests get answered right away in between.
+"""
+
+import time
+import threading
+import bisect
+import numpy as np
+
+import gcode_struff as GC # (my own code)
+import motionCompletion as MC # (my own code) for the move-time model and waiting for arrival
+
+def binByteResults(xyPos:np.ndarray, success:np.ndarray, binSize:float, minSamples:int=4) -> np.ndarray:
+    """ bin (timestamped and positioned) byte results into a square grid. \n
+        'xyPos' has shape (N,2), 'success' has shape (N,) (booleans or 0/1) \n
+        returns np.array([[binCenterX, binCenterY, successRate, sampleCount], etc.]) for every bin with at least 'minSamples' bytes """
+    if(len(success) < 1):
+        return(np.zeros((0,4)))
+    binIndices = np.round(np.asarray(xyPos) / binSize).astype(int)
+    uniqueBins, inverse = np.unique(binIndices, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse, minlength=len(uniqueBins))
+    sums = np.bincount(inverse, weights=np.asarray(success, dtype=float), minlength=len(uniqueBins))
+    keep = counts >= minSamples
+    return(np.column_stack((uniqueBins[keep] * binSize, sums[keep] / counts[keep], counts[keep])))
+
+class IRbyteStreamer(threading.Thread):
+    """ (thread) sends IR bytes nonstop and records the (timestamped) result of every byte """
+    def __init__(self, IR_TX_serial, IR_RX_serial=None):
+        super().__init__(daemon=True)
+        self.IR_TX_serial = IR_TX_serial
+        self.IR_RX_serial = (IR_RX_serial if (IR_RX_serial is not None) else IR_TX_serial)
+        self.times:list[float] = [] # time.perf_counter() at the moment each byte result was known
+        self.results:list[bool] = [] # whether each byte was echoed correctly
+        self._listLock = threading.Lock() # (so discardBefore() can't end up between the two appends)
+        self.keepRunning = True
+
+    def run(self):
+        byteValue = 0
+        while(self.keepRunning):
+            data = byteValue.to_bytes(1,'big')
+            self.IR_TX_serial.write(data)
+            readData = self.IR_RX_serial.read(1)
+            if(self.IR_RX_serial.in_waiting > 0): # excess/late data, just discard it (same as IRresponseTest())
+                self.IR_RX_serial.read(self.IR_RX_serial.in_waiting)
+            with self._listLock:
+                self.times.append(time.perf_counter());  self.results.append(readData == data)
+            byteValue = (byteValue + 1) % 256
+
+    def discardBefore(self, index:int):
+        """ forget the byte results before 'index' (once they're binned), so the lists don't grow for the whole run. NOTE: indices shift down by 'index' """
+        with self._listLock:
+            del self.times[:index];  del self.results[:index]
+
+    def stop(self):
+        self.keepRunning = False
+        self.join(1.0)
+
+class onTheFlyScanner():
+    """ runs a continuous-motion scan (blocking). Uses the same (spiral) settings as scanPlanner.spiralScanPlanner """
+    def __init__(self, printerSerial, IR_TX_serial, IR_RX_serial, positionOffset:tuple[float,float,float], planner,
+                 scanFeedrate:float=60.0, travelFeedrate:float=1200.0, acceleration:float=500.0, segmentLength:float=0.25, lookahead:float=1.0, binSize:float|None=None, minBinSamples:int=4, motionTracker=None):
+        import IR_alignment_gcode as IRA # (my own code) for getCurrentPosition() and waitForOK()
+        self._IRA = IRA
+        self.printerSerial = printerSerial
+        self.IR_TX_serial = IR_TX_serial;  self.IR_RX_serial = IR_RX_serial
+        self.positionOffset = positionOffset # the (relative->absolute) 0-position
+        self.planner = planner # a scanPlanner.spiralScanPlanner, for its settings and spiral shape
+        self.scanFeedrate = scanFeedrate # (mm/min) speed while scanning (low, so the bins get enough bytes)
+        self.travelFeedrate = travelFeedrate # (mm/min) speed for moves between layers
+        self.acceleration = acceleration # (mm/s^2) for the move-time model
+        self.segmentLength = segmentLength # (mm) length of the linear moves that make up the spiral
+        self.lookahead = lookahead # (s) how much (predicted) motion to keep queued in the printer
+        self.binSize = (binSize if ((binSize is not None) and (binSize > 0)) else planner.horizontalStepsize) # (mm) size of the (square) bins
+        self.minBinSamples = minBinSamples # bins with fewer bytes than this are discarded
+        self.motionTracker = (motionTracker if (motionTracker is not None) else MC.motionCompletionTracker(printerSerial, lambda : IRA.getCurrentPosition(printerSerial), acceleration, travelFeedrate)) # (can be shared with the caller)
+        self.layerStats:list[dict] = [] # some statistics for every layer (for debugging/throughput comparisons)
+
+    def spiralPath(self) -> tuple[np.ndarray, np.ndarray]:
+        """ the spiral as (relative x,y) points spaced (about) segmentLength apart. Returns (points with shape (N,2), spiral angles with shape (N,)) """
+        angles = [0.0];  maxAngle = (self.planner.horizontalDistMax / self.planner.horizontalStepsize) * 2*np.pi
+        while(angles[-1] < maxAngle):
+            radius = (angles[-1]/(2*np.pi)) * self.planner.horizontalStepsize
+            angles.append(angles[-1] + ((self.segmentLength / radius) if (radius > self.segmentLength) else np.deg2rad(30))) # constant-arc-length (except near the center)
+        angles = np.array(angles)
+        return(np.array([self.planner.spiralPos(angle) for angle in angles]), angles)
+
+    def _moveTo(self, relPos, feedrate:float, requestCompletion:bool=True) -> float:
+        """ send a G0 move (relative to positionOffset), returns the predicted duration of the move """
+        absPos = [relPos[i] + self.positionOffset[i] for i in range(3)]
+        self.printerSerial.write(GC.G0(absPos, feedrate))
+        success, readData = self._IRA.waitForOK(self.printerSerial)
+        if(not success):  print("onTheFlyScanner move unsuccessfull! waitForOK() returned:", readData)
+        fromPos = self.motionTracker.lastTarget
+        self.motionTracker.moveIssued(absPos, feedrate)
+        if(requestCompletion):
+            self.motionTracker.requestCompletion()
+        return(MC.trapezoidMoveTime(sum([(absPos[i] - fromPos[i])**2 for i in range(3)]) ** 0.5, feedrate, self.acceleration) if (fromPos is not None) else 0.0)
+
+    def _positionBytes(self, streamer:IRbyteStreamer, startIndex:int, endIndex:int, feedTimes:list[float], feedPositions:list[tuple[float,float]]) -> tuple[np.ndarray,np.ndarray]:
+        """ tag byte results (streamer.results[startIndex:endIndex]) with interpolated positions. Returns (xy with shape (N,2), success with shape (N,)) """
+        byteTimes = np.array(streamer.times[startIndex:endIndex]);  success = np.array(streamer.results[startIndex:endIndex], dtype=bool)
+        if((len(feedTimes) < 2) or (len(byteTimes) < 1)):
+            return(np.zeros((0,2)), np.zeros(0, dtype=bool))
+        feedTimesNp = np.array(feedTimes);  feedPositionsNp = np.array(feedPositions)
+        valid = (byteTimes >= feedTimesNp[0]) & (byteTimes <= feedTimesNp[-1]) # no extrapolating
+        xy = np.column_stack((np.interp(byteTimes[valid], feedTimesNp, feedPositionsNp[:,0]), np.interp(byteTimes[valid], feedTimesNp, feedPositionsNp[:,1])))
+        return(xy, success[valid])
+
+    def scanLayer(self, z:float, streamer:IRbyteStreamer) -> np.ndarray:
+        """ scan one layer (starts at the center, ends wherever the spiral stopped), returns the binned results (see binByteResults()) """
+        path, angles = self.spiralPath()
+        rotationEnds = [i for i in range(1, len(angles)) if (int(angles[i] / (2*np.pi)) > int(angles[i-1] / (2*np.pi)))] # the first path index of every new rotation
+        ## move to the start of the layer (vertical move first, which the printer likes a little better)
+        if(self.motionTracker.lastTarget is not None):
+            self._moveTo([self.motionTracker.lastTarget[0]-self.positionOffset[0], self.motionTracker.lastTarget[1]-self.positionOffset[1], z], self.travelFeedrate, False)
+        self._moveTo([path[0][0], path[0][1], z], self.travelFeedrate)
+        self.motionTracker.waitUntilArrived()
+        layerStartTime = time.perf_counter();  startIndex = len(streamer.results)
+        feedTimes:list[float] = [];  feedPositions:list[tuple[float,float]] = []
+        segmentIndex = 1;  predictedEnd = time.perf_counter();  segmentEnds:list[float] = [predictedEnd]
+        rotationsChecked = 0;  stopping = False
+        while(True):
+            now = time.perf_counter()
+            if((segmentIndex < len(path)) and (not stopping) and ((predictedEnd - now) < self.lookahead)): # keep just enough motion queued
+                predictedEnd = max(now, predictedEnd) + self._moveTo([path[segmentIndex][0], path[segmentIndex][1], z], self.scanFeedrate, False)
+                segmentEnds.append(predictedEnd);  segmentIndex += 1
+                continue
+            ## in the meantime, record the position (as often as possible)
+            requestTime = time.perf_counter()
+            success, _, currentPos = self._IRA.getCurrentPosition(self.printerSerial)
+            if(success):
+                feedTimes.append((requestTime + time.perf_counter()) / 2);  feedPositions.append((currentPos[0]-self.positionOffset[0], currentPos[1]-self.positionOffset[1]))
+            ## check whether the last (completed) rotation found anything
+            if((rotationsChecked < len(rotationEnds)) and (rotationEnds[rotationsChecked] < segmentIndex) and (segmentEnds[rotationEnds[rotationsChecked]-1] < time.perf_counter())):
+                rotationStart = (segmentEnds[rotationEnds[rotationsChecked-1]-1] if (rotationsChecked > 0) else layerStartTime)
+                rotationEnd = segmentEnds[rotationEnds[rotationsChecked]-1]
+                rotationStartIndex = bisect.bisect_left(streamer.times, rotationStart, lo=startIndex) # (the byte times are sorted)
+                rotationEndIndex = bisect.bisect_right(streamer.times, rotationEnd, lo=rotationStartIndex)
+                if(rotationEndIndex > rotationStartIndex):
+                    xy, rotationSuccess = self._positionBytes(streamer, rotationStartIndex, rotationEndIndex, feedTimes, feedPositions)
+                    binned = binByteResults(xy, rotationSuccess, self.binSize, self.minBinSamples)
+                    if((rotationsChecked > 0) and ((len(binned) == 0) or (binned[:,2].max() <= self.planner.continuationThresh))):
+                        stopping = True # no real data in the past rotation, so stop spiraling
+                rotationsChecked += 1
+            if(((segmentIndex >= len(path)) or stopping) and (time.perf_counter() > predictedEnd)):
+                if(success and (sum([abs(currentPos[i] - self.motionTracker.lastTarget[i]) for i in range(2)]) <= self.motionTracker.posMatchThresh)):
+                    break # (the position report confirms the head stopped where the last segment ends)
+                if(time.perf_counter() > (predictedEnd + 5.0)):
+                    print("onTheFlyScanner: head didn't reach the end of the path in time, ending layer anyway");  break
+        self.motionTracker.markArrived() # (no M400 was sent for the scan segments, the position reports confirmed it instead)
+        endIndex = len(streamer.results)
+        xy, success = self._positionBytes(streamer, startIndex, endIndex, feedTimes, feedPositions)
+        streamer.discardBefore(endIndex) # (this layer is binned, the next one starts at the (new) end of the lists)
+        binned = binByteResults(xy, success, self.binSize, self.minBinSamples)
+        layerTime = time.perf_counter() - layerStartTime
+        self.layerStats.append({'z' : z, 'time' : layerTime, 'bytes' : endIndex-startIndex, 'positionReports' : len(feedTimes), 'bins' : len(binned)})
+        print("onTheFly layer z="+str(round(z,3))+":", len(binned), "bins from", endIndex-startIndex, "bytes and", len(feedTimes), "position reports in", round(layerTime,1), "s  ("+str(round(len(binned)/max(layerTime,1e-3)*60))+" points/min)")
+        return(binned)
+
+    def run(self, list4D:list[tuple[float,float,float,float]]):
+        """ scan all layers (untill the planner's limits/early-stop conditions), appending [x,y,z,successRate] rows to list4D """
+        streamer = IRbyteStreamer(self.IR_TX_serial, self.IR_RX_serial)
+        streamer.start()
+        try:
+            lastGoodZ = 0.0
+            for layerIndex in range(self.planner.layerCount()):
+                z = self.planner.layerHeight(layerIndex)
+                binned = self.scanLayer(z, streamer)
+                for x, y, rate, _ in binned:
+                    list4D.append((float(x), float(y), z, float(rate)))
+                if((len(binned) > 0) and (binned[:,2].max() > self.planner.continuationThresh)):
+                    lastGoodZ = z
+                elif((z - lastGoodZ) >= self.planner.vertStopThresh):
+                    print("onTheFlyScanner: nothing above continuationThresh for", self.planner.vertStopThresh, "mm, stopping")
+                    break
+        finally:
+            streamer.stop()
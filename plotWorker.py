@@ -0,0 +1,126 @@
+"""
+non-blocking plotting: matplotlib runs in a seperate process, so plt.show() never stalls the cv2/serial loop.
+The main process sends (only the new) measurement data through a pipe, the plot process keeps its own copy
+ and refreshes a live view (3D scatter plot + contour plot of the latest layer, for every baud rate) while the figure is open.
+
+usage:
+    plotter = plotProcess(markerScale=IRtestHorizontalStepsize)
+    plotter.sendSnapshot(list5D) # call as often as you like (it's rate-limited), only sends data if the figure is open
+    plotter.show(list5D) # open (or re-open) the figure
+    plotter.close()
+"""
+
+import time
+import multiprocessing
+
+def _plotProcessMain(conn, markerScale:float, refreshInterval:float):
+    """ (runs in the plot process) receive data from the pipe and keep the figure up to date """
+    import numpy as np
+    import matplotlib.pyplot as plt
+    import IR_alignment_gcode as IRA # (my own code) for drawPlot5D()/plot4D() (NOTE: importing it doesn't import anything heavy)
+    import alignmentAnalysis # (my own code) for interpolateLayer()
+    data:dict[int,np.ndarray] = {} # the plot process' own copy of list5D
+    fig = None;  dataChanged = False;  lastDrawTime = 0.0
+    plt.ion()
+    while(True):
+        while(conn.poll()): # handle all messages
+            try:
+                message = conn.recv()
+            except EOFError: # main process is gone
+                return
+            if(message[0] == 'data'): # ('data', {baud : new rows}, reset)
+                _, newRows, reset = message
+                for baud in newRows:
+                    data[baud] = newRows[baud] if (reset or (baud not in data)) else np.concatenate((data[baud], newRows[baud]))
+                if(reset):
+                    for baud in [baud for baud in data if (baud not in newRows)]:  del(data[baud])
+                dataChanged = True
+            elif(message[0] == 'show'):
+                if((fig is None) or (not plt.fignum_exists(fig.number))):
+                    fig = plt.figure(figsize=(10, 5))
+                    dataChanged = True
+            elif(message[0] == 'close'):
+                plt.close('all');  return
+        figOpen = (fig is not None) and plt.fignum_exists(fig.number)
+        if(figOpen and dataChanged and ((time.time() - lastDrawTime) > refreshInterval) and (len(data) > 0)):
+            lastDrawTime = time.time();  dataChanged = False
+            fig.clear()
+            IRA.drawPlot5D(fig, {baud : data[baud] for baud in data}, markerScale) # 3D scatter plots (top half)
+            fig.subplots_adjust(bottom=0.45) # make room for the contour plots
+            for i, baud in enumerate(data): # contour plot of the latest layer (bottom half)
+                if(len(data[baud]) < 3):
+                    continue
+                latestZ = data[baud][-1,2]
+                layer = data[baud][np.abs(data[baud][:,2] - latestZ) < 0.001][:,[0,1,3]]
+                axis = np.linspace(-1, 1, 81) * max(float(np.abs(layer[:,0:2]).max()), 0.5)
+                ax = fig.add_axes([0.05 + (0.9 / len(data)) * i, 0.05, (0.9 / len(data)) * 0.8, 0.33])
+                ax.contourf(axis, axis, alignmentAnalysis.interpolateLayer(layer, axis, axis), levels=np.linspace(0, 1, 11), cmap='RdYlGn')
+                ax.scatter(layer[:,0], layer[:,1], s=2, c='k')
+                ax.set_aspect('equal');  ax.set_title(str(baud) + " @ z=" + str(round(float(latestZ),2)) + "mm", fontsize=8)
+            fig.canvas.draw_idle()
+        if(figOpen):
+            plt.pause(0.05) # (handles GUI events)
+        else:
+            conn.poll(0.1) # (just waits for new messages)
+
+class plotProcess():
+    """ a (matplotlib) plot window in a seperate process """
+    def __init__(self, markerScale:float=0.5, sendInterval:float=1.0, refreshInterval:float=1.0):
+        self.markerScale = markerScale # see IR_alignment_gcode.plot4D()
+        self.sendInterval = sendInterval # (s) minimum time between data updates sent by sendSnapshot()
+        self.refreshInterval = refreshInterval # (s) minimum time between redraws (in the plot process)
+        self.process: multiprocessing.Process|None = None
+        self._conn = None
+        self._sentCounts:dict[int,int] = {} # how many rows of each baud rate have already been sent
+        self._sendTimer = 0.0
+        self.showing = False # whether the figure (should) be open (no point in sending data otherwise)
+
+    def isAlive(self) -> bool:
+        return((self.process is not None) and self.process.is_alive())
+
+    def _start(self):
+        self._conn, childConn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_plotProcessMain, args=(childConn, self.markerScale, self.refreshInterval), daemon=True)
+        self.process.start()
+        self._sentCounts = {}
+
+    def sendSnapshot(self, list5D:dict[int,list[tuple[float,float,float,float]]], force:bool=False):
+        """ send new measurement data to the plot process (rate-limited to sendInterval, unless 'force') """
+        if((not self.isAlive()) or ((not self.showing) and (not force)) or ((not force) and ((time.time() - self._sendTimer) < self.sendInterval))):
+            return
+        import numpy as np
+        self._sendTimer = time.time()
+        reset = any([(len(list5D.get(baud, [])) < self._sentCounts[baud]) for baud in self._sentCounts]) or any([(baud not in list5D) for baud in self._sentCounts]) # (data was replaced, e.g. loaded from a file)
+        if(reset):
+            self._sentCounts = {}
+        newRows = {}
+        for baud in list5D:
+            start = self._sentCounts.get(baud, 0)
+            if((len(list5D[baud]) > start) or (baud not in self._sentCounts)):
+                newRows[baud] = np.array([row[0:4] for row in list5D[baud][start:]], dtype=float).reshape((-1,4))
+                self._sentCounts[baud] = len(list5D[baud])
+        if((len(newRows) > 0) or reset):
+            try:
+                self._conn.send(('data', newRows, reset))
+            except Exception as excep:
+                print("plotProcess couldn't send data:", excep)
+
+    def show(self, list5D:dict[int,list[tuple[float,float,float,float]]]):
+        """ open (or re-open) the figure with the latest data (starts the plot process if needed) """
+        if(not self.isAlive()):
+            self._start()
+        self.showing = True
+        self.sendSnapshot(list5D, force=True)
+        self._conn.send(('show',))
+
+    def close(self):
+        """ close the figure and stop the plot process """
+        if(self.isAlive()):
+            try:
+                self._conn.send(('close',))
+                self.process.join(2.0)
+            except Exception as excep:
+                print("plotProcess close() failed:", excep)
+            if(self.process.is_alive()):
+                self.process.terminate()
+        self.showing = False
@@ -0,0 +1,170 @@
+"""
+serial port auto-discovery: figures out which port is the 3D printer and which ports are the IR RX/TX boards, instead of asking the operator.
+
+All candidate ports are probed at the same time (one thread per port), with short timeouts:
+- the IR boards are recognised with an echo handshake: every port sends a unique tag at the same time,
+   whichever port receives another port's tag is the IR RX (and the sender is the IR TX). A port that receives its own tag is both.
+  NOTE: the echo handshake only works if the IR link works at the current head position (e.g. aligned at the 0-position)
+- the printer is recognised by its response to M115 (at the printer's baud rate), on the remaining ports
+The IR echo handshake runs first, so the IR boards (which relay whatever they receive) don't get the printer's M115 probe.
+The resulting roles are cached (by USB VID/PID/serial number, so it doesn't matter which COM number the OS picks), so later starts can skip probing.
+ (only if every role's port has a unique serial number, and the cached printer port must still respond like a printer)
+Any role that could not be determined is None, the caller can fall back to asking the operator.
+
+usage (commandline):  python portDiscovery.py [--printer-baud 250000] [--ir-baud 9600] [--no-cache]
+"""
+
+import os
+import json
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import gcode_struff as GC # (my own code)
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".port_roles.json")
+ROLES:tuple[str,str,str] = ("printer", "IR_RX", "IR_TX")
+
+def portIdentity(portInfo) -> str|None:
+    """ a (COM number independent) identifier for a port (a serial.tools.list_ports ListPortInfo), None for ports that can't be recognised later: \n
+        non-USB ports, and USB adapters without a serial number (e.g. CH340, common on printer boards), because identical adapters would get the same identity """
+    if((portInfo.vid is None) or (portInfo.serial_number is None)):
+        return(None)
+    return("{:04X}:{:04X}:{}".format(portInfo.vid, portInfo.pid, portInfo.serial_number))
+
+def _openPort(port:str, baud:int, timeout:float):
+    """ open a port quietly (same settings as IR_alignment_gcode.initSerial(), so printers don't reboot), returns None if it failed """
+    import serial
+    try:
+        serialObj = serial.Serial()
+        serialObj.baudrate = baud;  serialObj.timeout = timeout
+        serialObj.rts = 0;  serialObj.dtr = 0
+        serialObj.port = port
+        serialObj.open()
+        return(serialObj if serialObj.is_open else None)
+    except Exception:
+        return(None)
+
+def probePrinter(port:str, baud:int, timeout:float=1.5) -> str|None:
+    """ check whether a port is a (Marlin) 3D printer, returns its firmware name (or None if it isn't one) """
+    serialObj = _openPort(port, baud, 0.05)
+    if(serialObj is None):
+        return(None)
+    try:
+        readData = b'';  lastRequest = 0.0;  startTime = time.time()
+        while((time.time() - startTime) < timeout):
+            if((time.time() - lastRequest) > 0.5): # (repeat the request, in case the first one got lost (e.g. printer still booting))
+                serialObj.write(GC.GCODE_FIRMWARE_INFO);  lastRequest = time.time()
+            readData += serialObj.read(max(serialObj.in_waiting, 1))
+            nameIndex = readData.find(b'FIRMWARE_NAME:')
+            if((nameIndex >= 0) and (readData.find(b'\n', nameIndex) >= 0)):
+                line = readData[nameIndex+len(b'FIRMWARE_NAME:'):readData.find(b'\n', nameIndex)]
+                return(line.split(b' ')[0].decode(errors='replace') if (len(line) > 0) else "unknown")
+        return(None)
+    finally:
+        serialObj.close()
+
+def probeIRports(ports:list[str], baud:int, timeout:float=0.5, tagLength:int=4) -> list[tuple[str,str]]:
+    """ echo handshake: every port sends a unique tag at the same time, then listens. Returns [(TX port, RX port), etc.] for every tag that was received """
+    serialObjs = {port : _openPort(port, baud, 0.02) for port in ports}
+    serialObjs = {port : serialObjs[port] for port in serialObjs if (serialObjs[port] is not None)}
+    try:
+        tags = {port : bytes([random.randrange(256) for _ in range(tagLength)]) for port in serialObjs}
+        for port in serialObjs: # discard whatever was already there
+            serialObjs[port].read(serialObjs[port].in_waiting)
+        def listen(port:str) -> bytes:
+            readData = b'';  startTime = time.time()
+            while((time.time() - startTime) < timeout):
+                readData += serialObjs[port].read(max(serialObjs[port].in_waiting, 1))
+            return(readData)
+        with ThreadPoolExecutor(max_workers=max(len(serialObjs), 1)) as executor:
+            listeners = {port : executor.submit(listen, port) for port in serialObjs}
+            for port in serialObjs:
+                serialObjs[port].write(tags[port])
+            received = {port : listeners[port].result() for port in listeners}
+        return([(txPort, rxPort) for rxPort in received for txPort in tags if (tags[txPort] in received[rxPort])])
+    finally:
+        for port in serialObjs:
+            serialObjs[port].close()
+
+def loadRoleCache(filename:str=DEFAULT_CACHE_FILE) -> dict[str,str]:
+    """ {role : portIdentity} from the cache file (empty if there is none) """
+    try:
+        with open(filename, 'r') as cacheFile:
+            return(json.load(cacheFile))
+    except FileNotFoundError:
+        return({})
+    except Exception as excep:
+        print("loadRoleCache() couldn't read cache file:", filename, excep)
+        return({})
+
+def saveRoleCache(roles:dict[str,str|None], portInfos:list, filename:str=DEFAULT_CACHE_FILE):
+    """ store the roles (by portIdentity()) in the cache file (only if every role is known and recognisable later) """
+    identities = {portInfo.device : portIdentity(portInfo) for portInfo in portInfos}
+    if(any([((roles.get(role) is None) or (identities.get(roles[role]) is None)) for role in ROLES])):
+        return
+    roleIdentities = [identities[roles[role]] for role in ROLES]
+    if((len(set(roleIdentities)) != len(set([roles[role] for role in ROLES]))) or any([(list(identities.values()).count(identity) > 1) for identity in roleIdentities])):
+        print("saveRoleCache() not caching the port roles, the ports can't be told apart later:", {role : identities[roles[role]] for role in ROLES})
+        return
+    try:
+        with open(filename, 'w') as cacheFile:
+            json.dump({role : identities[roles[role]] for role in ROLES}, cacheFile, indent=4)
+    except Exception as excep:
+        print("saveRoleCache() couldn't write cache file:", filename, excep)
+
+def discoverPorts(printerBaud:int, IRbaud:int, cacheFile:str|None=DEFAULT_CACHE_FILE, printerTimeout:float=1.5, IRtimeout:float=0.5) -> dict[str,str|None]:
+    """ determine the port for every role, returns {'printer' : port, 'IR_RX' : port, 'IR_TX' : port} (None for roles that couldn't be determined) \n
+        'cacheFile' can be None to always probe (and not update the cache) """
+    import serial.tools.list_ports
+    portInfos = list(serial.tools.list_ports.comports())
+    roles:dict[str,str|None] = {role : None for role in ROLES}
+    ## try the cache first:
+    if(cacheFile is not None):
+        cached = loadRoleCache(cacheFile)
+        identities = [portIdentity(portInfo) for portInfo in portInfos]
+        devices = {identities[i] : portInfos[i].device for i in range(len(portInfos)) if ((identities[i] is not None) and (identities.count(identities[i]) == 1))} # (ports with the same identity can't be told apart)
+        if((len(cached) > 0) and all([(cached.get(role) in devices) for role in ROLES])):
+            cachedRoles = {role : devices[cached[role]] for role in ROLES}
+            if(len(set(cachedRoles.values())) != len(set([cached[role] for role in ROLES]))):
+                print("discoverPorts() ignoring the cached port roles, different roles point to the same port:", cachedRoles)
+            elif(probePrinter(cachedRoles['printer'], printerBaud, printerTimeout) is None):
+                print("discoverPorts() ignoring the cached port roles, the cached printer port", cachedRoles['printer'], "doesn't respond like a printer")
+            else:
+                print("discoverPorts() using cached port roles:", cachedRoles)
+                return(cachedRoles)
+    startTime = time.time()
+    candidates = [portInfo.device for portInfo in portInfos]
+    ## probe for the IR boards first (so they don't get the printer probe, which they would relay):
+    pairs = probeIRports(candidates, IRbaud, IRtimeout)
+    if((len(pairs) == 2) and (pairs[0] == pairs[1][::-1])): # the link works both ways (duplex firmware), so there's no telling which is which
+        pairs = [min(pairs)]
+        print("discoverPorts() found a bidirectional IR link, assuming TX:", pairs[0][0], "RX:", pairs[0][1])
+    if(len(pairs) == 1):
+        roles['IR_TX'], roles['IR_RX'] = pairs[0]
+    elif(len(pairs) > 1):
+        print("discoverPorts() found multiple IR links:", pairs, "(not choosing one)")
+    ## then the printer, on the ports that didn't answer the IR handshake (in parallel):
+    IRports = set([port for pair in pairs for port in pair])
+    candidates = [port for port in candidates if (port not in IRports)]
+    with ThreadPoolExecutor(max_workers=max(len(candidates), 1)) as executor:
+        firmwareNames = dict(zip(candidates, executor.map(lambda port : probePrinter(port, printerBaud, printerTimeout), candidates)))
+    printers = [port for port in candidates if (firmwareNames[port] is not None)]
+    if(len(printers) == 1):
+        roles['printer'] = printers[0]
+    elif(len(printers) > 1):
+        print("discoverPorts() found multiple printers:", printers, "(not choosing one)")
+    print("discoverPorts() took", round(time.time()-startTime,2), "s, found:", roles, ("(firmware: "+firmwareNames[roles['printer']]+")" if (roles['printer'] is not None) else ""))
+    if(cacheFile is not None):
+        saveRoleCache(roles, portInfos, cacheFile)
+    return(roles)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="find the 3D printer and IR board serial ports")
+    parser.add_argument("--printer-baud", type=int, default=250000)
+    parser.add_argument("--ir-baud", type=int, default=9600)
+    parser.add_argument("--no-cache", action="store_true", help="always probe (and don't update the cache)")
+    args = parser.parse_args()
+    print(discoverPorts(args.printer_baud, args.ir_baud, (None if args.no_cache else DEFAULT_CACHE_FILE)))
@@ -0,0 +1,124 @@
+"""
+command queue between the UI (keyHandler) and the 3D printer.
+
+Without it, every jog keypress sent its own G0 (and holding a key queued up more moves than the printer could keep up with),
+ and auto-homing/disabling the steppers blocked the whole UI loop untill the printer responded.
+This queue (which is polled with update(), just like motionCompletionTracker, no threads needed):
+- coalesces moves: a new move replaces the queued (not yet sent) one, so a burst of jog keypresses becomes a single move to the latest target
+- keeps the printer's own buffer short: the next move is only sent once the previous one is (predicted to be) almost done, so jogging responds instantly instead of lagging behind a backlog
+- runs long operations (auto-home, disable steppers) asynchronously: the command is sent and the 'ok' is picked up by update() (non-blocking), with a status string for the UI
+
+usage:
+    commandQueue = printerCommandQueue(printerSerial, motionTracker, moveFunc)
+    commandQueue.moveTo(desiredRelPos, printerJogFeedrate) # (from keyHandler)
+    commandQueue.home(onDone=lambda name, success : print(name, success))
+    commandQueue.update() # every loop (before motionTracker.update())
+"""
+
+from __future__ import annotations # (so the serial import below is only needed for type-checkers, not at runtime)
+import time
+from collections import deque
+from typing import Callable, TYPE_CHECKING # just for type-hints
+if(TYPE_CHECKING):
+    import serial
+    import motionCompletion
+
+import gcode_struff as GC # (my own code) placed in a seperate file for legibility
+
+LONG_OPERATIONS = { # {name : (gcode, timeout (s), status text while running)}
+    'home' : (GC.GCODE_AUTO_HOME, 30.0, "homing"),
+    'disableSteppers' : (GC.GCODE_DISABLE_STEPPERS, 10.0, "disabling steppers"), # (Marlin finishes the buffered moves first)
+}
+
+class printerCommandQueue():
+    """ coalescing command queue for printer moves and (asynchronous) long operations \n
+        'moveFunc' is called as moveFunc(relPos, feedrate, requestCompletion) and should send the G0 (and register it with the motionTracker), like IR_alignment_gcode's moveMacro() """
+    def __init__(self, printerSerial:serial.Serial, motionTracker:motionCompletion.motionCompletionTracker, moveFunc:Callable[[list[float],float,bool], bool], moveLookahead:float=0.1):
+        self.printerSerial = printerSerial
+        self.motionTracker = motionTracker
+        self.moveFunc = moveFunc
+        self.moveLookahead = moveLookahead # (s) the next move is sent when the previous one is predicted to be done within this time
+        self._queue:deque[tuple] = deque() # ('move', relPos, feedrate, requestCompletion) or ('long', name, onDone)
+        self._inFlight:tuple[str,float,Callable|None]|None = None # (name, start time, onDone) of the long operation that's waiting for its 'ok'
+        self._readData = b''
+        self.lastResult:str = "" # short description of the last finished long operation (for the UI)
+        self.supersededMoves = 0 # how many moves were replaced before they were sent (just for debugging)
+
+    @property
+    def busy(self) -> bool:
+        """ whether a long operation is waiting for its 'ok' (don't send other commands (like M114) while this is True) """
+        return(self._inFlight is not None)
+
+    @property
+    def idle(self) -> bool:
+        """ whether everything has been sent (and finished, for long operations) """
+        return((self._inFlight is None) and (len(self._queue) == 0))
+
+    @property
+    def status(self) -> str:
+        """ human-readable status (for the UI) """
+        if(self._inFlight is not None):
+            return(LONG_OPERATIONS[self._inFlight[0]][2] + "... (" + str(round(time.time() - self._inFlight[1], 1)) + "s)")
+        if(len(self._queue) > 0):
+            return(str(len(self._queue)) + " command(s) queued")
+        return(self.lastResult if (len(self.lastResult) > 0) else "idle")
+
+    def moveTo(self, relPos:list[float,float,float], feedrate:float=(-1), requestCompletion:bool=False):
+        """ queue a move (to a position relative to the positionOffset). Replaces the last queued move if it hasn't been sent yet """
+        move = ('move', [float(entry) for entry in relPos], feedrate, requestCompletion) # (copy, the caller will probably keep changing their list)
+        if((len(self._queue) > 0) and (self._queue[-1][0] == 'move')):
+            self._queue[-1] = move;  self.supersededMoves += 1
+        else:
+            self._queue.append(move)
+
+    def _queueLongOperation(self, name:str, onDone:Callable[[str,bool], None]|None):
+        if(((self._inFlight is not None) and (self._inFlight[0] == name) and (len(self._queue) == 0)) or ((len(self._queue) > 0) and (self._queue[-1][0:2] == ('long', name)))):
+            return # (pressing the key twice doesn't make it happen twice)
+        self._queue.append(('long', name, onDone))
+
+    def home(self, onDone:Callable[[str,bool], None]|None=None):
+        """ queue an auto-home (G28). onDone(name, success) is called when it's finished """
+        self._queueLongOperation('home', onDone)
+
+    def disableSteppers(self, onDone:Callable[[str,bool], None]|None=None):
+        """ queue disabling the steppers (M18). onDone(name, success) is called when it's finished """
+        self._queueLongOperation('disableSteppers', onDone)
+
+    def clearMoves(self):
+        """ drop all queued (not yet sent) moves """
+        self._queue = deque([command for command in self._queue if (command[0] != 'move')])
+
+    def _finishLongOperation(self, success:bool):
+        name, startTime, onDone = self._inFlight
+        self._inFlight = None
+        self.lastResult = name + (" done" if success else " FAILED") + " (" + str(round(time.time() - startTime, 1)) + "s)"
+        if(not success):
+            print("printerCommandQueue:", name, "got no 'ok', received:", self._readData)
+        if(callable(onDone)):
+            onDone(name, success)
+
+    def update(self):
+        """ non-blocking: check on the running long operation, and send the next command when the printer is ready for it (call this every loop) """
+        now = time.time()
+        if(self._inFlight is not None):
+            if(self.printerSerial.in_waiting > 0):
+                self._readData += self.printerSerial.read(self.printerSerial.in_waiting)
+            if(GC.GCODE_MARLIN_OK in self._readData):
+                self._finishLongOperation(True)
+            elif((now - self._inFlight[1]) > LONG_OPERATIONS[self._inFlight[0]][1]):
+                self._finishLongOperation(False)
+            else:
+                return
+        if((len(self._queue) == 0) or self.motionTracker.busy): # (an outstanding M400 'ok' would be mistaken for the 'ok' of the next command)
+            return
+        command = self._queue[0]
+        if(command[0] == 'move'):
+            if((not self.motionTracker.arrived) and ((self.motionTracker.predictedDoneTime - now) > self.moveLookahead)):
+                return # the previous move is still going, wait (the target may still change in the meantime)
+            self._queue.popleft()
+            self.moveFunc(command[1], command[2], command[3])
+        else:
+            self._queue.popleft()
+            self.motionTracker.reset() # the position is unknown after homing/disabling (and the tracker must not poll M114 while this runs)
+            self.printerSerial.write(LONG_OPERATIONS[command[1]][0]);  time.sleep(0.025) # NOTE: sleep() needed becuase pyserial can interrupt its own write cycles with _reconfigure_port stuff!
+            self._inFlight = (command[1], now, command[2]);  self._readData = b''
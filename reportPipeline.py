@@ -0,0 +1,193 @@
+"""
+post-run report pipeline: everything that happens after the last measurement (saving, figures, metrics, indexing) runs in a process pool,
+ so the rig is free for the next board right away (instead of waiting for saveToExcel() and the plots, one after the other).
+
+For every results file it produces (all in parallel):
+- the results file itself (IR_alignment_gcode.saveToExcel()), followed by the run index registration and the summary metrics (see runIndex.py),
+   which are also written to summary.json in the report folder
+- a 3D scatter plot per baud rate:          <report folder>/<baud>.png
+- a contour plot per layer per baud rate:   <report folder>/<baud>_z<height>.png
+The report folder is the results filename without '.xlsx', plus '_report'. Figures use matplotlib's non-interactive (Agg) backend.
+
+usage:
+    reports = reportPipeline()
+    job = reports.submit(list5D, filename, columnNames=..., metadata=...) # returns immediately (the data is copied, so list5D can be reused)
+    job.wait() # (optional) block untill that report is finished
+    reports.close() # waits for all unfinished reports
+
+commandline (re-generate the figures/summary of existing results files):   python reportPipeline.py results.xlsx other_results.xlsx [--workers 8]
+"""
+
+import os
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future, wait as waitForFutures
+
+REPORT_FOLDER_SUFFIX = "_report"
+
+def reportDirectory(filename:str) -> str:
+    """ the folder where the figures and summary of a results file go """
+    return((filename[:-len(".xlsx")] if filename.endswith(".xlsx") else filename) + REPORT_FOLDER_SUFFIX)
+
+def _saveWorker(list5D:dict[int,list[tuple]], filename:str, extraSheets:dict|None, columnNames:list[str]|None, metadata:dict|None, badDataPatterns:tuple[list[int],list[int]]|None,
+                register:bool, writeFile:bool) -> tuple[str,list[dict]|None,str|None]:
+    """ (runs in a worker process) save the results file, then register it in the run index and write summary.json. returns (filename, summary, error) """
+    try:
+        import IR_alignment_gcode as IRA # (my own code) NOTE: importing it doesn't import anything heavy
+        if(writeFile):
+            if(badDataPatterns is not None):
+                IRA.badDataPattern[:], IRA.badDataPatternReverse[:] = badDataPatterns # (saveToExcel() stores the main process' debug counters, this process has its own)
+            IRA.saveToExcel(list5D, filename, extraSheets, columnNames, metadata, register=False)
+            metadata = IRA.readMetadataFromExcel(filename) # (with the 'savedAt' timestamp, same as the index would read)
+        import runIndex # (my own code)
+        records = runIndex.registerRun(filename, list5D, metadata) if register else runIndex.runRecords(filename, list5D, metadata)
+        summary = [{key : run[key] for key in runIndex.RUN_COLUMNS if (key != 'metadata')} for run, _ in records]
+        os.makedirs(reportDirectory(filename), exist_ok=True)
+        with open(os.path.join(reportDirectory(filename), "summary.json"), 'w') as summaryFile:
+            json.dump(summary, summaryFile, indent=4)
+        return(filename, summary, None)
+    except Exception as excep:
+        return(filename, None, repr(excep))
+
+def _scatterFigureWorker(baud:int, rows:list[tuple], pngFilename:str, markerScale:float) -> tuple[str,str|None]:
+    """ (runs in a worker process) 3D scatter plot of one baud rate, saved as PNG. returns (pngFilename, error) """
+    try:
+        from matplotlib.figure import Figure # (using Figure directly (instead of pyplot) means the Agg backend, no GUI)
+        import IR_alignment_gcode as IRA # (my own code) for drawPlot5D()
+        fig = Figure(figsize=(6, 6))
+        IRA.drawPlot5D(fig, {baud : rows}, markerScale)
+        fig.tight_layout()
+        fig.savefig(pngFilename, dpi=100)
+        return(pngFilename, None)
+    except Exception as excep:
+        return(pngFilename, repr(excep))
+
+def _layerFigureWorker(baud:int, z:float, layer, pngFilename:str, contourResolution:int=81) -> tuple[str,str|None]:
+    """ (runs in a worker process) contour plot of one layer (np.array([[x,y,data], etc.])), saved as PNG. returns (pngFilename, error) """
+    try:
+        import numpy as np
+        from matplotlib.figure import Figure
+        import alignmentAnalysis # (my own code) for interpolateLayer()
+        axis = np.linspace(-1, 1, contourResolution) * max(float(np.abs(layer[:,0:2]).max()), 0.5)
+        fig = Figure(figsize=(5, 4.5))
+        ax = fig.add_subplot(1, 1, 1)
+        contour = ax.contourf(axis, axis, alignmentAnalysis.interpolateLayer(layer, axis, axis), levels=np.linspace(0, 1, 11), cmap='RdYlGn')
+        ax.scatter(layer[:,0], layer[:,1], s=2, c='k')
+        fig.colorbar(contour, ax=ax)
+        ax.set_aspect('equal');  ax.set_xlabel("x misalignment [mm]");  ax.set_ylabel("y misalignment [mm]")
+        ax.set_title(str(baud) + " @ z=" + str(round(float(z),3)) + "mm  (" + str(len(layer)) + " points)")
+        fig.savefig(pngFilename, dpi=100)
+        return(pngFilename, None)
+    except Exception as excep:
+        return(pngFilename, repr(excep))
+
+class reportJob():
+    """ the (unfinished) report of one results file, see reportPipeline.submit() """
+    def __init__(self, filename:str):
+        self.filename = filename
+        self.reportDirectory = reportDirectory(filename)
+        self.futures: list[Future] = []
+        self.summary: list[dict]|None = None # the summary metrics (one dict per baud rate, see runIndex.RUN_COLUMNS), once the file is saved and indexed
+        self.figures: list[str] = [] # the PNG files that were written successfully
+        self.errors: list[str] = []
+        self._handledCount = 0 # how many futures' results have been handled (by the reportPipeline's callbacks)
+
+    def done(self) -> bool:
+        return(all([future.done() for future in self.futures]))
+
+    def wait(self, timeout:float|None=None) -> bool:
+        """ block untill the report is finished, returns whether it finished (False on timeout) """
+        return(len(waitForFutures(self.futures, timeout).not_done) == 0)
+
+class reportPipeline():
+    """ generates reports (results file, figures, summary metrics, run index) in a process pool, see the top of this file """
+    def __init__(self, workers:int|None=None, markerScale:float=0.5, figures:bool=True):
+        self.workers = workers # (None means the number of CPU cores)
+        self.markerScale = markerScale # see IR_alignment_gcode.plot4D()
+        self.figures = figures # whether to make the PNG figures at all
+        self._executor: ProcessPoolExecutor|None = None # (only started when the first report is submitted)
+        self.jobs: list[reportJob] = []
+        self._callbackLock = threading.Lock() # (the future callbacks run in the executor's thread)
+
+    def _futureHandled(self, job:reportJob):
+        job._handledCount += 1
+        if(job._handledCount == len(job.futures)):
+            print("report done:", job.reportDirectory, "(" + str(len(job.figures)) + " figures" + ((", " + str(len(job.errors)) + " errors") if (len(job.errors) > 0) else "") + ")")
+
+    def _onSaveDone(self, job:reportJob, future:Future):
+        filename, summary, error = future.result()
+        with self._callbackLock:
+            if(error is not None):
+                job.errors.append(error);  print("report: couldn't save/index", filename, ":", error)
+            else:
+                job.summary = summary
+                print("report: saved", filename, " max working distance:", {run['baud'] : run['maxWorkingDistance'] for run in summary})
+            self._futureHandled(job)
+
+    def _onFigureDone(self, job:reportJob, future:Future):
+        pngFilename, error = future.result()
+        with self._callbackLock:
+            if(error is not None):
+                job.errors.append(error);  print("report: couldn't make figure", pngFilename, ":", error)
+            else:
+                job.figures.append(pngFilename)
+            self._futureHandled(job)
+
+    def submit(self, list5D:dict[int,list[tuple]], filename:str, extraSheets:dict|None=None, columnNames:list[str]|None=None, metadata:dict|None=None,
+               register:bool=True, writeFile:bool=True) -> reportJob:
+        """ start generating the report of 'list5D' (returns immediately). The arguments are the same as IR_alignment_gcode.saveToExcel() \n
+            'writeFile' False means the results file already exists (only make the figures/summary, and (re)register it) """
+        import numpy as np
+        import IR_alignment_gcode as IRA # (my own code) for badDataPattern(Reverse)
+        import alignmentAnalysis # (my own code) for splitLayers()
+        filename = (filename if filename.endswith(".xlsx") else (filename+".xlsx"))
+        if(self._executor is None):
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        job = reportJob(filename);  self.jobs.append(job)
+        rowLists = {baud : [tuple(row) for row in list5D[baud]] for baud in list5D} # (a copy, so the caller can keep using list5D (works for measurementStores too))
+        saveFuture = self._executor.submit(_saveWorker, rowLists, filename, extraSheets, columnNames, metadata, (list(IRA.badDataPattern), list(IRA.badDataPatternReverse)), register, writeFile)
+        job.futures.append(saveFuture)
+        if(self.figures):
+            os.makedirs(job.reportDirectory, exist_ok=True)
+            for baud in rowLists:
+                if(len(rowLists[baud]) < 1):
+                    continue
+                job.futures.append(self._executor.submit(_scatterFigureWorker, baud, rowLists[baud], os.path.join(job.reportDirectory, str(baud)+".png"), self.markerScale))
+                data = np.array([row[0:4] for row in rowLists[baud]], dtype=float).reshape((-1,4))
+                for z, layer in alignmentAnalysis.splitLayers(data).items():
+                    if(len(layer) < 3): # (not enough to interpolate)
+                        continue
+                    job.futures.append(self._executor.submit(_layerFigureWorker, baud, z, layer, os.path.join(job.reportDirectory, str(baud)+"_z"+str(round(float(z),3))+".png")))
+        saveFuture.add_done_callback(lambda future : self._onSaveDone(job, future)) # (callbacks are added after all futures are known, so job.done() is accurate)
+        for future in job.futures[1:]:
+            future.add_done_callback(lambda future : self._onFigureDone(job, future))
+        return(job)
+
+    def pending(self) -> int:
+        """ number of reports that aren't finished yet """
+        return(len([job for job in self.jobs if (not job.done())]))
+
+    def close(self, wait:bool=True):
+        """ stop the process pool ('wait' for the unfinished reports first, otherwise they're cancelled) """
+        if(self._executor is not None):
+            if(wait and (self.pending() > 0)):
+                print("waiting for", self.pending(), "report(s) to finish...")
+            self._executor.shutdown(wait=wait, cancel_futures=(not wait))
+            self._executor = None
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="(re-)generate the report (figures, summary, run index) of existing results files")
+    parser.add_argument("filenames", nargs='+', help="results file(s) (.xlsx)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPU cores)")
+    parser.add_argument("--marker-scale", type=float, default=0.5, help="scatter plot dot size (the horizontal stepsize works well)")
+    args = parser.parse_args()
+
+    import IR_alignment_gcode as IRA # (my own code) for readFromExcel()
+    reports = reportPipeline(args.workers, args.marker_scale)
+    try:
+        for filename in args.filenames:
+            reports.submit(IRA.readFromExcel(filename), filename, metadata=IRA.readMetadataFromExcel(filename), writeFile=False)
+    finally:
+        reports.close()
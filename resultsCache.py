@@ -0,0 +1,41 @@
+"""
+disk cache for parsed results files.
+Opening an .xlsx with openpyxl is slow (especially for dozens of files), so the parsed data is stored as numpy arrays in CACHE_DIR,
+ keyed by the hash of the file contents (so renamed/copied files still hit the cache, and changed files don't).
+"""
+
+import os
+import hashlib
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".results_cache")
+
+def fileHash(filename:str, chunkSize:int=(1<<20)) -> str:
+    """ SHA-1 hash (hex string) of a file's contents """
+    hasher = hashlib.sha1()
+    with open(filename, 'rb') as fileObj:
+        for chunk in iter(lambda : fileObj.read(chunkSize), b''):
+            hasher.update(chunk)
+    return(hasher.hexdigest())
+
+def loadResults(filename:str, cacheDir:str=DEFAULT_CACHE_DIR) -> dict[int,np.ndarray]:
+    """ read a results file (like IR_alignment_gcode.readFromExcel()), but returns numpy arrays (one row per point, missing values are NaN) and caches them on disk """
+    cacheFilename = os.path.join(cacheDir, fileHash(filename) + ".npz")
+    if(os.path.isfile(cacheFilename)):
+        try:
+            with np.load(cacheFilename) as cache:
+                return({int(key) : cache[key] for key in cache.files})
+        except Exception as excep:
+            print("loadResults() couldn't read cache file (re-parsing):", cacheFilename, excep)
+    import IR_alignment_gcode as IRA # (only needed for readFromExcel())
+    list5D = IRA.readFromExcel(filename)
+    arrays:dict[int,np.ndarray] = {}
+    for baud in list5D:
+        rowLength = max([len(row) for row in list5D[baud]] + [4])
+        arrays[baud] = np.array([[(np.nan if (value is None) else value) for value in row] + [np.nan]*(rowLength-len(row)) for row in list5D[baud]], dtype=float).reshape((-1, rowLength))
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        np.savez(cacheFilename, **{str(baud) : arrays[baud] for baud in arrays})
+    except Exception as excep:
+        print("loadResults() couldn't write cache file:", cacheFilename, excep)
+    return(arrays)
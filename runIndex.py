@@ -0,0 +1,198 @@
+"""
+local (SQLite) index of results files, so finding runs (e.g. "all 9600 baud runs of board X from last month") doesn't require opening every .xlsx file.
+
+Every save (IR_alignment_gcode.saveToExcel()) registers the file here, and existing folders of results can be imported in bulk (in parallel).
+The index has 2 tables:
+- runs:   one row per (results file, baud rate) with the run metadata (board, step sizes, positionOffset, duration, etc.) and summary metrics
+- layers: one row per layer (z) of every run, with some aggregates (point count, mean/max measurement, usable radius, centroid)
+The metrics come from alignmentAnalysis.py (with the default threshold of INDEX_THRESHOLD)
+
+usage (commandline):
+- import existing files:   python runIndex.py import results_folder/ other_results.xlsx [--workers 8]
+- find runs:               python runIndex.py query [--baud 9600] [--board X] [--since 2024-05-01] [--until 2024-06-01] [--name "%_9600%"]
+- show a run's layers:     python runIndex.py layers RUN_ID
+"""
+
+import os
+import json
+import sqlite3
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".run_index.sqlite")
+INDEX_THRESHOLD = 0.9 # success threshold (0~1) for the metrics stored in the index
+INDEX_RESOLUTION = 0.1 # (mm) interpolation grid spacing for the metrics (see alignmentAnalysis.buildVolume())
+
+RUN_COLUMNS:tuple[str] = ("filename", "fileHash", "savedAt", "baud", "board", "horizontalStepsize", "verticalStepsize", "offsetX", "offsetY", "offsetZ", "duration",
+                          "pointCount", "layerCount", "meanMeasurement", "maxWorkingDistance", "maxUsableRadius", "centroidX", "centroidY", "threshold", "metadata")
+LAYER_COLUMNS:tuple[str] = ("z", "pointCount", "meanMeasurement", "maxMeasurement", "passingPoints", "usableRadius", "centroidX", "centroidY")
+
+def connect(indexFile:str=DEFAULT_INDEX_FILE) -> sqlite3.Connection:
+    """ open (and if needed, create) the index database """
+    conn = sqlite3.connect(indexFile)
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, filename TEXT NOT NULL, fileHash TEXT, savedAt TEXT, baud INTEGER, board TEXT, "
+                 "horizontalStepsize REAL, verticalStepsize REAL, offsetX REAL, offsetY REAL, offsetZ REAL, duration REAL, pointCount INTEGER, layerCount INTEGER, "
+                 "meanMeasurement REAL, maxWorkingDistance REAL, maxUsableRadius REAL, centroidX REAL, centroidY REAL, threshold REAL, metadata TEXT, UNIQUE(filename, baud))")
+    conn.execute("CREATE TABLE IF NOT EXISTS layers (runId INTEGER NOT NULL REFERENCES runs(id), z REAL, pointCount INTEGER, meanMeasurement REAL, maxMeasurement REAL, "
+                 "passingPoints INTEGER, usableRadius REAL, centroidX REAL, centroidY REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS runsByBaud ON runs (baud, savedAt)")
+    conn.execute("CREATE INDEX IF NOT EXISTS runsByBoard ON runs (board, savedAt)")
+    conn.execute("CREATE INDEX IF NOT EXISTS layersByRun ON layers (runId)")
+    return(conn)
+
+def _nanToNone(value):
+    """ (SQLite has no NaN, NULL is the closest thing) """
+    return(None if ((value is None) or (value != value)) else value)
+
+def runRecords(filename:str, list5D:dict|None=None, metadata:dict|None=None, fileHash:str|None=None,
+               threshold:float=INDEX_THRESHOLD, resolution:float=INDEX_RESOLUTION) -> list[tuple[dict,list[dict]]]:
+    """ calculate the index entries of a results file (without touching the database, so this can run in a worker process) \n
+        returns [(run (dict with RUN_COLUMNS), [layer (dict with LAYER_COLUMNS), etc.]), etc.] (one run per baud rate) """
+    import numpy as np
+    import alignmentAnalysis, resultsCache # (my own code)
+    filename = os.path.abspath(filename)
+    if(list5D is None):
+        list5D = resultsCache.loadResults(filename)
+    if(metadata is None):
+        import IR_alignment_gcode as IRA # (only needed for readMetadataFromExcel())
+        metadata = IRA.readMetadataFromExcel(filename)
+    volumes = alignmentAnalysis.loadVolumes(filename, list5D, resolution)
+    offset = metadata.get('positionOffset', [None, None, None])
+    savedAt = metadata.get('savedAt', datetime.datetime.fromtimestamp(os.path.getmtime(filename)).isoformat(timespec='seconds'))
+    records = []
+    for baud in list5D:
+        if(isinstance(list5D[baud], np.ndarray)):
+            data = list5D[baud][:,0:4].astype(float)
+        else:
+            data = np.array([[(np.nan if (value is None) else value) for value in row[0:4]] for row in list5D[baud]], dtype=float).reshape((-1,4))
+        if(len(data) < 1):
+            continue
+        metrics = alignmentAnalysis.alignmentMetrics(volumes[baud], threshold)
+        run = {'filename' : filename, 'fileHash' : (fileHash if (fileHash is not None) else resultsCache.fileHash(filename)), 'savedAt' : savedAt, 'baud' : int(baud),
+               'board' : (metadata.get('board') or None), 'horizontalStepsize' : metadata.get('horizontalStepsize'), 'verticalStepsize' : metadata.get('verticalStepsize'),
+               'offsetX' : offset[0], 'offsetY' : offset[1], 'offsetZ' : offset[2], 'duration' : metadata.get('duration'),
+               'pointCount' : len(data), 'layerCount' : len(metrics['z']), 'meanMeasurement' : float(np.nanmean(data[:,3])),
+               'maxWorkingDistance' : _nanToNone(metrics['maxWorkingDistance']), 'maxUsableRadius' : (_nanToNone(float(metrics['usableRadius'].max())) if (len(metrics['z']) > 0) else None),
+               'centroidX' : _nanToNone(float(metrics['centroidOffset'][0])), 'centroidY' : _nanToNone(float(metrics['centroidOffset'][1])),
+               'threshold' : threshold, 'metadata' : json.dumps(metadata)}
+        layers = []
+        for i, (z, layer) in enumerate(alignmentAnalysis.splitLayers(data).items()):
+            layers.append({'z' : z, 'pointCount' : len(layer), 'meanMeasurement' : float(np.nanmean(layer[:,2])), 'maxMeasurement' : float(np.nanmax(layer[:,2])),
+                           'passingPoints' : int((layer[:,2] >= threshold).sum()), 'usableRadius' : float(metrics['usableRadius'][i]),
+                           'centroidX' : _nanToNone(float(metrics['layerCentroids'][i][0])), 'centroidY' : _nanToNone(float(metrics['layerCentroids'][i][1]))})
+        records.append((run, layers))
+    return(records)
+
+def _storeRecords(conn:sqlite3.Connection, filename:str, records:list[tuple[dict,list[dict]]]):
+    """ replace whatever the index holds for 'filename' with 'records' (see runRecords()) """
+    filename = os.path.abspath(filename)
+    conn.execute("DELETE FROM layers WHERE runId IN (SELECT id FROM runs WHERE filename = ?)", (filename,))
+    conn.execute("DELETE FROM runs WHERE filename = ?", (filename,))
+    for run, layers in records:
+        cursor = conn.execute("INSERT INTO runs (" + ", ".join(RUN_COLUMNS) + ") VALUES (" + ", ".join(["?"]*len(RUN_COLUMNS)) + ")", [run[key] for key in RUN_COLUMNS])
+        conn.executemany("INSERT INTO layers (runId, " + ", ".join(LAYER_COLUMNS) + ") VALUES (?, " + ", ".join(["?"]*len(LAYER_COLUMNS)) + ")",
+                         [[cursor.lastrowid] + [layer[key] for key in LAYER_COLUMNS] for layer in layers])
+
+def registerRun(filename:str, list5D:dict|None=None, metadata:dict|None=None, indexFile:str=DEFAULT_INDEX_FILE) -> list[tuple[dict,list[dict]]]:
+    """ add (or update) a results file in the index. 'list5D' and 'metadata' can be passed if they're already known (to avoid reading the file again) \n
+        returns the stored records (see runRecords()), which hold the summary metrics """
+    records = runRecords(filename, list5D, metadata)
+    conn = connect(indexFile)
+    try:
+        with conn: # (transaction)
+            _storeRecords(conn, filename, records)
+    finally:
+        conn.close()
+    return(records)
+
+def _importWorker(filename:str, knownHash:str|None) -> tuple[str,list|None,str|None]:
+    """ (runs in a worker process) returns (filename, records (None if the file is unchanged), error) """
+    try:
+        import resultsCache # (my own code)
+        fileHash = resultsCache.fileHash(filename)
+        if(fileHash == knownHash):
+            return(filename, None, None)
+        return(filename, runRecords(filename, fileHash=fileHash), None)
+    except Exception as excep:
+        return(filename, None, repr(excep))
+
+def importFiles(filenames:list[str], indexFile:str=DEFAULT_INDEX_FILE, workers:int|None=None) -> int:
+    """ index many results files in parallel (files that are already indexed and haven't changed are skipped), returns the number of (re-)indexed files """
+    conn = connect(indexFile)
+    try:
+        knownHashes = {row['filename'] : row['fileHash'] for row in conn.execute("SELECT filename, fileHash FROM runs")}
+        indexedCount = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor: # (workers do all the heavy lifting, only this process writes to the database)
+            futures = [executor.submit(_importWorker, filename, knownHashes.get(os.path.abspath(filename))) for filename in filenames]
+            for i, future in enumerate(as_completed(futures)):
+                filename, records, error = future.result()
+                if(error is not None):
+                    print("couldn't index", filename, ":", error)
+                elif(records is not None):
+                    with conn:
+                        _storeRecords(conn, filename, records)
+                    indexedCount += 1
+                print("indexed", i+1, "/", len(filenames), ":", os.path.basename(filename), ("(FAILED)" if (error is not None) else ("(unchanged)" if (records is None) else "")))
+        return(indexedCount)
+    finally:
+        conn.close()
+
+def queryRuns(indexFile:str=DEFAULT_INDEX_FILE, baud:int|None=None, board:str|None=None, since:str|None=None, until:str|None=None,
+              filenameLike:str|None=None, minWorkingDistance:float|None=None) -> list[dict]:
+    """ find runs in the index (all filters are optional). 'since' and 'until' are ISO dates/times (e.g. "2024-05-01"), 'filenameLike' is an SQL LIKE pattern \n
+        returns [run (dict with 'id' and RUN_COLUMNS), etc.], newest first """
+    conditions = [];  parameters = []
+    for condition, value in (("baud = ?", baud), ("board = ?", board), ("savedAt >= ?", since), ("savedAt < ?", until), ("filename LIKE ?", filenameLike), ("maxWorkingDistance >= ?", minWorkingDistance)):
+        if(value is not None):
+            conditions.append(condition);  parameters.append(value)
+    conn = connect(indexFile)
+    try:
+        rows = conn.execute("SELECT * FROM runs" + ((" WHERE " + " AND ".join(conditions)) if (len(conditions) > 0) else "") + " ORDER BY savedAt DESC", parameters).fetchall()
+        return([dict(row) for row in rows])
+    finally:
+        conn.close()
+
+def layerStats(runId:int, indexFile:str=DEFAULT_INDEX_FILE) -> list[dict]:
+    """ the per-layer aggregates of a run (sorted by z) """
+    conn = connect(indexFile)
+    try:
+        return([dict(row) for row in conn.execute("SELECT * FROM layers WHERE runId = ? ORDER BY z", (runId,)).fetchall()])
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    parser = argparse.ArgumentParser(description="index of IR alignment results files")
+    parser.add_argument("--index", default=DEFAULT_INDEX_FILE, help="index database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    importParser = subparsers.add_parser("import", help="index results files (and/or folders containing them)")
+    importParser.add_argument("paths", nargs='+')
+    importParser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    queryParser = subparsers.add_parser("query", help="find runs")
+    queryParser.add_argument("--baud", type=int, default=None)
+    queryParser.add_argument("--board", default=None)
+    queryParser.add_argument("--since", default=None, help="ISO date, e.g. 2024-05-01")
+    queryParser.add_argument("--until", default=None, help="ISO date, e.g. 2024-06-01")
+    queryParser.add_argument("--name", default=None, help="SQL LIKE pattern for the filename, e.g. %%_9600%%")
+    queryParser.add_argument("--min-distance", type=float, default=None, help="minimum max working distance (mm)")
+    layersParser = subparsers.add_parser("layers", help="show the per-layer aggregates of a run")
+    layersParser.add_argument("runId", type=int)
+    args = parser.parse_args()
+
+    if(args.command == "import"):
+        filenames:list[str] = []
+        for path in args.paths:
+            filenames += sorted(glob.glob(os.path.join(path, "*.xlsx"))) if os.path.isdir(path) else [path]
+        print("indexed", importFiles(filenames, args.index, args.workers), "new/changed files")
+    elif(args.command == "query"):
+        runs = queryRuns(args.index, args.baud, args.board, args.since, args.until, args.name, args.min_distance)
+        for run in runs:
+            print(str(run['id']).rjust(5), run['savedAt'], str(run['baud']).rjust(6), str(run['board']).ljust(12), " points:", str(run['pointCount']).rjust(5),
+                  " max dist:", run['maxWorkingDistance'], " centroid:", [run['centroidX'], run['centroidY']], " ", os.path.basename(run['filename']))
+        print(len(runs), "runs")
+    elif(args.command == "layers"):
+        for layer in layerStats(args.runId, args.index):
+            print({key : (round(value,3) if isinstance(value, float) else value) for key, value in layer.items() if (key != 'runId')})
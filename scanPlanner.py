@@ -0,0 +1,161 @@
+"""
+scan planning: decides where the next measurement should be taken.
+(moved out of IR_alignment_gcode.py's __main__, so the headless mode (and other tools) can use the same logic)
+"""
+
+from typing import Callable
+import numpy as np
+
+def singleMeasurement(row:tuple) -> float:
+    """ the measurement of a [x,y,z,data] row (the default measurementKey) """
+    return(row[3])
+
+def duplexMeasurement(row:tuple) -> float:
+    """ the best of both directions of a [x,y,z,TX->RX,RX->TX] row (see IR_alignment_gcode.IRresponseTestDuplex()), so it keeps scanning as long as either direction works """
+    return(max(row[3], row[4]))
+
+class spiralScanPlanner():
+    """ moves in a (horizontal) spiral pattern, and moves to the next (vertical) step(/layer) when it looks like no more data can be collected on the current layer """
+    def __init__(self, horizontalStepsize:float=0.5, verticalStepsize:float=0.5, verticalDistMax:float=10.0, horizontalDistMax:float=10.0,
+                 continuationThresh:float=127/256, vertStopThresh:float=5.0, CCW:bool=False, layerHeights:list[float]|None=None,
+                 measurementKey:Callable[[tuple],float]=singleMeasurement):
+        self.horizontalStepsize = horizontalStepsize # (mm) horizontal (x,y) movement step between measurements
+        self.verticalStepsize = verticalStepsize # (mm) vertical (z) movement step (upwards) between measurements
+        self.verticalDistMax = verticalDistMax # (mm) maximum vertical (z) distance to reach during test
+        self.horizontalDistMax = horizontalDistMax # (mm) maximum horizontal (x,y) offset in in both directions to move during test
+        self.continuationThresh = continuationThresh # it will keep spiraling until no meausrements in the past rotation are above this value
+        self.vertStopThresh = vertStopThresh # (mm) if absolutely 0 datapoints are above continuationThresh for serveral Z steps (this), stop the test early
+        self.CCW = CCW # just determines the spiral rotation direction. Only needs to be constant/consistant, other than that it shouldn't matter
+        self.layerHeights = layerHeights # (mm) optional list of specific (relative) layer heights to scan, instead of every verticalStepsize (see verticalBisectionSearch.layerHeightsAround())
+        self.measurementKey = measurementKey # gets the (single) measurement value from a row of measurement data (rows may hold more than 1 measurement, e.g. duplex data)
+        self.itts: list[float,int,int] = [0.0, 0, 0] # (hor_spiral_angle,vert,baud) iterator counters for the IR tests. NOTE: the baud index is managed by the user of this class
+
+    def spiralPos(self, angle:float) -> tuple[float,float]:
+        """ the (relative) x,y position for a given spiral angle (radians) """
+        radius = (angle/(2*np.pi)) * self.horizontalStepsize
+        return((-1 if self.CCW else 1) * np.sin(angle) * radius,   np.cos(angle) * radius) # spiral (inspired by my PCBcoilV2.circularSpiral.calcPos())
+
+    def layerHeight(self, layerIndex:int) -> float:
+        """ the (relative) z position of a given vertical step (layer) """
+        if(self.layerHeights is not None):
+            return(self.layerHeights[layerIndex])
+        return(layerIndex * self.verticalStepsize)
+
+    def layerCount(self) -> int:
+        """ the (maximum) number of vertical steps (layers) """
+        if(self.layerHeights is not None):
+            return(len(self.layerHeights))
+        return(int(self.verticalDistMax / self.verticalStepsize) + 1)
+
+    def updateDesiredRelPos(self, desiredRelPos:list[float,float,float], list4D:list[tuple[float,float,float,float]], advance:bool=True) -> bool:
+        """ update desiredRelPos (in place). \n
+            'list4D' holds the measurements for the current baud rate, formatted like [[x,y,z,data], etc.] \n
+            'advance' should only be false if you want to re-affirm/reset desiredPos (without advancing a step in the loop) \n
+            returns whether the whole range of motion has been completed """
+        if(advance):
+            lastRadius = np.hypot(*desiredRelPos[0:2])
+            keepSpiraling = True
+            for i in range(len(list4D)-1, -1, -1): # scroll through list backwards
+                xyzPos = list4D[i][0:3];  measurement = self.measurementKey(list4D[i])
+                if(abs(xyzPos[2] - desiredRelPos[2]) > 0.01): # if the Z position of the previous test is different
+                    break # keep spiraling for sure
+                if(measurement > self.continuationThresh): # if (any of) the previous meausrement(s) (within the same vertical step (layer)) contain(s) real data
+                    break # keep spiraling untill all measurements are below the threshold for sure
+                if((lastRadius - np.hypot(*xyzPos[0:2])) > self.horizontalStepsize): # if it has been more than 360 degrees (by checking whether the spiral radius has changed 1 full stepsize)
+                    ## if no real data has been recorded in 1 full rotation, stop spiraling and move on to the next vertical step (layer)
+                    keepSpiraling = False;  break
+            if(keepSpiraling):
+                self.itts[0] += (self.horizontalStepsize / lastRadius) if (lastRadius > self.horizontalStepsize) else np.deg2rad(60) # constant-arc-length (except for first rotation)
+                if(((self.itts[0]/(2*np.pi)) * self.horizontalStepsize) > self.horizontalDistMax): # if next radius would exceed manually set limit (unlikely)
+                    print("(debug): IRtestHorizontalDistMax reached")
+                    keepSpiraling = False
+            if(not keepSpiraling): # move to the next vertical step (layer)
+                self.itts[0] = 0.0 # reset angle to 0 (radians)
+                self.itts[1] += 1 # vertical step
+                if(self.itts[1] >= self.layerCount()): # if the next vertical position is above the maximum
+                    return(True) # the whole range of motion has been completed
+                for i in range(len(list4D)-1, -1, -1): # scroll through list backwards
+                    xyzPos = list4D[i][0:3];  measurement = self.measurementKey(list4D[i])
+                    if(measurement > self.continuationThresh): # if (any of) the previous meausrement(s) contain(s) real data
+                        break
+                    if((desiredRelPos[2] - xyzPos[2]) >= self.vertStopThresh): # the datapoint in question is this much lower that the current one
+                        # if no measurements have been recorded in the last several vertical steps (layers), consider the test concluded (there's hardly any point in doing more measurements)
+                        return(True) # it is unlikely that any good data will be recorded at this point
+        desiredRelPos[0], desiredRelPos[1] = self.spiralPos(self.itts[0])
+        desiredRelPos[2] = self.layerHeight(self.itts[1])
+        return(False) # returns whether the whole range of motion has been completed (if it reached this point, then it hasn't)
+
+    def reset(self, keepBaudIndex:bool=True):
+        """ start over from the first point (of the current baud rate) """
+        self.itts[0] = 0.0;  self.itts[1] = 0
+        if(not keepBaudIndex):
+            self.itts[2] = 0
+
+    def progress(self) -> float:
+        """ approximate completion (0.0~1.0) of the current baud rate """
+        layerProgress = (((self.itts[0]/(2*np.pi)) * self.horizontalStepsize) / self.horizontalDistMax) + self.itts[1]
+        if(self.layerHeights is not None):
+            return(layerProgress / max(len(self.layerHeights), 1))
+        return((self.verticalStepsize / self.verticalDistMax) * layerProgress)
+
+class verticalBisectionSearch():
+    """ finds the maximum working distance (the height at which the link fails) by bisection, instead of scanning every layer bottom-up. \n
+        At every probed height, only a small footprint (the center + a few points on a small circle around it) is measured.
+        The link 'works' at a height if any of the footprint measurements is above continuationThresh (same criterium as spiralScanPlanner).
+        NOTE: this assumes the link works at z=0 and keeps failing above the cutoff (which is true for any sane IR link) """
+    def __init__(self, verticalDistMax:float=10.0, resolution:float=0.5, continuationThresh:float=127/256, footprintRadius:float=0.5, footprintPoints:int=4,
+                 measurementKey:Callable[[tuple],float]=singleMeasurement):
+        self.verticalDistMax = verticalDistMax # (mm) maximum vertical (z) distance to search
+        self.resolution = resolution # (mm) stop bisecting once the cutoff is known to within this distance
+        self.continuationThresh = continuationThresh
+        self.footprintRadius = footprintRadius # (mm) radius of the circle of extra points around the center
+        self.footprintPoints = footprintPoints # number of points on that circle (0 means only the center is probed)
+        self.measurementKey = measurementKey # (see spiralScanPlanner)
+        self.low: float|None = None # (mm) highest height at which the link is known to work
+        self.high: float|None = None # (mm) lowest height at which the link is known to fail
+        self.probes: list[tuple[float,float,float,float]] = [] # all probe measurements, formatted like [[x,y,z,data], etc.]
+
+    def footprint(self) -> list[tuple[float,float]]:
+        """ the (relative) x,y positions to measure at every probed height """
+        return([(0.0, 0.0)] + [(np.sin(angle) * self.footprintRadius, np.cos(angle) * self.footprintRadius) for angle in np.linspace(0, 2*np.pi, self.footprintPoints, endpoint=False)])
+
+    def nextHeight(self) -> float|None:
+        """ the next (relative) height to probe, or None if the search is done """
+        if(self.low is None): # start by checking the bottom
+            return(0.0 if (self.high is None) else None) # (if even z=0 failed, there's nothing to search)
+        if(self.high is None): # then the top (if the link still works there, the cutoff is out of reach)
+            return(self.verticalDistMax if (self.low < self.verticalDistMax) else None)
+        if((self.high - self.low) <= (self.resolution + 1e-9)):
+            return(None)
+        middle = self.low + max(round(((self.high - self.low) / 2) / self.resolution), 1) * self.resolution # (stays on a multiple of the resolution (relative to z=0))
+        return(middle if (middle < (self.high - 1e-9)) else None)
+
+    def addResult(self, z:float, measurements:list[tuple[float,float,float,float]]) -> bool:
+        """ process the footprint measurements (formatted like [[x,y,z,data], etc.]) taken at height z. Returns whether the link worked """
+        self.probes += measurements
+        works = any([(self.measurementKey(row) > self.continuationThresh) for row in measurements])
+        if(works):  self.low = z if ((self.low is None) or (z > self.low)) else self.low
+        else:       self.high = z if ((self.high is None) or (z < self.high)) else self.high
+        return(works)
+
+    def cutoff(self) -> float|None:
+        """ (mm) the highest height at which the link (still) works, None if it didn't even work at z=0 """
+        return(self.low)
+
+    def run(self, measureFunc:Callable[[tuple[float,float,float]],float|tuple[float,...]]) -> float|None:
+        """ run the whole search (blocking), 'measureFunc' should move to a (relative) position and return the measurement(s) there. Returns cutoff() """
+        z = self.nextHeight()
+        while(z is not None):
+            results = []
+            for x, y in self.footprint():
+                measurements = measureFunc((x, y, z))
+                results.append((x, y, z, *(measurements if isinstance(measurements, tuple) else (measurements,))))
+            works = self.addResult(z, results)
+            print("z-search: z="+str(round(z,3))+"mm", ("works" if works else "fails"), " best:", round(max([self.measurementKey(row) for row in results]),3))
+            z = self.nextHeight()
+        return(self.cutoff())
+
+    def layerHeightsAround(self, offsets:list[float]) -> list[float]:
+        """ (relative) layer heights at the given offsets from the cutoff (clipped to 0~verticalDistMax, sorted, no duplicates), for spiralScanPlanner's layerHeights """
+        cutoff = (self.low if (self.low is not None) else 0.0)
+        return(sorted(set([round(min(max(cutoff + offset, 0.0), self.verticalDistMax), 6) for offset in offsets])))
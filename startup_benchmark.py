@@ -0,0 +1,54 @@
+"""
+startup-time benchmark for the different ways this project gets started.
+Every path is run in a fresh python process (several times), and the time it takes to import what that path needs is measured,
+ along with which of the 'heavy' libraries ended up being loaded (the viewer and headless paths should not load cv2, for example).
+
+usage:  python startup_benchmark.py [repeats]
+"""
+
+import subprocess
+import sys
+import json
+import os
+
+HEAVY_MODULES = ("numpy", "serial", "serial.tools.list_ports", "cv2", "matplotlib", "matplotlib.pyplot", "openpyxl")
+
+STARTUP_PATHS = { # name : code that imports what that path needs (without actually opening ports/windows)
+    "module import" : "import IR_alignment_gcode",
+    "viewer (.xlsx)" : "import IR_alignment_gcode; import openpyxl; import matplotlib; matplotlib.use('Agg'); import matplotlib.pyplot", # what readFromExcel() and plot5D() import
+    "headless" : "import IR_alignment_headless; import IR_alignment_gcode, motionCompletion, scanPlanner, serial", # what runHeadless() imports
+    "interactive" : "import IR_alignment_gcode, motionCompletion, scanPlanner, serial.tools.list_ports, numpy, cv2Renderer",
+}
+
+_MEASURE_SNIPPET = """
+import time, sys, json
+startTime = time.perf_counter()
+error = None
+try:
+    exec({code!r})
+except Exception as excep:
+    error = repr(excep)
+print(json.dumps({{"time" : time.perf_counter() - startTime, "error" : error, "loaded" : [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def measurePath(code:str, repeats:int=5) -> dict:
+    """ run 'code' in a fresh interpreter 'repeats' times, returns timing stats and which heavy modules got loaded """
+    times = [];  loaded = [];  error = None
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", _MEASURE_SNIPPET.format(code=code, heavy=HEAVY_MODULES)], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            parsed = json.loads(result.stdout.strip().splitlines()[-1])
+        except Exception as excep:
+            return({"error" : "subprocess failed: " + result.stderr.strip()[-200:]})
+        times.append(parsed["time"]);  loaded = parsed["loaded"];  error = parsed["error"]
+    times.sort()
+    return({"min" : times[0], "median" : times[len(times)//2], "loaded" : loaded, "error" : error})
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if (len(sys.argv) > 1) else 5
+    print("startup benchmark ("+str(repeats)+" fresh processes per path):")
+    for name in STARTUP_PATHS:
+        stats = measurePath(STARTUP_PATHS[name], repeats)
+        if("min" not in stats):
+            print(" ", name.ljust(16), stats["error"]);  continue
+        print(" ", name.ljust(16), "min:", str(round(stats["min"]*1000, 1)).rjust(7), "ms   median:", str(round(stats["median"]*1000, 1)).rjust(7), "ms   loaded:", stats["loaded"], ("  (import error: "+stats["error"]+")") if (stats["error"] is not None) else "")
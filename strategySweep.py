@@ -0,0 +1,198 @@
+"""
+offline scan-strategy parameter sweep: find the fastest scan settings that still map the alignment tolerance accurately enough, without using the rig.
+
+Recorded results files are turned into response models (the interpolated volume from alignmentAnalysis.py, sampled trilinearly),
+ then the real scan logic (scanPlanner.spiralScanPlanner, the same loop as the headless mode) is replayed against those models
+ for every combination of settings in a parameter grid (in a process pool).
+For every setting it reports:
+- estimated run time: moves (motionCompletion.trapezoidMoveTime()) + a fixed overhead per move + the IR test time per point
+- fidelity: the area (summed over all layers) where the model says the link works (above --threshold), but the replayed scan's (interpolated) data doesn't.
+   This is the 'missed boundary area', caused by stepsizes that are too coarse or early-stop thresholds that are too eager.
+   (the opposite error, area that wrongly looks like it works, is reported as 'extra')
+
+usage:  python strategySweep.py results_folder/ [--stepsizes 0.25 0.5 1.0] [--thresholds 0.3 0.5 0.7] [--vert-stop 2.5 5.0] [--max-missed 5]
+"""
+
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import scanPlanner # (my own code)
+import motionCompletion as MC # (my own code) for trapezoidMoveTime() (NOTE: importing it doesn't import serial)
+
+class responseModel():
+    """ a recorded (interpolated) volume as a function of position: model(x,y,z) -> measurement (0~1) \n
+        (positions without data count as 0, above the highest recorded layer as well, below the lowest layer it uses the lowest layer) """
+    def __init__(self, volume:dict[str,np.ndarray]):
+        self.volume = volume
+        self.grid = np.nan_to_num(volume['grid'], nan=0.0)
+        self.axis = volume['x'] # (x and y use the same, regularly spaced, axis)
+        self.resolution = float(self.axis[1] - self.axis[0]) if (len(self.axis) > 1) else 1.0
+        self.z = volume['z']
+
+    def __call__(self, x:float, y:float, z:float) -> float:
+        if((len(self.z) < 1) or (z > (self.z[-1] + 1e-6))):
+            return(0.0)
+        zIndex = float(np.interp(z, self.z, np.arange(len(self.z))))
+        fx = (x - self.axis[0]) / self.resolution;  fy = (y - self.axis[0]) / self.resolution
+        if((fx < 0) or (fy < 0) or (fx > (len(self.axis)-1)) or (fy > (len(self.axis)-1))):
+            return(0.0)
+        value = 0.0
+        z0 = int(zIndex);  x0 = min(int(fx), len(self.axis)-2) if (len(self.axis) > 1) else 0;  y0 = min(int(fy), len(self.axis)-2) if (len(self.axis) > 1) else 0
+        for zi, zWeight in ((z0, 1.0 - (zIndex - z0)), (min(z0+1, len(self.z)-1), zIndex - z0)):
+            for yi, yWeight in ((y0, 1.0 - (fy - y0)), (min(y0+1, len(self.axis)-1), fy - y0)):
+                for xi, xWeight in ((x0, 1.0 - (fx - x0)), (min(x0+1, len(self.axis)-1), fx - x0)):
+                    value += zWeight * yWeight * xWeight * self.grid[zi, yi, xi]
+        return(value)
+
+def replayScan(model:responseModel, params:dict, settings:dict) -> tuple[list[tuple[float,float,float,float]], dict]:
+    """ run the scan logic (like IR_alignment_headless.runHeadless()) against a model instead of the rig. \n
+        'params' holds the planner settings that are being swept: horizontalStepsize, verticalStepsize, continuationThresh, vertStopThresh \n
+        'settings' holds the fixed settings: verticalDistMax, horizontalDistMax, feedrate (mm/min), acceleration (mm/s^2), moveOverhead (s), pointTime (s) \n
+        returns (the simulated measurements formatted like [[x,y,z,data], etc.],  {'points', 'moves', 'moveTime', 'testTime', 'time'}) """
+    planner = scanPlanner.spiralScanPlanner(params['horizontalStepsize'], params['verticalStepsize'], settings['verticalDistMax'], settings['horizontalDistMax'],
+                                            params['continuationThresh'], params['vertStopThresh'])
+    list4D:list[tuple[float,float,float,float]] = []
+    desiredRelPos = [0.0, 0.0, 0.0];  moveTime = 0.0;  moves = 0
+    def moveTo(fromPos:list[float], toPos:list[float]) -> float:
+        return(MC.trapezoidMoveTime(sum([(toPos[i] - fromPos[i])**2 for i in range(3)]) ** 0.5, settings['feedrate'], settings['acceleration']) + settings['moveOverhead'])
+    planner.updateDesiredRelPos(desiredRelPos, list4D, advance=False)
+    done = False
+    while(not done):
+        list4D.append((*desiredRelPos, model(*desiredRelPos)))
+        previousPos = list(desiredRelPos)
+        done = planner.updateDesiredRelPos(desiredRelPos, list4D)
+        if(not done):
+            if(abs(desiredRelPos[2] - previousPos[2]) > 0.01): # (the same extra vertical move as the real loop)
+                moveTime += moveTo(previousPos, [*previousPos[0:2], desiredRelPos[2]]);  previousPos = [*previousPos[0:2], desiredRelPos[2]];  moves += 1
+            moveTime += moveTo(previousPos, desiredRelPos);  moves += 1
+    testTime = len(list4D) * settings['pointTime']
+    return(list4D, {'points' : len(list4D), 'moves' : moves, 'moveTime' : moveTime, 'testTime' : testTime, 'time' : moveTime + testTime})
+
+def missedBoundaryArea(truth:dict[str,np.ndarray], list4D:list[tuple[float,float,float,float]], threshold:float) -> dict:
+    """ compare the (interpolated) replayed measurements with the model volume ('truth'), on the model's grid and layers. \n
+        Every model layer is compared to the nearest replayed layer (layers the scan never got close to count as nothing working). \n
+        returns {'truthArea', 'missedArea', 'extraArea'} (mm^2, summed over all layers) """
+    import alignmentAnalysis # (my own code)
+    cellArea = float(truth['x'][1] - truth['x'][0]) ** 2 if (len(truth['x']) > 1) else 1.0
+    truthPassing = truth['grid'] >= threshold
+    replayLayers = alignmentAnalysis.splitLayers(list4D)
+    replayZ = np.array(list(replayLayers.keys()))
+    maxLayerGap = (float(np.diff(replayZ).max()) if (len(replayZ) > 1) else 0.0) / 2 + 1e-6
+    missedArea = extraArea = 0.0
+    for i, z in enumerate(truth['z']):
+        nearest = int(np.argmin(np.abs(replayZ - z))) if (len(replayZ) > 0) else -1
+        if((nearest < 0) or (abs(replayZ[nearest] - z) > maxLayerGap)):
+            replayPassing = np.zeros_like(truthPassing[i])
+        else:
+            replayPassing = alignmentAnalysis.interpolateLayer(replayLayers[float(replayZ[nearest])], truth['x'], truth['y']) >= threshold
+        missedArea += float((truthPassing[i] & ~replayPassing).sum()) * cellArea
+        extraArea += float((replayPassing & ~truthPassing[i]).sum()) * cellArea
+    return({'truthArea' : float(truthPassing.sum()) * cellArea, 'missedArea' : missedArea, 'extraArea' : extraArea})
+
+def defaultPointTime(baud:int) -> float:
+    """ (s) estimated IR test time per point: 256 bytes (10 bits each) at the baud rate, plus 1ms per byte """
+    return(256 * ((10 / baud) + 0.001))
+
+_workerVolumes:list[dict[str,np.ndarray]] = [] # (set once per worker process by _initWorker(), so the volumes aren't pickled for every task)
+_workerPointTimes:list[float|None] = [] # (per volume, overrides settings['pointTime'] where it's not None)
+
+def _initWorker(volumes:list[dict[str,np.ndarray]], pointTimes:list[float|None]):
+    global _workerVolumes, _workerPointTimes
+    _workerVolumes = volumes;  _workerPointTimes = pointTimes
+
+def _sweepWorker(params:dict, settings:dict, threshold:float) -> tuple[dict,dict]:
+    """ (runs in a worker process) replay one parameter set against every model, returns (params, results averaged over all models) """
+    totals:dict[str,float] = {}
+    for volume, pointTime in zip(_workerVolumes, _workerPointTimes):
+        list4D, stats = replayScan(responseModel(volume), params, (settings if (pointTime is None) else dict(settings, pointTime=pointTime)))
+        stats.update(missedBoundaryArea(volume, list4D, threshold))
+        for key in stats:
+            totals[key] = totals.get(key, 0.0) + stats[key]
+    results = {key : totals[key] / len(_workerVolumes) for key in totals}
+    results['missedFraction'] = (results['missedArea'] / results['truthArea']) if (results['truthArea'] > 0) else 0.0
+    return(params, results)
+
+def parameterGrid(**paramLists:list) -> list[dict]:
+    """ every combination of the given parameter values, e.g. parameterGrid(horizontalStepsize=[0.25,0.5], continuationThresh=[0.5]) """
+    grid = [{}]
+    for name in paramLists:
+        grid = [dict(combination, **{name : value}) for combination in grid for value in paramLists[name]]
+    return(grid)
+
+def sweepStrategies(volumes:list[dict[str,np.ndarray]], paramGrid:list[dict], settings:dict, threshold:float=0.5, workers:int|None=None,
+                    pointTimes:list[float|None]|None=None) -> list[tuple[dict,dict]]:
+    """ replay every parameter set (see replayScan()) against every volume (in a process pool). Returns [(params, results), etc.] sorted by estimated time \n
+        'pointTimes' (optional) is the IR test time per point for each volume (e.g. when they were recorded at different baud rates), instead of settings['pointTime'] """
+    results = []
+    pointTimes = pointTimes if (pointTimes is not None) else [None for _ in volumes]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(volumes, pointTimes)) as executor:
+        futures = [executor.submit(_sweepWorker, params, settings, threshold) for params in paramGrid]
+        for i, future in enumerate(as_completed(futures)):
+            results.append(future.result())
+            print("replayed", i+1, "/", len(paramGrid), end='\r')
+    print()
+    return(sorted(results, key=lambda result : result[1]['time']))
+
+def paretoFront(results:list[tuple[dict,dict]]) -> list[tuple[dict,dict]]:
+    """ the results for which no other result is both faster and misses less area (sorted by time) """
+    front = [];  bestMissed = np.inf
+    for params, stats in sorted(results, key=lambda result : (result[1]['time'], result[1]['missedArea'])):
+        if(stats['missedArea'] < bestMissed):
+            front.append((params, stats));  bestMissed = stats['missedArea']
+    return(front)
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    parser = argparse.ArgumentParser(description="replay the scan logic against recorded results, to compare scan settings (time vs missed area)")
+    parser.add_argument("paths", nargs='+', help="results files (.xlsx) and/or folders containing them")
+    parser.add_argument("--baud", type=int, default=None, help="baud rate to use from each file (default: the first one)")
+    parser.add_argument("--stepsizes", type=float, nargs='+', default=[0.25, 0.5, 0.75, 1.0], help="IRtestHorizontalStepsize values to try (mm)")
+    parser.add_argument("--vertical-stepsizes", type=float, nargs='+', default=[0.5], help="IRtestVerticalStepsize values to try (mm)")
+    parser.add_argument("--thresholds", type=float, nargs='+', default=[0.25, 0.5, 0.75], help="IRtestContinuationThresh values to try (0~1)")
+    parser.add_argument("--vert-stop", type=float, nargs='+', default=[1.0, 2.5, 5.0], help="IRtestVertStopThresh values to try (mm)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="success threshold (0~1) that defines the boundary for the fidelity metric")
+    parser.add_argument("--max-missed", type=float, default=None, help="(%%) also print the fastest setting that misses less than this fraction of the area")
+    parser.add_argument("--vertical-max", type=float, default=10.0, help="IRtestVerticalDistMax (mm)")
+    parser.add_argument("--horizontal-max", type=float, default=10.0, help="IRtestHorizontalDistMax (mm)")
+    parser.add_argument("--feedrate", type=float, default=1200, help="printerSafeFeedrate (mm/min)")
+    parser.add_argument("--acceleration", type=float, default=500.0, help="printerAcceleration (mm/s^2)")
+    parser.add_argument("--move-overhead", type=float, default=0.02, help="(s) extra time per move (serial communication, settling)")
+    parser.add_argument("--point-time", type=float, default=None, help="(s) IR test time per point (default: 256 bytes at each file's baud rate, plus 1ms per byte)")
+    parser.add_argument("--resolution", type=float, default=0.1, help="interpolation grid spacing (mm)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    filenames:list[str] = []
+    for path in args.paths:
+        filenames += sorted(glob.glob(os.path.join(path, "*.xlsx"))) if os.path.isdir(path) else [path]
+    import compareViewer # (my own code) for loadRuns() (parallel, cached loading)
+    runs = compareViewer.loadRuns(filenames, args.baud, args.resolution, workers=args.workers)
+    if(len(runs) < 1):
+        print("no usable results files");  exit()
+    bauds = [baud for _, baud, _ in runs] # (the baud rate that was actually loaded from each file)
+    pointTimes = [(args.point_time if (args.point_time is not None) else defaultPointTime(baud)) for baud in bauds]
+    settings = {'verticalDistMax' : args.vertical_max, 'horizontalDistMax' : args.horizontal_max, 'feedrate' : args.feedrate, 'acceleration' : args.acceleration,
+                'moveOverhead' : args.move_overhead, 'pointTime' : pointTimes[0]}
+    grid = parameterGrid(horizontalStepsize=args.stepsizes, verticalStepsize=args.vertical_stepsizes, continuationThresh=args.thresholds, vertStopThresh=args.vert_stop)
+    startTime = time.time()
+    results = sweepStrategies([volume for _, _, volume in runs], grid, settings, args.threshold, args.workers, pointTimes)
+    print("replayed", len(grid), "settings against", len(runs), "run(s) in", round(time.time()-startTime,1), "s  (results are averaged over all runs)")
+    print("baud rate (point time):", ",  ".join([str(baud) + " (" + str(round(pointTime,3)) + "s) x" + str(bauds.count(baud)) for baud, pointTime in sorted(set(zip(bauds, pointTimes)))]))
+    front = paretoFront(results)
+    print("  hor.step  vert.step  cont.thresh  vert.stop |  points   time (min) | missed (mm^2)  missed (%)  extra (mm^2)")
+    for params, stats in results:
+        print(("* " if any([(params is frontParams) for frontParams, _ in front]) else "  ") + str(params['horizontalStepsize']).rjust(8), str(params['verticalStepsize']).rjust(10),
+              str(round(params['continuationThresh'],3)).rjust(12), str(params['vertStopThresh']).rjust(10), "|", str(round(stats['points'])).rjust(7), str(round(stats['time']/60,1)).rjust(12),
+              "|", str(round(stats['missedArea'],1)).rjust(13), str(round(stats['missedFraction']*100,1)).rjust(11), str(round(stats['extraArea'],1)).rjust(13))
+    print("(* = pareto-optimal: nothing else is both faster and misses less)")
+    if(args.max_missed is not None):
+        acceptable = [(params, stats) for params, stats in results if ((stats['missedFraction']*100) <= args.max_missed)]
+        if(len(acceptable) > 0):
+            params, stats = acceptable[0]
+            print("fastest setting missing <=", str(args.max_missed)+"%:", params, " ~"+str(round(stats['time']/60,1)), "min, missed", str(round(stats['missedFraction']*100,1))+"%")
+        else:
+            print("no setting misses <=", str(args.max_missed)+"%")
@@ -0,0 +1,203 @@
+"""
+local live telemetry: a small HTTP server (in its own thread) that lets dashboards/scripts watch a run, without the cv2 window and without adding load to the test loop.
+
+The test loop calls publish() as often as it likes. It's rate-limited (publishInterval), and it only copies the status and the new measurement rows,
+ all the encoding (JSON, heatmap) happens in the server's threads when someone actually asks for it.
+Every publish() that changes something gets a new version number, so clients can ask for only what changed since the version they already have.
+
+endpoints:
+- /                     a minimal status page (status + heatmap, updated live)
+- /status               the full status as JSON: {'version', 'status' : {...}, 'measurements' : [[x,y,z,data], etc.] (the most recent ones)}
+- /status?since=N       only what changed since version N: {'version', 'status' : {changed keys only}, 'measurements' : [new rows only], 'full' : whether N was too old for a delta}
+- /events               Server-Sent Events stream of the same deltas (one event per new version)
+- /heatmap.png          the current layer (interpolated) as a PNG image (red->yellow->green, gray = no data)
+
+status keys (whatever the caller publishes, typically): positions, itts, baud, latest measurement, testing (bool), progress (0~1)
+ the server adds: 'throughput' (measurements per minute, recently) and 'eta' (seconds, from the progress)
+"""
+
+import time
+import json
+import zlib
+import struct
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+STATUS_PAGE = """<!DOCTYPE html><html><head><title>IR alignment telemetry</title></head><body style="font-family:monospace">
+<pre id="status">connecting...</pre><img id="heatmap" src="/heatmap.png" style="image-rendering:pixelated;width:400px">
+<script>
+var state = {}; var events = new EventSource("/events");
+events.onmessage = function(event) { var delta = JSON.parse(event.data); if(delta.full) { state = {}; }
+  for(var key in delta.status) { state[key] = delta.status[key]; }
+  document.getElementById("status").textContent = "version: " + delta.version + "\\n" + JSON.stringify(state, null, 1);
+  if(delta.measurements.length > 0) { document.getElementById("heatmap").src = "/heatmap.png?v=" + delta.version; } };
+</script></body></html>"""
+
+def encodePNG(rgb) -> bytes:
+    """ encode an RGB image (numpy uint8 array with shape (height, width, 3)) as PNG (just zlib, no other libraries needed) """
+    height, width = rgb.shape[0:2]
+    def chunk(chunkType:bytes, data:bytes) -> bytes:
+        return(struct.pack(">I", len(data)) + chunkType + data + struct.pack(">I", zlib.crc32(chunkType + data) & 0xFFFFFFFF))
+    rawData = b''.join([(b'\x00' + rgb[y].tobytes()) for y in range(height)]) # (filter type 0 (none) for every scanline)
+    return(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) + chunk(b'IDAT', zlib.compress(rawData, 6)) + chunk(b'IEND', b''))
+
+class telemetryServer():
+    """ HTTP telemetry server (runs in daemon threads, so it never keeps the program alive) """
+    def __init__(self, port:int=8765, host:str="127.0.0.1", publishInterval:float=0.5, historyLength:int=2048, heatmapResolution:float=0.1):
+        self.port = port
+        self.host = host # "127.0.0.1" only allows local connections, use "0.0.0.0" to allow other PCs on the network
+        self.publishInterval = publishInterval # (s) minimum time between publish() calls that actually do something
+        self.heatmapResolution = heatmapResolution # (mm) heatmap pixel size
+        self.version = 0
+        self._status:dict = {}
+        self._keyVersions:dict[str,int] = {} # {status key : version in which it last changed}
+        self._measurements:deque[tuple[int,list[float]]] = deque(maxlen=historyLength) # (version, row) of the most recent measurements
+        self._layerRows:list[list[float]] = [] # all rows of the current layer (for the heatmap)
+        self._sentCount = 0;  self._sentBaud = None # how many rows of the current (baud rate's) data have been published
+        self._rateHistory:deque[tuple[float,int]] = deque(maxlen=64) # (time, total measurement count) for the throughput
+        self._totalCount = 0
+        self._progressStart:tuple[float,float]|None = None # (time, progress) at the first publish() with a progress, for the ETA
+        self._heatmapCache:tuple[int,bytes]|None = None # (version, PNG)
+        self._publishTimer = 0.0
+        self._lock = threading.Lock()
+        self._newVersion = threading.Condition(self._lock)
+        self._httpServer: ThreadingHTTPServer|None = None
+        self._thread: threading.Thread|None = None
+
+    def start(self) -> bool:
+        """ start serving (in a daemon thread), returns whether it worked """
+        server = self
+        class requestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass # (don't spam the terminal)
+            def do_GET(self):
+                server._handleRequest(self)
+        try:
+            self._httpServer = ThreadingHTTPServer((self.host, self.port), requestHandler)
+            self._httpServer.daemon_threads = True
+        except Exception as excep:
+            print("telemetryServer couldn't start on port", self.port, ":", excep)
+            return(False)
+        self._thread = threading.Thread(target=self._httpServer.serve_forever, daemon=True)
+        self._thread.start()
+        print("telemetry available at: http://" + self.host + ":" + str(self.port) + "/")
+        return(True)
+
+    def stop(self):
+        if(self._httpServer is not None):
+            self._httpServer.shutdown();  self._httpServer.server_close();  self._httpServer = None
+        with self._newVersion:
+            self._newVersion.notify_all() # (let the event streams finish)
+
+    def publish(self, status:dict, list4D=None, force:bool=False) -> bool:
+        """ publish the current status (and new rows of list4D, the current baud rate's measurements). Rate-limited, returns whether it published """
+        now = time.time()
+        if((not force) and ((now - self._publishTimer) < self.publishInterval)):
+            return(False)
+        self._publishTimer = now
+        with self._newVersion:
+            newVersion = self.version + 1;  changed = False
+            for key in status:
+                value = list(status[key]) if isinstance(status[key], (list, tuple)) else status[key] # (copy, the caller may change it in place)
+                if((key not in self._status) or (self._status[key] != value)):
+                    self._status[key] = value;  self._keyVersions[key] = newVersion;  changed = True
+            if(list4D is not None):
+                if((status.get('baud') != self._sentBaud) or (len(list4D) < self._sentCount)): # (different data)
+                    self._sentCount = 0;  self._sentBaud = status.get('baud');  self._layerRows = []
+                for row in list4D[self._sentCount:]:
+                    row = [float(value) for value in row]
+                    if((len(self._layerRows) > 0) and (abs(self._layerRows[-1][2] - row[2]) > 0.001)):
+                        self._layerRows = [] # new layer
+                    self._layerRows.append(row);  self._measurements.append((newVersion, row))
+                    self._totalCount += 1;  changed = True
+                self._sentCount = len(list4D)
+            ## derived values:
+            self._rateHistory.append((now, self._totalCount))
+            derived = {'throughput' : None, 'eta' : None}
+            if((len(self._rateHistory) > 1) and (self._rateHistory[-1][0] > self._rateHistory[0][0])):
+                derived['throughput'] = round((self._rateHistory[-1][1] - self._rateHistory[0][1]) / (self._rateHistory[-1][0] - self._rateHistory[0][0]) * 60, 1)
+            progress = status.get('progress')
+            if(progress is not None):
+                if((self._progressStart is None) or (progress < self._progressStart[1])):
+                    self._progressStart = (now, progress)
+                elif(progress > self._progressStart[1]):
+                    derived['eta'] = max(0, round((now - self._progressStart[0]) * (1.0 - progress) / (progress - self._progressStart[1])))
+            for key in derived:
+                if(self._status.get(key) != derived[key]):
+                    self._status[key] = derived[key];  self._keyVersions[key] = newVersion;  changed = True
+            if(changed):
+                self.version = newVersion
+                self._newVersion.notify_all()
+        return(True)
+
+    def delta(self, since:int|None=None) -> dict:
+        """ everything that changed since version 'since' (everything if None, or if 'since' is too old for the retained measurements) """
+        with self._lock:
+            full = (since is None) or (since > self.version) or ((len(self._measurements) > 0) and (self._measurements[0][0] > (since + 1)) and (self._measurements.maxlen == len(self._measurements)))
+            if(full):
+                since = -1
+            return({'version' : self.version, 'full' : full,
+                    'status' : {key : self._status[key] for key in self._status if (self._keyVersions[key] > since)},
+                    'measurements' : [row for version, row in self._measurements if (version > since)]})
+
+    def heatmapPNG(self) -> bytes:
+        """ the current layer (interpolated) as a PNG (cached per version) """
+        with self._lock:
+            if((self._heatmapCache is not None) and (self._heatmapCache[0] == self.version)):
+                return(self._heatmapCache[1])
+            version = self.version;  layerRows = list(self._layerRows)
+        import numpy as np
+        import alignmentAnalysis, compareViewer # (my own code) for interpolateLayer() and measurementColors()
+        if(len(layerRows) > 0):
+            samples = np.array([row[0:4] for row in layerRows])[:,[0,1,3]]
+            extent = max(float(np.abs(samples[:,0:2]).max()), 0.5) + self.heatmapResolution
+            axis = np.arange(-round(extent/self.heatmapResolution), round(extent/self.heatmapResolution)+1) * self.heatmapResolution
+            image = compareViewer.measurementColors(alignmentAnalysis.interpolateLayer(samples, axis, axis))[::-1,:,::-1] # (y axis pointing up, BGR -> RGB)
+        else:
+            image = np.full((1, 1, 3), 80, dtype=np.uint8)
+        scale = max(1, 256 // image.shape[0]) # (make small images a bit bigger)
+        png = encodePNG(np.ascontiguousarray(image.repeat(scale, axis=0).repeat(scale, axis=1)))
+        with self._lock:
+            self._heatmapCache = (version, png)
+        return(png)
+
+    def _handleRequest(self, handler:BaseHTTPRequestHandler):
+        """ (runs in a server thread) """
+        url = urlparse(handler.path);  query = parse_qs(url.query)
+        try:
+            if(url.path == "/status"):
+                since = int(query['since'][0]) if ('since' in query) else None
+                self._respond(handler, "application/json", json.dumps(self.delta(since), default=float).encode())
+            elif(url.path == "/heatmap.png"):
+                self._respond(handler, "image/png", self.heatmapPNG())
+            elif(url.path == "/events"):
+                self._eventStream(handler, (int(query['since'][0]) if ('since' in query) else None))
+            elif(url.path in ("/", "/index.html")):
+                self._respond(handler, "text/html", STATUS_PAGE.encode())
+            else:
+                handler.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # (client went away)
+
+    def _respond(self, handler:BaseHTTPRequestHandler, contentType:str, body:bytes):
+        handler.send_response(200)
+        handler.send_header("Content-Type", contentType);  handler.send_header("Content-Length", str(len(body)));  handler.send_header("Cache-Control", "no-store")
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _eventStream(self, handler:BaseHTTPRequestHandler, since:int|None):
+        """ Server-Sent Events: send a delta whenever there's a new version (and a keep-alive comment every 15 seconds) """
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream");  handler.send_header("Cache-Control", "no-store")
+        handler.end_headers()
+        while(self._httpServer is not None):
+            delta = self.delta(since)
+            if(delta['full'] or (delta['version'] != since)):
+                handler.wfile.write(b'data: ' + json.dumps(delta, default=float).encode() + b'\n\n');  handler.wfile.flush()
+                since = delta['version']
+            with self._newVersion: # (only wait inside the lock, the socket writes happen outside of it, so a stalled client can't block publish())
+                timedOut = (self.version == since) and (not self._newVersion.wait(15.0))
+            if(timedOut):
+                handler.wfile.write(b': keep-alive\n\n');  handler.wfile.flush()
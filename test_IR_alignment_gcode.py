@@ -0,0 +1,37 @@
+""" tests for the (hardware-free) parts of IR_alignment_gcode.py, run with: python -m pytest """
+
+import IR_alignment_gcode as IRA # (my own code)
+
+def test_PRBSbytes_repeatable():
+    assert(IRA.PRBSbytes(4096) == IRA.PRBSbytes(4096))
+    assert(IRA.PRBSbytes(100) == IRA.PRBSbytes(4096)[0:100])
+
+def test_linkStatistics_perfect():
+    payload = IRA.PRBSbytes(4096)
+    assert(IRA.linkStatistics(payload, payload, 1.0) == (1.0, 4096.0, 0.0, 0, 0, 0, 0))
+
+def test_linkStatistics_droppedByte():
+    payload = IRA.PRBSbytes(4096)
+    goodFraction, throughput, bitErrorRate, bursts, longestBurst, lost, inserted = IRA.linkStatistics(payload, payload[:100] + payload[101:], 1.0)
+    assert(goodFraction == (4095 / 4096))
+    assert((bitErrorRate, bursts, longestBurst, lost, inserted) == (0.0, 0, 0, 1, 0))
+
+def test_linkStatistics_insertedBytes():
+    payload = IRA.PRBSbytes(4096)
+    assert(IRA.linkStatistics(payload, payload[:100] + b'\x00\x55' + payload[100:], 1.0)[2:] == (0.0, 0, 0, 0, 2))
+
+def test_linkStatistics_bitErrors():
+    payload = IRA.PRBSbytes(4096)
+    received = bytearray(payload);  received[10] ^= 0x01;  received[100] ^= 0xFF;  received[101] ^= 0x01;  received[102] ^= 0x80
+    goodFraction, throughput, bitErrorRate, bursts, longestBurst, lost, inserted = IRA.linkStatistics(payload, bytes(received), 1.0)
+    assert(goodFraction == (4092 / 4096))
+    assert(bitErrorRate == (11 / (4096*8)))
+    assert((bursts, longestBurst, lost, inserted) == (2, 3, 0, 0))
+
+def test_linkStatistics_badByteThenSlip():
+    payload = IRA.PRBSbytes(4096)
+    received = bytearray(payload);  received[500] ^= 0x04;  del received[501:801] # (a bad byte, followed by 300 lost bytes)
+    assert(IRA.linkStatistics(payload, bytes(received), 1.0)[3:] == (1, 1, 300, 0))
+
+def test_linkStatistics_nothingReceived():
+    assert(IRA.linkStatistics(IRA.PRBSbytes(1024), b'', 1.0) == (0.0, 0.0, 0.0, 0, 0, 1024, 0))